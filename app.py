@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, session, make_response, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import FlaskForm
 from flask_wtf.csrf import CSRFProtect
@@ -6,21 +6,39 @@ from flask_mail import Mail, Message
 from wtforms import StringField, TextAreaField, EmailField, SubmitField, FileField, IntegerField, SelectField
 from wtforms.validators import DataRequired, Email
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
-import exifread
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
 from PIL import Image
 from pathlib import Path
 import re
 import unicodedata
-from sqlalchemy import desc, Column, text
+from sqlalchemy import desc, Column, text, inspect, func
+from sqlalchemy.orm import validates
+from sqlalchemy.exc import IntegrityError
 from typing import Any
 import subprocess
 from wtforms.validators import ValidationError
 from flask_sock import Sock
 import json
+import mimetypes
 import shutil
-import random
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
+import time
+import fcntl
+import errno
+import base64
+import uuid
+import hashlib
+import click
+from flask.cli import AppGroup
+from functools import wraps
+from urllib.parse import quote
+from werkzeug.http import is_resource_modified
 import requests
 from bs4 import BeautifulSoup
 import re
@@ -36,7 +54,17 @@ from utils import (
     log_function_call, 
     log_exception, 
     log_file_operation,
-    file_validator
+    file_validator,
+    GalleryIndex,
+    AssetVersion,
+    PageCache,
+    ResizeCache,
+    http_datetime,
+    FileRange,
+    image_processor,
+    video_processor,
+    media_metadata,
+    ConversionPool
 )
 
 # Initialize Flask app
@@ -84,16 +112,20 @@ def check_system_dependencies():
     
     for command, package in dependencies.items():
         try:
-            result = subprocess.run(['which', command], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                app_logger.info(f"Dependency check passed: {command} found at {result.stdout.strip()}")
+            path = shutil.which(command)
+            if path:
+                app_logger.info(f"Dependency check passed: {command} found at {path}")
             else:
                 missing_deps.append(f"{command} ({package})")
                 app_logger.warning(f"Dependency check failed: {command} not found")
         except Exception as e:
             log_exception(app_logger, e, f'checking dependency {command}')
             missing_deps.append(f"{command} ({package})")
-    
+
+    # Optional: without ffmpeg videos are stored as uploaded
+    if not video_processor.VIDEO_SUPPORTED:
+        app_logger.warning("ffmpeg/ffprobe not found: videos are stored without faststart, posters or mobile variants")
+
     if missing_deps:
         warning_msg = f"Missing system dependencies: {', '.join(missing_deps)}"
         app_logger.warning(warning_msg)
@@ -115,12 +147,13 @@ def upload_progress(ws):
     except:
         upload_sockets.remove(ws)
 
-def send_progress_update(filename, status='processing'):
+def send_progress_update(filename, status='processing', job_id=None):
     """Send progress update to all connected WebSocket clients for single file"""
     message = json.dumps({
         'type': 'progress',
         'filename': filename,
-        'status': status,  # 'processing', 'completed', 'failed'
+        'job_id': job_id,
+        'status': status,  # 'queued', 'processing', 'retrying', 'completed', 'failed'
         'timestamp': datetime.now().isoformat()
     })
     dead_sockets = []
@@ -190,6 +223,66 @@ def send_contact_email(contact_message):
         log_exception(app_logger, e, 'sending contact email')
         return False
 
+# Display names for album folders created before albums were stored in the database
+ALBUM_DISPLAY_NAMES = {
+    'Tresinky': 'Třešinky',
+    'Mapy': 'Mapy a plány',
+    '2023 unor': '2023 - Únor',
+    '2021 unor': '2021 - Únor',
+    '2021 duben prace v lese': '2021 - Duben - Práce v lese',
+    '2020 zari vymerovani': '2020 - Září - Vyměřování',
+    '2020 rijen vysadba': '2020 - Říjen - Výsadba',
+    '2020 kveten': '2020 - Květen',
+    '2020 cerven': '2020 - Červen',
+    '2019 kveten': '2019 - Květen',
+    '2019 unor': '2019 - Únor',
+    '2019 brezen duben': '2019 - Březen, duben',
+    '2018 zari, rijen, listopad': '2018 - Září, říjen, listopad',
+    '2017 Obrazky': '2017 - Obrázky',
+    '2015 puvodni stav pred zahajenim obnovy sadu': '2015 - Původní stav před zahájením obnovy sadu',
+    '2020': '2020 - Celkový přehled',
+    '2025': '2025 - Nové fotky',
+    '1950.LEITA': '1950 - Letecký snímek',
+}
+
+# Albums always shown first in the gallery
+PINNED_ALBUMS = {'Pamětní kniha Cetechovice 1927'}
+
+# Month names (Czech with and without diacritics, English) used to order albums
+MONTH_NUMBERS = {
+    'leden': 1, 'únor': 2, 'březen': 3, 'duben': 4, 'květen': 5, 'červen': 6,
+    'červenec': 7, 'srpen': 8, 'září': 9, 'říjen': 10, 'listopad': 11, 'prosinec': 12,
+    'unor': 2, 'brezen': 3, 'kveten': 5, 'cerven': 6,
+    'cervenec': 7, 'zari': 9, 'rijen': 10,
+    'januar': 1, 'februar': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12
+}
+# Longest names first, so 'červenec' is not matched as 'červen'
+MONTH_PATTERN = re.compile('|'.join(sorted(map(re.escape, MONTH_NUMBERS), key=len, reverse=True)))
+
+def compute_album_sort_keys(display_name: str) -> tuple[int, int, int]:
+    """
+    Compute album ordering: pinned albums first, then by year and month (oldest first).
+    
+    Args:
+        display_name: Album display name
+        
+    Returns:
+        tuple: (sort_rank, year, month)
+    """
+    if display_name in PINNED_ALBUMS:
+        return (0, 0, 0)  # Always first
+    
+    # Extract year from album name for sorting
+    year_match = re.search(r'(\d{4})', display_name)
+    if year_match:
+        month_match = MONTH_PATTERN.search(display_name.lower())
+        month = MONTH_NUMBERS[month_match.group(0)] if month_match else 0
+        return (1, int(year_match.group(1)), month)  # 1 for regular albums, then year, then month
+    
+    # For albums without clear year, put them at the end
+    return (2, 9999, 0)
+
 # Database Models
 class ContactMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -205,9 +298,20 @@ class ContactMessage(db.Model):
 
 class Album(db.Model):
     """Album model for storing normalized and display names."""
+    __table_args__ = (
+        db.Index('ix_album_sort', 'sort_rank', 'year', 'month'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     normalized_name = db.Column(db.String(100), unique=True, nullable=False)  # For file system
     display_name = db.Column(db.String(100), nullable=False)  # For user display
+    # Precomputed ordering, recalculated whenever display_name changes
+    sort_rank = db.Column(db.Integer, nullable=True)
+    year = db.Column(db.Integer, nullable=True, index=True)
+    month = db.Column(db.Integer, nullable=True)
+    # Cover chosen at upload/sync time (path relative to static/); pinned covers are set by an admin
+    cover_image = db.Column(db.String(255), nullable=True)
+    cover_pinned = db.Column(db.Boolean, nullable=False, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -218,6 +322,12 @@ class Album(db.Model):
         self.normalized_name = normalized_name
         self.display_name = display_name
     
+    @validates('display_name')
+    def _update_sort_keys(self, key, display_name):
+        """Recompute sort columns when the album is created or renamed."""
+        self.sort_rank, self.year, self.month = compute_album_sort_keys(display_name)
+        return display_name
+    
     def __repr__(self):
         return f'<Album {self.display_name} ({self.normalized_name})>'
 
@@ -230,6 +340,34 @@ class GalleryImage(db.Model):
     original_date = db.Column(db.DateTime)
     album_id = db.Column(db.Integer, db.ForeignKey('album.id'), nullable=True)
     display_order = db.Column(db.Integer, default=0)
+    # Comma-separated widths of the srcset derivatives (see derivative_path())
+    derivative_widths = db.Column(db.String(50), nullable=True)
+    # SHA-256 of the uploaded original; NULL for archive images and album links of a duplicate
+    content_hash = db.Column(db.String(64), nullable=True)
+    # Comma-separated heights of the mobile variants of a video (see variant_path())
+    video_variants = db.Column(db.String(20), nullable=True)
+    # Blurred placeholder shown until the image loads: data URI of a ~16px WebP
+    placeholder = db.Column(db.Text, nullable=True)
+    # Frame size (after EXIF rotation) and byte size of the stored file, recorded at
+    # processing time so the gallery index and templates never reopen the file
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    file_size = db.Column(db.BigInteger, nullable=True)
+    # Uploaded original in the originals store (see store_original()); NULL for archive images and videos
+    original = db.Column(db.String(255), nullable=True)
+    # image_processor.output_spec_hash() the stored outputs were written with (see rebuild_gallery_outputs())
+    output_spec = db.Column(db.String(16), nullable=True)
+    # Camera, date, GPS etc. read in the processing decode (see ImageMetadata)
+    image_metadata = db.relationship('ImageMetadata', backref='image', uselist=False,
+                                     cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_gallery_image_content_hash', 'content_hash', unique=True),
+        # One row per stored file: reconciliation and jobs look rows up by path
+        db.Index('ix_gallery_image_filename', 'filename', unique=True),
+        db.Index('ix_gallery_image_album_id', 'album_id'),
+        db.Index('ix_gallery_image_date', 'date'),
+    )
 
     def __init__(self, filename: str, title: str | None = None, description: str | None = None,
                  date: datetime | None = None, original_date: datetime | None = None,
@@ -245,8 +383,58 @@ class GalleryImage(db.Model):
     def __repr__(self):
         return f'<GalleryImage {self.filename}>'
 
+    @property
+    def aspect_ratio(self) -> float | None:
+        """Width divided by height, or None when the frame size is unknown."""
+        if not self.width or not self.height:
+            return None
+        return self.width / self.height
+
+class ImageMetadata(db.Model):
+    """Metadata of a gallery file, read once in the processing decode (or by the backfill)."""
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('gallery_image.id'), nullable=False, unique=True)
+    taken_at = db.Column(db.DateTime)
+    camera_make = db.Column(db.String(100))
+    camera_model = db.Column(db.String(100))
+    lens_model = db.Column(db.String(100))
+    orientation = db.Column(db.Integer)  # EXIF orientation of the original (1-8)
+    # Size of the original after rotation (the stored file is GalleryImage.width/height)
+    original_width = db.Column(db.Integer)
+    original_height = db.Column(db.Integer)
+    exposure_time = db.Column(db.Float)  # Seconds
+    f_number = db.Column(db.Float)
+    iso = db.Column(db.Integer)
+    focal_length = db.Column(db.Float)  # Millimetres
+    gps_latitude = db.Column(db.Float)
+    gps_longitude = db.Column(db.Float)
+    gps_altitude = db.Column(db.Float)  # Metres above sea level
+    duration = db.Column(db.Float)  # Videos, seconds
+    extracted_at = db.Column(db.DateTime, default=datetime.now)
+
+    FIELDS = ('taken_at', 'camera_make', 'camera_model', 'lens_model', 'orientation',
+              'original_width', 'original_height', 'exposure_time', 'f_number', 'iso',
+              'focal_length', 'gps_latitude', 'gps_longitude', 'gps_altitude', 'duration')
+
+    def __init__(self, metadata: dict, image_id: int | None = None):
+        self.image_id = image_id
+        for field in self.FIELDS:
+            setattr(self, field, metadata.get(field))
+        self.extracted_at = datetime.now()
+
+    def copy(self) -> 'ImageMetadata':
+        """Unsaved copy for another image (album links of a duplicate)."""
+        return ImageMetadata({field: getattr(self, field) for field in self.FIELDS})
+
+    def __repr__(self):
+        return f'<ImageMetadata {self.image_id}>'
+
 class Donor(db.Model):
     """Donor model for storing donor information from bank statements."""
+    __table_args__ = (
+        db.Index('ix_donor_donation_date', 'donation_date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Float, nullable=False)  # Amount in CZK
@@ -263,6 +451,237 @@ class Donor(db.Model):
     def __repr__(self):
         return f'<Donor {self.name} - {self.amount} CZK - {self.donation_date}>'
 
+class ProcessingJob(db.Model):
+    """Background processing job (e.g. upload conversion) persisted across restarts."""
+    __table_args__ = (
+        db.Index('ix_processing_job_queue', 'status', 'run_after'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def __init__(self, kind: str, payload: dict, max_attempts: int = 3):
+        self.kind = kind
+        self.payload = json.dumps(payload)
+        self.status = 'queued'
+        self.attempts = 0
+        self.max_attempts = max_attempts
+        self.run_after = datetime.now()
+    
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'error': self.error,
+            'result': json.loads(self.result) if self.result else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ProcessingJob {self.id} {self.kind} {self.status}>'
+
+class UploadSession(db.Model):
+    """Resumable chunked upload in progress; received bytes live in the staging directory."""
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    filename = db.Column(db.String(255), nullable=False)  # Secure file name
+    size = db.Column(db.BigInteger, nullable=False)  # Announced total size in bytes
+    album_name = db.Column(db.String(255), nullable=False)
+    album_display_name = db.Column(db.String(255), nullable=False)
+    title = db.Column(db.String(100))
+    description = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+    
+    def __init__(self, filename: str, size: int, album_name: str, album_display_name: str,
+                 title: str | None = None, description: str | None = None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.size = size
+        self.album_name = album_name
+        self.album_display_name = album_display_name
+        self.title = title
+        self.description = description
+        self.created_at = self.updated_at = datetime.now()
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.filename}>'
+
+class SchemaMigration(db.Model):
+    """Versioned schema migration recorded once it has been applied (see SCHEMA_MIGRATIONS)."""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}>'
+
+# Columns added to existing tables after their initial release.
+# db.create_all() only creates missing tables, so these are added with ALTER TABLE.
+SCHEMA_UPGRADES = {
+    'album': [
+        ('sort_rank', 'INTEGER'),
+        ('year', 'INTEGER'),
+        ('month', 'INTEGER'),
+        ('cover_image', 'VARCHAR(255)'),
+        ('cover_pinned', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ],
+    'gallery_image': [
+        ('derivative_widths', 'VARCHAR(50)'),
+        ('content_hash', 'VARCHAR(64)'),
+        ('video_variants', 'VARCHAR(20)'),
+        ('placeholder', 'TEXT'),
+        ('width', 'INTEGER'),
+        ('height', 'INTEGER'),
+        ('file_size', 'BIGINT'),
+        ('original', 'VARCHAR(255)'),
+        ('output_spec', 'VARCHAR(16)'),
+    ],
+}
+
+def deduplicate_gallery_filenames(connection) -> int:
+    """
+    Delete all but the oldest row of each gallery filename, so the filename
+    index can be unique (nothing prevented two rows for one file before it).
+
+    Returns:
+        int: Number of deleted rows
+    """
+    duplicates = 'SELECT id FROM gallery_image WHERE id NOT IN (SELECT MIN(id) FROM gallery_image GROUP BY filename)'
+    connection.execute(text(f'DELETE FROM image_metadata WHERE image_id IN ({duplicates})'))
+    removed = connection.execute(text(f'DELETE FROM gallery_image WHERE id IN ({duplicates})')).rowcount
+    if removed:
+        database_logger.warning(f"Removed {removed} duplicate gallery rows before indexing filenames")
+    return removed
+
+# Versioned changes that cannot be derived by comparing the models with the database
+# (data fixes, new constraints on existing tables). Each step is SQL or a function of
+# the connection and must be idempotent: on SQLite DDL is not transactional, so a
+# migration interrupted before it was recorded runs again from the start.
+SCHEMA_MIGRATIONS = [
+    (1, 'Index gallery image filename (unique), album and date and donor donation date', [
+        deduplicate_gallery_filenames,
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_gallery_image_filename ON gallery_image (filename)',
+        'CREATE INDEX IF NOT EXISTS ix_gallery_image_album_id ON gallery_image (album_id)',
+        'CREATE INDEX IF NOT EXISTS ix_gallery_image_date ON gallery_image (date)',
+        'CREATE INDEX IF NOT EXISTS ix_donor_donation_date ON donor (donation_date)',
+    ]),
+]
+
+def apply_schema_migrations() -> list[int]:
+    """
+    Apply the SCHEMA_MIGRATIONS not yet recorded in schema_migration, in version order.
+
+    Returns:
+        list: Versions applied by this call
+    """
+    with db.engine.connect() as connection:
+        applied = set(connection.execute(db.select(SchemaMigration.version)).scalars())
+
+    versions = []
+    for version, description, steps in sorted(SCHEMA_MIGRATIONS, key=lambda migration: migration[0]):
+        if version in applied:
+            continue
+        with db.engine.begin() as connection:
+            for step in steps:
+                if callable(step):
+                    step(connection)
+                else:
+                    connection.execute(text(step))
+            connection.execute(db.insert(SchemaMigration).values(
+                version=version, description=description, applied_at=datetime.now()
+            ))
+        database_logger.info(f"Applied schema migration {version}: {description}")
+        versions.append(version)
+    return versions
+
+def upgrade_database_schema() -> list[int]:
+    """
+    Create missing tables, add missing columns to existing tables, apply pending
+    versioned migrations, create missing model indexes and backfill precomputed
+    album sort keys. Safe to run repeatedly.
+
+    Returns:
+        list: Versions of the migrations applied by this call
+    """
+    log_function_call(database_logger, 'upgrade_database_schema')
+    
+    db.create_all()
+    
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    with db.engine.begin() as connection:
+        for table, columns in SCHEMA_UPGRADES.items():
+            if table not in tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table)}
+            for name, ddl in columns:
+                if name not in existing:
+                    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+                    database_logger.info(f"Added column {table}.{name}")
+    
+    versions = apply_schema_migrations()
+    
+    # Indexes declared on models are not created for tables that already existed
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    
+    # Assigning display_name recomputes the sort columns
+    albums = Album.query.filter(Album.sort_rank.is_(None)).all()
+    for album in albums:
+        album.display_name = album.display_name
+    if albums:
+        db.session.commit()
+        database_logger.info(f"Backfilled sort keys for {len(albums)} albums")
+    return versions
+
+def hot_queries() -> dict:
+    """
+    The frequent gallery and donor queries with the index each one should use.
+
+    Returns:
+        dict: Query name -> (statement, expected index name)
+    """
+    return {
+        'gallery ordered by date': (
+            db.select(GalleryImage).order_by(desc(GalleryImage.date)), 'ix_gallery_image_date'),
+        'image by filename': (
+            db.select(GalleryImage).filter_by(filename='images/gallery/album/image.webp'),
+            'ix_gallery_image_filename'),
+        'album image count': (
+            db.select(func.count(GalleryImage.id)).filter_by(album_id=1), 'ix_gallery_image_album_id'),
+        'donors ordered by date': (
+            db.select(Donor).order_by(desc(Donor.donation_date)), 'ix_donor_donation_date'),
+    }
+
+def explain_hot_queries() -> dict:
+    """
+    Run EXPLAIN QUERY PLAN for hot_queries() on the current database.
+
+    Returns:
+        dict: Query name -> (expected index, plan detail lines, whether the plan uses the index)
+    """
+    plans = {}
+    for name, (statement, index) in hot_queries().items():
+        sql = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        details = [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+        plans[name] = (index, details, any(f'INDEX {index}' in detail for detail in details))
+    return plans
+
 # Forms
 class ContactForm(FlaskForm):
     name = StringField('Jméno', validators=[DataRequired()])
@@ -270,13 +689,15 @@ class ContactForm(FlaskForm):
     message = TextAreaField('Zpráva', validators=[DataRequired()])
     submit = SubmitField('Odeslat')
 
-def create_album_if_not_exists(normalized_name: str, display_name: str) -> Album:
+def create_album_if_not_exists(normalized_name: str, display_name: str, commit: bool = True) -> Album:
     """
     Creates album if it doesn't exist, otherwise returns existing one.
     
     Args:
         normalized_name: Normalized name for file system
         display_name: Name for user display
+        commit: Commit the new album now; with False it is only flushed and the
+                caller commits (or rolls back) it with the rest of its transaction
         
     Returns:
         Album: Created or found album
@@ -297,13 +718,27 @@ def create_album_if_not_exists(normalized_name: str, display_name: str) -> Album
             # Create new album
             album = Album(normalized_name=normalized_name, display_name=display_name)
             db.session.add(album)
-            db.session.commit()
+            if commit:
+                db.session.commit()
+            else:
+                db.session.flush()
             database_logger.info(f"Created new album: {display_name} ({normalized_name})")
             return album
             
+    except IntegrityError:
+        if not commit:
+            # Rolling back here would discard the caller's transaction
+            raise
+        # A concurrent upload job created the same album first
+        db.session.rollback()
+        album = Album.query.filter_by(normalized_name=normalized_name).first()
+        if album is None:
+            raise
+        return album
     except Exception as e:
         log_exception(database_logger, e, f'creating album {normalized_name}')
-        db.session.rollback()
+        if commit:
+            db.session.rollback()
         raise
 
 def get_album_by_normalized_name(normalized_name: str) -> Album | None:
@@ -318,79 +753,327 @@ def get_album_by_normalized_name(normalized_name: str) -> Album | None:
     """
     return Album.query.filter_by(normalized_name=normalized_name).first()
 
+def get_album_display_name(folder_name: str) -> str:
+    """
+    Converts album folder name to beautiful display name.
+    
+    Args:
+        folder_name: Normalized album folder name
+        
+    Returns:
+        str: Display name with diacritics for known albums
+    """
+    return ALBUM_DISPLAY_NAMES.get(folder_name, folder_name)
+
+def describe_gallery_albums(folder_names: list[str]) -> dict:
+    """
+    Resolve display names, sort keys and pinned covers for gallery folders in one query.
+    
+    Albums stored in the database use their precomputed sort columns; folders
+    without a row yet fall back to the display name registry.
+    
+    Args:
+        folder_names: Album folder names found on disk
+        
+    Returns:
+        dict: folder name -> (display name, sort key, pinned cover path or None)
+    """
+    rows = {}
+    try:
+        query = db.session.query(
+            Album.normalized_name, Album.display_name, Album.sort_rank, Album.year, Album.month,
+            Album.cover_image, Album.cover_pinned
+        ).filter(Album.normalized_name.in_(folder_names))
+        rows = {row.normalized_name: row for row in query}
+    except Exception as e:
+        # The index may be rebuilt before the album table exists (fresh database)
+        log_exception(database_logger, e, 'loading album sort keys')
+        db.session.rollback()
+    
+    descriptions = {}
+    for folder_name in folder_names:
+        row = rows.get(folder_name)
+        if row is not None and row.sort_rank is not None:
+            display_name = row.display_name
+            sort_key = (row.sort_rank, row.year, row.month, display_name)
+        else:
+            display_name = get_album_display_name(folder_name)
+            sort_key = compute_album_sort_keys(display_name) + (display_name,)
+        pinned_cover = row.cover_image if row is not None and row.cover_pinned else None
+        descriptions[folder_name] = (display_name, sort_key, pinned_cover)
+    return descriptions
+
+# Resized copies of gallery images for srcset, mirroring the album folders
+DERIVATIVES_ROOT = os.path.join('static', 'images', 'derivatives')
+
+def derivative_path(filename: str, width: int) -> str:
+    """
+    Path (relative to static/) of a gallery image's derivative of the given width.
+    
+    images/gallery/<album>/<name>.webp -> images/derivatives/<album>/<name>-<width>w.webp
+    """
+    album_name = os.path.basename(os.path.dirname(filename))
+    return os.path.join('images', 'derivatives', album_name,
+                        image_processor.derivative_filename(filename, width))
+
+def variant_path(filename: str, height: int) -> str:
+    """
+    Path (relative to static/) of a gallery video's mobile variant of the given height.
+    
+    images/gallery/<album>/<name>.mp4 -> images/derivatives/<album>/<name>-<height>p.mp4
+    """
+    album_name = os.path.basename(os.path.dirname(filename))
+    return os.path.join('images', 'derivatives', album_name,
+                        video_processor.variant_filename(filename, height))
+
+def parse_derivative_widths(value: str | None) -> tuple[int, ...]:
+    """Parse GalleryImage.derivative_widths (or video_variants) into a tuple of sizes."""
+    return tuple(int(width) for width in value.split(',') if width) if value else ()
+
+def avif_path(filename: str) -> str:
+    """
+    Path (relative to static/) of the AVIF version of a gallery WebP or one of its derivatives.
+    
+    images/gallery/<album>/<name>.webp -> images/derivatives/<album>/<name>.avif
+    images/derivatives/<album>/<name>-<width>w.webp -> images/derivatives/<album>/<name>-<width>w.avif
+    """
+    album_name = os.path.basename(os.path.dirname(filename))
+    return os.path.join('images', 'derivatives', album_name, image_processor.avif_filename(filename))
+
+def derivative_files(filename: str) -> list[str]:
+    """Paths (relative to static/) of every derivative a gallery file can have."""
+    paths = [derivative_path(filename, width) for width in image_processor.DERIVATIVE_WIDTHS]
+    if filename.lower().endswith('.mp4'):
+        paths += [variant_path(filename, height) for height in video_processor.VIDEO_VARIANT_HEIGHTS]
+    else:
+        paths += [avif_path(filename)] + [avif_path(path) for path in paths]
+    return paths
+
+def avif_enabled() -> bool:
+    """Whether uploads get AVIF versions (AVIF_ENABLED and an AVIF-capable Pillow)."""
+    return app.config.get('AVIF_ENABLED', True) and image_processor.AVIF_SUPPORTED
+
+def remove_derivatives(filename: str):
+    """Delete all derivatives of a gallery image (poster and variants of a video)."""
+    for relative_path in derivative_files(filename):
+        path = os.path.join('static', relative_path)
+        try:
+            os.remove(path)
+            log_file_operation(processing_logger, 'delete', path, 'success')
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log_exception(processing_logger, e, f'removing derivative {path}')
+
+def move_derivatives(old_filename: str, new_filename: str):
+    """Move the derivatives of a gallery image that moved to another album."""
+    for old_relative, new_relative in zip(derivative_files(old_filename), derivative_files(new_filename)):
+        old_path = os.path.join('static', old_relative)
+        if not os.path.exists(old_path):
+            continue
+        new_path = os.path.join('static', new_relative)
+        try:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.rename(old_path, new_path)
+        except OSError as e:
+            log_exception(processing_logger, e, f'moving derivative {old_path}')
+
+def current_output_spec() -> str:
+    """Spec hash of the outputs an upload gets now (image_processor.output_spec_hash())."""
+    return image_processor.output_spec_hash(avif=avif_enabled())
+
+def store_original(path: str, content_hash: str) -> str:
+    """
+    Keep an uploaded original in the originals store.
+
+    Originals are stored by content (<ORIGINALS_DIR>/<hash[:2]>/<hash><ext>), so
+    album links and moves never touch them. The staged file itself stays in place
+    (it is removed after the database commit, which keeps the upload job retryable).
+
+    Args:
+        path: Staged upload
+        content_hash: SHA-256 of the upload
+
+    Returns:
+        str: Path relative to ORIGINALS_DIR
+    """
+    relative_path = os.path.join(content_hash[:2], content_hash + os.path.splitext(path)[1].lower())
+    target = os.path.join(app.config['ORIGINALS_DIR'], relative_path)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+        link_file(path, tmp_path)
+        os.replace(tmp_path, target)
+        log_file_operation(upload_logger, 'store', target, 'success', 'Original kept')
+    return relative_path
+
+def original_file(image: GalleryImage) -> str | None:
+    """Path of an image's stored original, or None when it was not kept."""
+    if not image.original:
+        return None
+    path = os.path.join(app.config['ORIGINALS_DIR'], image.original)
+    return path if os.path.exists(path) else None
+
+def remove_original(image: GalleryImage):
+    """Delete a removed image's original unless an album link still uses it."""
+    if not image.original or GalleryImage.query.filter(GalleryImage.original == image.original,
+                                                       GalleryImage.id != image.id).first():
+        return
+    try:
+        os.remove(os.path.join(app.config['ORIGINALS_DIR'], image.original))
+    except OSError:
+        pass
+
+def same_file(first: str, second: str) -> bool:
+    """Whether two paths are the same file (hard links); False when one is missing."""
+    try:
+        return os.path.samefile(first, second)
+    except OSError:
+        return False
+
+def link_file(source: str, target: str):
+    """Hard-link a file (no extra disk space); copy when the filesystem cannot link."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+def gallery_dimensions() -> dict:
+    """
+    Frame sizes recorded at processing time for the gallery index in one query.
+
+    The index uses them instead of reading image headers while the byte size
+    still matches the file on disk.
+
+    Returns:
+        dict: gallery path -> (file size, width, height)
+    """
+    try:
+        rows = db.session.query(GalleryImage.filename, GalleryImage.file_size,
+                                GalleryImage.width, GalleryImage.height).filter(
+            GalleryImage.file_size.isnot(None), GalleryImage.width.isnot(None),
+            GalleryImage.height.isnot(None)
+        ).all()
+    except Exception as e:
+        # The index may be rebuilt before the columns exist (schema not upgraded yet)
+        log_exception(database_logger, e, 'loading gallery image dimensions')
+        db.session.rollback()
+        return {}
+    return {filename: (file_size, width, height) for filename, file_size, width, height in rows}
+
+# Process-level gallery index, rebuilt only when gallery directories change
+gallery_index = GalleryIndex(
+    os.path.join('static', 'images', 'gallery'),
+    os.path.join('images', 'gallery'),
+    ['.jpg', '.jpeg', '.png', '.webp', '.heic', '.mp4'],
+    describe=describe_gallery_albums,
+    manifest_path=app.config.get('GALLERY_MANIFEST_PATH'),
+    derivatives_root=DERIVATIVES_ROOT,
+    dimensions=gallery_dimensions
+)
+
+@app.template_global()
+def image_srcset(record) -> str:
+    """
+    Build a srcset for a gallery image record from its derivatives.
+    
+    The image itself is added as the widest candidate when it is larger than
+    every derivative. Returns an empty string when there are no derivatives.
+    """
+    if record is None or not record.derivatives:
+        return ''
+    entries = [f"{url_for('static', filename=derivative_path(record.path, width))} {width}w"
+               for width in record.derivatives]
+    if record.width > max(record.derivatives):
+        entries.append(f"{url_for('static', filename=record.path)} {record.width}w")
+    return ', '.join(entries)
+
+# Poster width for the gallery grid and the album page
+VIDEO_POSTER_WIDTH = 640
+
+@app.template_global()
+def video_poster(record) -> str:
+    """URL of a video's poster frame, or an empty string when it has none."""
+    if record is None or not record.derivatives:
+        return ''
+    fitting = [width for width in record.derivatives if width <= VIDEO_POSTER_WIDTH]
+    width = max(fitting) if fitting else min(record.derivatives)
+    return url_for('static', filename=derivative_path(record.path, width))
+
+@app.template_global()
+def video_sources(record) -> list[dict]:
+    """Mobile variants of a video, largest first, as {'src', 'height'} dicts."""
+    if record is None:
+        return []
+    return [{'src': url_for('static', filename=variant_path(record.path, height)), 'height': height}
+            for height in sorted(record.variants, reverse=True)]
+
+def store_album_covers() -> int:
+    """
+    Persist the covers chosen by the gallery index on their Album rows.
+
+    Pinned covers are kept while the file still exists in the album; otherwise
+    the pin is released and the index's choice (largest image) is stored.
+
+    Returns:
+        int: Number of albums whose cover changed
+    """
+    log_function_call(database_logger, 'store_album_covers')
+
+    covers = {folder.normalized_name: folder.cover_image for folder in gallery_index.albums()}
+    if not covers:
+        return 0
+
+    changed = 0
+    for album in Album.query.filter(Album.normalized_name.in_(list(covers))).all():
+        cover = covers[album.normalized_name]
+        if album.cover_pinned and album.cover_image != cover:
+            database_logger.info(f"Pinned cover no longer in album {album.normalized_name}: {album.cover_image}")
+            album.cover_pinned = False
+        if album.cover_image != cover:
+            album.cover_image = cover
+            changed += 1
+
+    if changed:
+        db.session.commit()
+        database_logger.info(f"Updated covers for {changed} albums")
+    return changed
+
+def refresh_gallery():
+    """Rescan the gallery after a change and store the selected album covers."""
+    gallery_index.refresh()
+    try:
+        store_album_covers()
+    except Exception as e:
+        log_exception(database_logger, e, 'storing album covers')
+        db.session.rollback()
+
 def get_existing_albums():
-    """Get list of existing albums from the gallery directory and remove empty ones"""
-    gallery_dir = Path('static/images/gallery')
-    if not gallery_dir.exists():
+    """
+    Get list of albums that have files in the gallery directory.
+    
+    Read-only: folders come from the gallery index and album rows from a single
+    query. Folders without a database row yet get a transient (unsaved) Album;
+    rows are created and empty folders pruned by run_gallery_maintenance().
+    """
+    folder_names = [folder.normalized_name for folder in gallery_index.albums()]
+    if not folder_names:
         return []
     
-    albums = []
-    for folder in gallery_dir.iterdir():
-        if folder.is_dir() and not folder.name.startswith('.'):
-            # Check if directory is empty
-            has_files = False
-            for file in folder.iterdir():
-                if file.is_file() and file.suffix.lower() in ['.webp', '.mp4']:
-                    has_files = True
-                    break
-            
-            if has_files:
-                # Search for album in database by normalized name
-                album = get_album_by_normalized_name(folder.name)
-                if album:
-                    albums.append(album)
-                else:
-                    # If album not found in DB, create it with beautiful name
-                    # Convert normalized_name to beautiful display_name
-                    display_name = folder.name
-                    # Add diacritics for known names
-                    if folder.name == 'Tresinky':
-                        display_name = 'Třešinky'
-                    elif folder.name == 'Mapy':
-                        display_name = 'Mapy a plány'
-                    elif folder.name == '2023 unor':
-                        display_name = '2023 - Únor'
-                    elif folder.name == '2021 unor':
-                        display_name = '2021 - Únor'
-                    elif folder.name == '2021 duben prace v lese':
-                        display_name = '2021 - Duben - Práce v lese'
-                    elif folder.name == '2020 zari vymerovani':
-                        display_name = '2020 - Září - Vyměřování'
-                    elif folder.name == '2020 rijen vysadba':
-                        display_name = '2020 - Říjen - Výsadba'
-                    elif folder.name == '2020 kveten':
-                        display_name = '2020 - Květen'
-                    elif folder.name == '2020 cerven':
-                        display_name = '2020 - Červen'
-                    elif folder.name == '2019 kveten':
-                        display_name = '2019 - Květen'
-                    elif folder.name == '2019 unor':
-                        display_name = '2019 - Únor'
-                    elif folder.name == '2019 brezen duben':
-                        display_name = '2019 - Březen, duben'
-                    elif folder.name == '2018 zari, rijen, listopad':
-                        display_name = '2018 - Září, říjen, listopad'
-                    elif folder.name == '2017 Obrazky':
-                        display_name = '2017 - Obrázky'
-                    elif folder.name == '2015 puvodni stav pred zahajenim obnovy sadu':
-                        display_name = '2015 - Původní stav před zahájením obnovy sadu'
-                    elif folder.name == '2020':
-                        display_name = '2020 - Celkový přehled'
-                    elif folder.name == '2025':
-                        display_name = '2025 - Nové fotky'
-                    elif folder.name == '1950.LEITA':
-                        display_name = '1950 - Letecký snímek'
-                    
-                    album = create_album_if_not_exists(folder.name, display_name)
-                    albums.append(album)
-            else:
-                # Remove empty directory
-                try:
-                    folder.rmdir()
-                except OSError:
-                    pass  # Directory might not be empty or already deleted
+    # One ordered query over the indexed sort columns
+    albums = Album.query.filter(Album.normalized_name.in_(folder_names)).order_by(
+        Album.sort_rank, Album.year, Album.month, Album.display_name
+    ).all()
     
-    return sorted(albums, key=lambda x: x.display_name)
+    known = {album.normalized_name for album in albums}
+    missing = [
+        Album(normalized_name=folder_name, display_name=get_album_display_name(folder_name))
+        for folder_name in folder_names if folder_name not in known
+    ]
+    if missing:
+        albums = sorted(albums + missing, key=lambda x: (x.sort_rank, x.year, x.month, x.display_name))
+    
+    return albums
 
 class ImageUploadForm(FlaskForm):
     image = FileField('Fotografie', validators=[DataRequired()])
@@ -414,6 +1097,18 @@ class ImageUploadForm(FlaskForm):
             if ext not in allowed_extensions:
                 raise ValidationError('Nepodporovaný formát souboru. Povolené formáty: JPG, JPEG, PNG, WebP, HEIC, MP4')
 
+class BatchUploadForm(ImageUploadForm):
+    """Shared metadata of a multi-file upload; the files come as the images list."""
+    image = None
+    submit = None
+
+class UploadSessionForm(ImageUploadForm):
+    """Metadata of a chunked upload; the file itself arrives in later requests."""
+    image = None
+    submit = None
+    filename = StringField('Soubor', validators=[DataRequired()])
+    size = IntegerField('Velikost', validators=[DataRequired()])
+
 class ImageEditForm(FlaskForm):
     title = StringField('Název', validators=[DataRequired()])
     description = TextAreaField('Popis')
@@ -425,229 +1120,463 @@ class ImageEditForm(FlaskForm):
         super(ImageEditForm, self).__init__(*args, **kwargs)
         albums = get_existing_albums()
         self.album.choices = [(album.display_name, album.display_name) for album in albums]
-        if 'obj' in kwargs and kwargs['obj'] and kwargs['obj'].album:
+        # The current album preselects the field; a submitted choice wins
+        if 'obj' in kwargs and kwargs['obj'] and kwargs['obj'].album and not self.album.raw_data:
             self.album.data = kwargs['obj'].album.display_name
 
-def get_image_date(image_path):
+# Shared by the job worker threads of this process; admits conversions by estimated decode memory
+conversion_pool = ConversionPool(
+    workers=app.config.get('CONVERSION_WORKERS', 1),
+    memory_budget=app.config.get('CONVERSION_MEMORY_BUDGET_MB', 192) * 1024 * 1024
+)
+
+def process_uploaded_image(input_path: str, output_path: str, profile: str = 'gallery',
+                           derivatives_dir: str | None = None):
     """
-    Extracts image creation date from EXIF or file metadata.
+    Resize an uploaded image to a WebP in a conversion process.
+    
+    The call waits until the image's estimated decode memory fits the
+    conversion pool budget. Formats Pillow cannot decode here (HEIC without
+    pillow-heif) fall back to scripts/process_image.sh, which writes the same
+    output path and runs alone; their srcset derivatives are then generated
+    from that output.
     
     Args:
-        image_path: Path to image file
+        input_path: Uploaded file inside the album directory
+        output_path: Target WebP path
+        profile: Size profile (gallery, hero, thumbnail)
+        derivatives_dir: Directory for the srcset derivative ladder (None to skip)
         
     Returns:
-        datetime: Image creation date
+        ProcessedImage | None: Dimensions, EXIF and derivative widths, or None when the script was used
     """
-    log_function_call(processing_logger, 'get_image_date', image_path=image_path)
+    if image_processor.can_process(input_path):
+        return conversion_pool.run(image_processor.process_image, input_path, output_path, profile, derivatives_dir)
     
-    try:
-        # Check file existence
-        if not os.path.exists(image_path):
-            processing_logger.warning(f"Image file not found: {image_path}")
-            return datetime.now()
-        
-        # Special handling for HEIC files
-        if image_path.lower().endswith(('.heic', '.heif')):
-            processing_logger.info(f"HEIC file detected, skipping EXIF parsing: {image_path}")
-            try:
-                mtime = os.path.getmtime(image_path)
-                date_obj = datetime.fromtimestamp(mtime)
-                processing_logger.info(f"Using file modification time for HEIC {image_path}: {date_obj}")
-                return date_obj
-            except Exception as mtime_error:
-                log_exception(processing_logger, mtime_error, f'getting modification time for HEIC {image_path}')
-                return datetime.now()
-        
-        # Try to get date from EXIF data for regular images
-        try:
-            with open(image_path, 'rb') as f:
-                tags = exifread.process_file(f, stop_tag='EXIF DateTimeOriginal')
-                if 'EXIF DateTimeOriginal' in tags:
-                    date_str = str(tags['EXIF DateTimeOriginal'])
-                    date_obj = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-                    processing_logger.info(f"EXIF date found for {image_path}: {date_obj}")
-                    return date_obj
-                else:
-                    processing_logger.info(f"No EXIF DateTimeOriginal found in {image_path}")
-        except Exception as exif_error:
-            log_exception(processing_logger, exif_error, f'reading EXIF from {image_path}')
-        
-        # If EXIF couldn't be read, try to get file modification date
-        try:
-            mtime = os.path.getmtime(image_path)
-            date_obj = datetime.fromtimestamp(mtime)
-            processing_logger.info(f"Using file modification time for {image_path}: {date_obj}")
-            return date_obj
-        except Exception as mtime_error:
-            log_exception(processing_logger, mtime_error, f'getting modification time for {image_path}')
-        
-        # If nothing worked, return current time
-        processing_logger.warning(f"Could not determine date for {image_path}, using current time")
-        return datetime.now()
-        
-    except Exception as e:
-        log_exception(processing_logger, e, f'get_image_date for {image_path}')
-        processing_logger.error(f"Critical error in get_image_date for {image_path}, using current time")
-        return datetime.now()
+    processing_logger.info(f"Falling back to process_image.sh for {input_path}")
+    # The header is unreadable here, so the script reserves the whole budget
+    with conversion_pool.reserve(None):
+        result = subprocess.run(
+            ['./scripts/process_image.sh', input_path, profile],
+            check=True,
+            capture_output=True,
+            text=True,
+            timeout=60  # 60 sekund timeout
+        )
+    if result.stdout:
+        processing_logger.info(f"Process output: {result.stdout}")
+    if derivatives_dir:
+        conversion_pool.run(image_processor.generate_derivatives, output_path, derivatives_dir)
+    return None
 
-# Routes
-@app.route('/')
-def home():
-    return render_template('home.html')
+# Version of everything the public pages are rendered from; changes only on deploy
+asset_version = AssetVersion([
+    os.path.join(app.root_path, 'templates'),
+    os.path.join(app.root_path, 'static', 'css'),
+    os.path.join(app.root_path, 'static', 'js'),
+    os.path.join(app.root_path, 'app.py'),
+])
 
-@app.route('/o-nas')
-def about():
-    return render_template('about.html')
+def page_validators(include_gallery: bool = False) -> tuple[str, datetime | None]:
+    """
+    Build the ETag value and Last-Modified time for a public page.
+    
+    Args:
+        include_gallery: Whether the page content depends on the gallery index
+        
+    Returns:
+        tuple: (etag, last_modified)
+    """
+    if app.jinja_env.auto_reload:
+        # Templates may change without a restart in development
+        asset_version.reset()
+    
+    etag = asset_version.digest
+    last_modified = asset_version.last_modified
+    if include_gallery:
+        # albums() revalidates the index against the directory mtimes first
+        gallery_index.albums()
+        etag = f'{etag}-g{gallery_index.generation}'
+        last_modified = max(last_modified, gallery_index.last_modified or 0)
+    return etag, http_datetime(last_modified)
 
-@app.route('/sad')
-def orchard():
-    return render_template('orchard.html')
+# Rendered and precompressed static content pages, keyed by endpoint
+page_cache = PageCache()
 
-@app.route('/les')
-def forest():
-    return render_template('forest.html')
+def cached_page_response(view, etag: str, *args, **kwargs):
+    """
+    Serve a page from the process page cache in the best accepted encoding.
+    
+    The view is rendered (and compressed) only on the first request after
+    start-up or after the asset version changes.
+    """
+    page = page_cache.get(request.endpoint, etag, lambda: view(*args, **kwargs))
+    encoding, body = page.select(request.accept_encodings.best_match(page.encodings))
+    
+    response = app.response_class(body, mimetype='text/html')
+    if encoding:
+        response.content_encoding = encoding
+    return response
 
-@app.route('/gallery')
-def gallery():
-    # Clean up empty directories
-    gallery_path = os.path.join('static', 'images', 'gallery')
-    if os.path.exists(gallery_path):
-        for folder in os.listdir(gallery_path):
-            folder_path = os.path.join(gallery_path, folder)
-            if os.path.isdir(folder_path):
-                # Check if directory is empty or contains only non-image files
-                has_valid_files = False
-                for file in os.listdir(folder_path):
-                    if file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.heic', '.mp4')):
-                        has_valid_files = True
-                        break
-                
-                if not has_valid_files:
-                    try:
-                        os.rmdir(folder_path)
-                    except OSError:
-                        pass  # Directory might not be empty or already deleted
+def conditional_page(include_gallery: bool = False, cached: bool = False):
+    """
+    Answer If-None-Match / If-Modified-Since with 304 before the view renders.
     
-    # Get existing albums with their images
-    albums = []
-    gallery_dir = Path('static/images/gallery')
-    if gallery_dir.exists():
-        for folder in gallery_dir.iterdir():
-            if folder.is_dir() and not folder.name.startswith('.'):
-                # Get all images in the folder and sort by modification time (oldest first)
-                images = []
-                file_info = []
-                for file in folder.iterdir():
-                    if file.is_file() and file.suffix.lower() in ['.jpg', '.jpeg', '.png', '.webp', '.heic', '.mp4']:
-                        file_path = os.path.join('images', 'gallery', folder.name, file.name)
-                        # Get file modification time for sorting
-                        try:
-                            mtime = file.stat().st_mtime
-                            file_info.append((file_path, mtime))
-                        except OSError:
-                            # If we can't get mtime, use current time
-                            file_info.append((file_path, 0))
-                
-                # Sort by modification time (oldest first)
-                file_info.sort(key=lambda x: x[1])
-                images = [file_path for file_path, _ in file_info]
-                
-                if images:
-                    # Get a random image as cover
-                    cover_image = random.choice(images)
-                    
-                    # Search for album in database - temporarily disabled
-                    # album = get_album_by_normalized_name(folder.name)
-                    # if album:
-                    #     display_name = album.display_name
-                    # else:
-                    # If album not found, create it with beautiful name
-                    display_name = folder.name
-                    # Add diacritics for known names
-                    if folder.name == 'Tresinky':
-                        display_name = 'Třešinky'
-                    elif folder.name == 'Mapy':
-                        display_name = 'Mapy a plány'
-                    elif folder.name == '2023 unor':
-                        display_name = '2023 - Únor'
-                    elif folder.name == '2021 unor':
-                        display_name = '2021 - Únor'
-                    elif folder.name == '2021 duben prace v lese':
-                        display_name = '2021 - Duben - Práce v lese'
-                    elif folder.name == '2020 zari vymerovani':
-                        display_name = '2020 - Září - Vyměřování'
-                    elif folder.name == '2020 rijen vysadba':
-                        display_name = '2020 - Říjen - Výsadba'
-                    elif folder.name == '2020 kveten':
-                        display_name = '2020 - Květen'
-                    elif folder.name == '2020 cerven':
-                        display_name = '2020 - Červen'
-                    elif folder.name == '2019 kveten':
-                        display_name = '2019 - Květen'
-                    elif folder.name == '2019 unor':
-                        display_name = '2019 - Únor'
-                    elif folder.name == '2019 brezen duben':
-                        display_name = '2019 - Březen, duben'
-                    elif folder.name == '2018 zari, rijen, listopad':
-                        display_name = '2018 - Září, říjen, listopad'
-                    elif folder.name == '2017 Obrazky':
-                        display_name = '2017 - Obrázky'
-                    elif folder.name == '2015 puvodni stav pred zahajenim obnovy sadu':
-                        display_name = '2015 - Původní stav před zahájením obnovy sadu'
-                    elif folder.name == '2020':
-                        display_name = '2020 - Celkový přehled'
-                    elif folder.name == '2025':
-                        display_name = '2025 - Nové fotky'
-                    elif folder.name == '1950.LEITA':
-                        display_name = '1950 - Letecký snímek'
-                    elif folder.name == 'Pamětní kniha Cetechovice 1927':
-                        display_name = 'Pamětní kniha Cetechovice 1927'
-                        
-                        album = create_album_if_not_exists(folder.name, display_name)
-                        display_name = album.display_name
-                    
-                    albums.append({
-                        'name': display_name,  # Use display_name for display
-                        'normalized_name': folder.name,  # Keep normalized name
-                        'cover_image': cover_image,
-                        'images': images
-                    })
-    
-    # Sort albums by date: Pamětní kniha first, then by year (oldest first)
-    def sort_key(album):
-        if album['name'] == 'Pamětní kniha Cetechovice 1927':
-            return (0, 0)  # Always first
-        
-        # Extract year from album name for sorting
-        import re
-        year_match = re.search(r'(\d{4})', album['name'])
-        if year_match:
-            year = int(year_match.group(1))
-            # For months, extract month number for proper calendar order
-            month_order = {
-                'leden': 1, 'únor': 2, 'březen': 3, 'duben': 4, 'květen': 5, 'červen': 6,
-                'červenec': 7, 'srpen': 8, 'září': 9, 'říjen': 10, 'listopad': 11, 'prosinec': 12,
-                'unor': 2, 'brezen': 3, 'duben': 4, 'kveten': 5, 'cerven': 6,
-                'cervenec': 7, 'srpen': 8, 'zari': 9, 'rijen': 10, 'listopad': 11, 'prosinec': 12,
-                'januar': 1, 'februar': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
-                'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12
-            }
+    Pages carrying flashed messages are rendered normally and get no validators,
+    so a one-off message is never cached or revalidated.
+    
+    Args:
+        include_gallery: Whether the page content depends on the gallery index
+        cached: Serve the pre-rendered, precompressed page from page_cache
+                (only for pages whose output changes on deploy only)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if '_flashes' in session:
+                return view(*args, **kwargs)
             
-            # Check for month in name
-            month = 0
-            for month_name, month_num in month_order.items():
-                if month_name in album['name'].lower():
-                    month = month_num
-                    break
+            etag, last_modified = page_validators(include_gallery)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = app.response_class(status=304)
+            elif cached:
+                response = cached_page_response(view, etag, *args, **kwargs)
+            else:
+                response = make_response(view(*args, **kwargs))
             
-            return (1, year, month)  # 1 for regular albums, then year, then month
+            if cached:
+                response.vary.add('Accept-Encoding')
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+# Static subtrees with large gallery files that nginx serves when MEDIA_ACCEL_PREFIX is set
+MEDIA_PREFIXES = ('images/gallery/', 'images/derivatives/')
+
+mimetypes.add_type('image/avif', '.avif')
+
+def accepts_avif() -> bool:
+    """
+    Whether the client lists image/avif in Accept.
+
+    Only an explicit entry counts: every browser sends */* for images,
+    including those that cannot decode AVIF.
+    """
+    return any(value.lower() == 'image/avif' and quality > 0
+               for value, quality in request.accept_mimetypes)
+
+def send_static_media(filename):
+    """
+    Static file view that keeps large transfers off the sync worker.
+
+    With MEDIA_ACCEL_PREFIX set, gallery media is answered with an empty
+    X-Accel-Redirect response and nginx sends the bytes itself (sendfile,
+    Range, conditional requests). Otherwise the file is served by the app:
+    a 206 body is handed to the server as a seeked file_wrapper, so gunicorn
+    still uses sendfile instead of streaming the range through Python.
+
+    Gallery WebPs are negotiated on Accept: clients that accept AVIF get the
+    AVIF version when it has been encoded, under the same URL (Vary: Accept).
+    """
+    negotiated = filename.startswith(MEDIA_PREFIXES) and filename.lower().endswith('.webp')
+    if negotiated and accepts_avif():
+        avif = avif_path(filename)
+        if os.path.isfile(os.path.join(app.static_folder, avif)):
+            filename = avif
+
+    response = serve_static_file(filename)
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
+def serve_static_file(filename):
+    """Send a static file, through nginx (X-Accel-Redirect) for gallery media when configured."""
+    accel_prefix = app.config.get('MEDIA_ACCEL_PREFIX')
+    if accel_prefix and filename.startswith(MEDIA_PREFIXES):
+        path = safe_join(app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(filename)
+        # nginx keeps Content-Type and Cache-Control of the redirecting response
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        max_age = app.get_send_file_max_age(filename)
+        if max_age is None:
+            response.cache_control.no_cache = True
+        else:
+            response.cache_control.public = True
+            response.cache_control.max_age = max_age
+        return response
+
+    response = app.send_static_file(filename)
+    if response.status_code == 206 and request.range is not None:
+        path = safe_join(app.static_folder, filename)
+        start, stop = request.range.range_for_length(os.path.getsize(path))
+        # Content-Length and Content-Range were set by the range handling above
+        response.response.close()
+        response.response = wrap_file(request.environ, FileRange(path, start, stop - start))
+    return response
+
+app.view_functions['static'] = send_static_media
+
+# Static images /img/<width>/<path> can be resized from (videos are not)
+RESIZABLE_EXTENSIONS = ('.webp', '.jpg', '.jpeg', '.png')
+
+# Variants resized on demand, shared by all workers on disk
+resize_cache = ResizeCache(
+    app.config.get('IMAGE_CACHE_DIR', os.path.join('instance', 'image_cache')),
+    app.config.get('IMAGE_CACHE_MAX_MB', 512) * 1024 * 1024
+)
+
+def resize_source(filename: str, width: int) -> str:
+    """
+    File to resize a static image from.
+
+    Gallery images use their smallest stored derivative at least width wide
+    (cheapest decode), then the stored original, then the served file itself.
+    """
+    if filename.startswith('images/gallery/'):
+        for derivative_width in image_processor.DERIVATIVE_WIDTHS:
+            path = os.path.join('static', derivative_path(filename, derivative_width))
+            if derivative_width >= width and os.path.isfile(path):
+                return path
+        image = GalleryImage.query.filter_by(filename=filename).first()
+        original = original_file(image) if image is not None else None
+        if original and image_processor.can_process(original):
+            return original
+    return os.path.join(app.static_folder, filename)
+
+@app.route('/img/<int:width>/<path:filename>')
+def resized_image(width, filename):
+    """
+    Static image resized to one of IMAGE_RESIZE_WIDTHS, made on first request.
+
+    Variants are cached on disk (LRU within IMAGE_CACHE_MAX_MB) under a key that
+    includes the source file's size and mtime, so a replaced or rebuilt image
+    gets new variants.
+    """
+    if width not in app.config.get('IMAGE_RESIZE_WIDTHS', ()):
+        abort(404)
+    if not filename.startswith('images/') or not filename.lower().endswith(RESIZABLE_EXTENSIONS):
+        abort(404)
+    path = safe_join(app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    source = resize_source(filename, width)
+    stat = os.stat(source)
+    key = f'{source}:{stat.st_size}:{stat.st_mtime_ns}'
+    try:
+        cached = resize_cache.get(key, width, lambda tmp_path: conversion_pool.run(
+            image_processor.resize_image, source, tmp_path, width))
+    except image_processor.ImageProcessingError:
+        abort(404)
+
+    # The cache touches the file on every hit, so the ETag comes from the key
+    return send_file(cached, mimetype='image/webp', conditional=True,
+                     etag=os.path.splitext(os.path.basename(cached))[0],
+                     last_modified=stat.st_mtime, max_age=app.get_send_file_max_age(filename))
+
+# Routes
+@app.route('/')
+@conditional_page(cached=True)
+def home():
+    return render_template('home.html')
+
+@app.route('/o-nas')
+@conditional_page(cached=True)
+def about():
+    return render_template('about.html')
+
+@app.route('/sad')
+@conditional_page(cached=True)
+def orchard():
+    return render_template('orchard.html')
+
+@app.route('/les')
+@conditional_page(cached=True)
+def forest():
+    return render_template('forest.html')
+
+@app.route('/gallery')
+@conditional_page(include_gallery=True)
+def gallery():
+    # Albums are read-only views over the shared gallery manifest; the filesystem
+    # is only rescanned when the gallery or an album directory changes.
+    # Album contents are loaded on demand through /api/gallery/albums/<name>
+    folders = gallery_index.albums()
+    placeholders = gallery_placeholders([folder.cover_image for folder in folders])
+    return render_template("gallery.html", folders=folders, placeholders=placeholders)
+
+def encode_gallery_cursor(position: int, path: str) -> str:
+    """Encode pagination position together with the last returned image path."""
+    raw = f"{position}:{path}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_gallery_cursor(cursor: str | None, images) -> int:
+    """
+    Decode cursor into a start position within the album image list.
+    
+    If images were added or removed since the cursor was issued, the position
+    is re-anchored on the last returned image path.
+    
+    Args:
+        cursor: Cursor returned by a previous page (or None for the first page)
+        images: Ordered album image paths
+        
+    Returns:
+        int: Index of the first image of the requested page
+    """
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        position, path = raw.split(':', 1)
+        position = int(position)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+    
+    if 0 < position <= len(images) and images[position - 1] == path:
+        return position
+    for index, image_path in enumerate(images):
+        if image_path == path:
+            return index + 1
+    return min(max(position, 0), len(images))
+
+def paginate_album_images(normalized_name: str, cursor: str | None = None, limit: int | None = None):
+    """
+    Get one page of album images from the gallery index.
+    
+    Args:
+        normalized_name: Album folder name
+        cursor: Cursor from the previous page
+        limit: Page size (clamped to 1..100)
         
-        # For albums without clear year, put them at the end
-        return (2, 9999, 0)
+    Returns:
+        tuple: (album, list of image records, next cursor or None); album is None if not found
+    """
+    album = gallery_index.album(normalized_name)
+    if album is None:
+        return None, [], None
+    
+    limit = min(max(limit or app.config.get('GALLERY_PAGE_SIZE', 24), 1), 100)
+    images = album.images
+    start = decode_gallery_cursor(cursor, images)
+    page = gallery_index.records(album, start, start + limit)
+    end = start + len(page)
+    next_cursor = encode_gallery_cursor(end, page[-1].path) if page and end < len(images) else None
+    return album, page, next_cursor
+
+def gallery_placeholders(paths) -> dict[str, str]:
+    """
+    Blurred placeholders of gallery files in one query (the index has no database columns).
+
+    Returns:
+        dict: gallery path -> data URI, only for files that have one
+    """
+    paths = [path for path in paths if path]
+    if not paths:
+        return {}
+    rows = db.session.query(GalleryImage.filename, GalleryImage.placeholder).filter(
+        GalleryImage.filename.in_(paths), GalleryImage.placeholder.isnot(None)
+    ).all()
+    return {filename: placeholder for filename, placeholder in rows}
+
+def serialize_gallery_image(record, placeholder: str | None = None) -> dict:
+    """Build JSON representation of a gallery file."""
+    data = {
+        'src': url_for('static', filename=record.path),
+        'type': 'video' if record.path.lower().endswith('.mp4') else 'image'
+    }
+    if placeholder:
+        data['placeholder'] = placeholder
+    if record.width and record.height:
+        # Lets the client reserve the box before the file arrives
+        data['width'], data['height'] = record.width, record.height
+    if data['type'] == 'video':
+        poster = video_poster(record)
+        if poster:
+            data['poster'] = poster
+        sources = video_sources(record)
+        if sources:
+            data['sources'] = sources
+        return data
+    srcset = image_srcset(record)
+    if srcset:
+        data['srcset'] = srcset
+    return data
+
+@app.route('/api/gallery/albums')
+def api_gallery_albums():
+    """Album summaries for the gallery page."""
+    folders = gallery_index.albums()
+    placeholders = gallery_placeholders([album.cover_image for album in folders])
+    albums = []
+    for album in folders:
+        albums.append({
+            'name': album.name,
+            'normalized_name': album.normalized_name,
+            'cover_image': url_for('static', filename=album.cover_image),
+            'cover_placeholder': placeholders.get(album.cover_image),
+            'image_count': len(album.images),
+            'images_url': url_for('api_gallery_album', normalized_name=album.normalized_name),
+            'page_url': url_for('gallery_album', normalized_name=album.normalized_name)
+        })
+    return jsonify({'albums': albums})
+
+@app.route('/api/gallery/albums/<path:normalized_name>')
+def api_gallery_album(normalized_name):
+    """One page of album images with cursor pagination."""
+    try:
+        album, page, next_cursor = paginate_album_images(
+            normalized_name,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if album is None:
+        return jsonify({'error': 'Album not found'}), 404
     
-    albums = sorted(albums, key=sort_key)
+    placeholders = gallery_placeholders([record.path for record in page])
+    return jsonify({
+        'album': {
+            'name': album.name,
+            'normalized_name': album.normalized_name,
+            'image_count': len(album.images)
+        },
+        'images': [serialize_gallery_image(record, placeholders.get(record.path)) for record in page],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/gallery/<path:normalized_name>')
+def gallery_album(normalized_name):
+    """Server-rendered album page using the same paginated query as the API."""
+    try:
+        album, page, next_cursor = paginate_album_images(normalized_name, cursor=request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('gallery_album', normalized_name=normalized_name))
     
-    return render_template("gallery.html", folders=albums)
+    if album is None:
+        abort(404)
+    
+    placeholders = gallery_placeholders([record.path for record in page])
+    images = [{'filename': record.path, 'srcset': image_srcset(record), 'title': album.name,
+               'poster': video_poster(record), 'sources': video_sources(record),
+               'placeholder': placeholders.get(record.path),
+               'width': record.width or None, 'height': record.height or None}
+              for record in page]
+    return render_template(
+        'gallery_album.html',
+        album=album.name,
+        normalized_name=album.normalized_name,
+        images=images,
+        next_cursor=next_cursor
+    )
 
 @app.route('/kontakt', methods=['GET', 'POST'])
 def contact():
@@ -717,13 +1646,6 @@ def upload_image():
     log_function_call(upload_logger, 'upload_image', method=request.method)
     
     if request.method == 'POST':
-        # Check dependencies only when attempting upload
-        deps_ok, missing = check_system_dependencies()
-        if not deps_ok:
-            error_msg = f"Image processing dependencies are missing: {', '.join(missing)}"
-            upload_logger.error(error_msg)
-            return jsonify({'success': False, 'error': f'Image processing error: {error_msg}. Please install required dependencies.'})
-        
         try:
             upload_logger.info("Received POST request to /admin/upload")
             upload_logger.info(f"Request headers: {dict(request.headers)}")
@@ -757,302 +1679,1784 @@ def upload_image():
                     log_exception(upload_logger, validation_error, f'validating file {file.filename}')
                     return jsonify({'success': False, 'error': f'Validation error: {str(validation_error)}'})
 
-                upload_logger.info(f"File validation complete: {secure_name}")
-                
-                # Album name validation and normalization
-                try:
-                    album_name = form.new_album.data.strip() if form.new_album.data else form.album.data
-                    
-                    if not album_name:
-                        error_msg = 'Vyberte album nebo zadejte název nového alba.'
-                        upload_logger.error(error_msg)
-                        return jsonify({'success': False, 'error': error_msg})
-                    
-                    # Normalize album name using our validator
-                    album_name = file_validator.normalize_czech_filename(album_name)
-                    # Additional cleanup for directory names
-                    album_name = re.sub(r'[<>:"|?*]', '', album_name)  # Remove forbidden characters
-                    album_name = album_name.strip()
-                    
-                    if not album_name:
-                        error_msg = 'Invalid album name after normalization.'
-                        upload_logger.error(f"Album name normalization failed for: {form.new_album.data}")
-                        return jsonify({'success': False, 'error': error_msg})
-                    
-                    upload_logger.info(f"Album name validated: {album_name}")
-                    
-                except Exception as album_error:
-                    log_exception(upload_logger, album_error, 'validating album name')
-                    return jsonify({'success': False, 'error': f'Album name validation error: {str(album_error)}'})
-                
-                # Create album directory
-                try:
-                    album_path = os.path.join('static', 'images', 'gallery', album_name)
-                    os.makedirs(album_path, exist_ok=True)
-                    upload_logger.info(f"Album directory created/verified: {album_path}")
-                except Exception as dir_error:
-                    log_exception(upload_logger, dir_error, f'creating album directory {album_path}')
-                    return jsonify({'success': False, 'error': f'Failed to create album directory: {str(dir_error)}'})
-                
-                # Single file processing
-                try:
-                    upload_logger.info(f"Processing single file: {file.filename}")
-                    
-                    # Notify about processing start
-                    send_progress_update(secure_name, 'processing')
-                    
-                    # Get file extension
-                    _, ext = os.path.splitext(file.filename)
-                    ext = ext.lower()
-                    
-                    # Save file temporarily
-                    temp_path = os.path.join(album_path, secure_name)
-                    try:
-                        file.save(temp_path)
-                        log_file_operation(upload_logger, 'save', secure_name, 'success', f'Saved to {temp_path}')
-                    except Exception as save_error:
-                        log_exception(upload_logger, save_error, f'saving file {secure_name}')
-                        send_progress_update(secure_name, 'failed')
-                        return jsonify({'success': False, 'error': f'Save error: {str(save_error)}'})
-                    
+                upload_logger.info(f"File validation complete: {secure_name}")
+                
+                # Album name validation and normalization
+                try:
+                    album_name, album_display_name = resolve_upload_album(form)
+                except ValueError as album_error:
+                    upload_logger.error(f"Album name validation failed: {album_error}")
+                    return jsonify({'success': False, 'error': str(album_error)})
+                except Exception as album_error:
+                    log_exception(upload_logger, album_error, 'validating album name')
+                    return jsonify({'success': False, 'error': f'Album name validation error: {str(album_error)}'})
+                
+                # Stage the upload outside the gallery; conversion runs in the job worker
+                try:
+                    staging_dir = app.config['UPLOAD_STAGING_DIR']
+                    os.makedirs(staging_dir, exist_ok=True)
+                    staged_path = os.path.join(staging_dir, f"{uuid.uuid4().hex}_{secure_name}")
+                    content_hash = stage_upload(file.stream, staged_path)
+                    log_file_operation(upload_logger, 'save', secure_name, 'success', f'Staged to {staged_path} (sha256 {content_hash})')
+                except Exception as save_error:
+                    log_exception(upload_logger, save_error, f'staging file {secure_name}')
+                    send_progress_update(secure_name, 'failed')
+                    return jsonify({'success': False, 'error': f'Save error: {str(save_error)}'})
+                
+                title = form.title.data or os.path.splitext(secure_name)[0]
+                return accept_staged_upload(staged_path, secure_name, content_hash, album_name,
+                                            album_display_name, title, form.description.data)
+            else:
+                # Form validation failed
+                errors = []
+                for field, field_errors in form.errors.items():
+                    for error in field_errors:
+                        errors.append(f"{field}: {error}")
+                upload_logger.error(f"Form validation failed: {errors}")
+                return jsonify({'success': False, 'error': 'Validation error: ' + '; '.join(errors)})
+        except Exception as e:
+            log_exception(upload_logger, e, 'upload_image')
+            return jsonify({'success': False, 'error': f'Unexpected error: {str(e)}'})
+    else:
+        # GET request - show upload form
+        upload_logger.info("Received GET request to /admin/upload")
+        form = ImageUploadForm()
+        return render_template('upload.html', form=form)
+
+def resolve_upload_album(form) -> tuple[str, str]:
+    """
+    Normalize the target album of an upload form into a directory name.
+
+    Returns:
+        tuple: (normalized directory name, display name)
+
+    Raises:
+        ValueError: No album selected or nothing left after normalization
+    """
+    display_name = form.new_album.data.strip() if form.new_album.data else form.album.data
+    if not display_name:
+        raise ValueError('Vyberte album nebo zadejte název nového alba.')
+
+    # Normalize album name using our validator
+    album_name = file_validator.normalize_czech_filename(display_name)
+    # Additional cleanup for directory names
+    album_name = re.sub(r'[<>:"|?*]', '', album_name).strip()  # Remove forbidden characters
+    if not album_name:
+        raise ValueError('Invalid album name after normalization.')
+
+    upload_logger.info(f"Album name validated: {album_name}")
+    return album_name, display_name
+
+def accept_staged_upload(staged_path: str, secure_name: str, content_hash: str, album_name: str,
+                         album_display_name: str, title: str, description: str | None):
+    """
+    Hand a fully staged upload over to the gallery.
+
+    A known content hash is resolved immediately (200); anything else is
+    queued for conversion (202 with the job status URL).
+
+    Returns:
+        Flask response tuple
+    """
+    # The same original was uploaded before: skip the conversion
+    existing = GalleryImage.query.filter_by(content_hash=content_hash).first()
+    if existing is not None:
+        try:
+            image, linked = link_duplicate_image(existing, album_name, album_display_name,
+                                                 title, description)
+        except Exception as link_error:
+            log_exception(upload_logger, link_error, f'linking duplicate {secure_name}')
+            db.session.rollback()
+            send_progress_update(secure_name, 'failed')
+            return jsonify({'success': False, 'error': f'Save error: {str(link_error)}'})
+        finally:
+            os.remove(staged_path)
+
+        upload_logger.info(f"Duplicate upload {secure_name} matches {existing.filename}")
+        send_progress_update(secure_name, 'completed')
+        return jsonify({
+            'success': True,
+            'duplicate': True,
+            'linked': linked,
+            'image_id': image.id,
+            'path': image.filename,
+            'filename': secure_name,
+            'message': f'Soubor {secure_name} už v galerii je'
+        })
+
+    try:
+        job = enqueue_job('gallery_upload', {
+            'staged_path': staged_path,
+            'secure_name': secure_name,
+            'content_hash': content_hash,
+            'album_name': album_name,
+            'album_display_name': album_display_name,
+            'title': title,
+            'description': description
+        })
+    except Exception as queue_error:
+        log_exception(database_logger, queue_error, f'queueing upload {secure_name}')
+        db.session.rollback()
+        try:
+            os.remove(staged_path)
+        except OSError:
+            pass
+        send_progress_update(secure_name, 'failed')
+        return jsonify({'success': False, 'error': f'Save error: {str(queue_error)}'})
+
+    upload_logger.info(f"Upload queued as job {job.id}: {secure_name}")
+    send_progress_update(secure_name, 'queued', job_id=job.id)
+
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('job_status', id=job.id),
+        'filename': secure_name,
+        'message': f'Soubor {secure_name} přijat ke zpracování'
+    }), 202
+
+@app.route('/admin/upload/batch', methods=['POST'])
+def upload_batch():
+    """
+    Upload many files in one request.
+
+    The form and album are validated once, every file is staged and hashed,
+    duplicates are looked up with one query, and the link rows and conversion
+    jobs of all files are committed in one transaction.
+
+    Returns:
+        JSON with a result per file (queued, duplicate or error); 202 when any
+        file was queued for conversion
+    """
+    log_function_call(upload_logger, 'upload_batch')
+
+    form = BatchUploadForm()
+    if not form.validate_on_submit():
+        errors = [f"{field}: {error}" for field, field_errors in form.errors.items() for error in field_errors]
+        upload_logger.error(f"Batch upload validation failed: {errors}")
+        return jsonify({'success': False, 'error': 'Validation error: ' + '; '.join(errors)}), 400
+
+    files = [file for file in request.files.getlist('images') if file and file.filename]
+    if not files:
+        return jsonify({'success': False, 'error': 'No file selected for upload'}), 400
+
+    try:
+        album_name, album_display_name = resolve_upload_album(form)
+    except ValueError as album_error:
+        return jsonify({'success': False, 'error': str(album_error)}), 400
+
+    staging_dir = app.config['UPLOAD_STAGING_DIR']
+    os.makedirs(staging_dir, exist_ok=True)
+
+    results = []
+    staged = []  # (result, staged_path, secure_name, content_hash)
+    for file in files:
+        result = {'filename': file.filename, 'success': False}
+        results.append(result)
+        if file.filename.startswith('.'):
+            result.update(status='error', error='Hidden files are not supported')
+            continue
+        is_valid, secure_name, error_msg = file_validator.validate_file(file.filename)
+        if not is_valid:
+            result.update(status='error', error=f'Invalid file: {error_msg}')
+            continue
+        staged_path = os.path.join(staging_dir, f"{uuid.uuid4().hex}_{secure_name}")
+        try:
+            content_hash = stage_upload(file.stream, staged_path)
+        except Exception as save_error:
+            log_exception(upload_logger, save_error, f'staging file {secure_name}')
+            result.update(status='error', error=f'Save error: {str(save_error)}')
+            continue
+        result['filename'] = secure_name
+        staged.append((result, staged_path, secure_name, content_hash))
+
+    upload_logger.info(f"Batch staged {len(staged)} of {len(files)} files for album {album_name}")
+
+    queued, linked_any, linked_files = [], False, []
+    if staged:
+        try:
+            existing = {image.content_hash: image for image in GalleryImage.query.filter(
+                GalleryImage.content_hash.in_([item[3] for item in staged])
+            )}
+            album = None
+            batch_hashes = {}
+            for result, staged_path, secure_name, content_hash in staged:
+                title = form.title.data or os.path.splitext(secure_name)[0]
+                if content_hash in existing:
+                    if album is None:
+                        album = create_album_if_not_exists(album_name, album_display_name, commit=False)
+                    image, linked = link_duplicate_image(existing[content_hash], album_name, album_display_name,
+                                                         title, form.description.data, album=album, commit=False)
+                    linked_any = linked_any or linked
+                    if linked:
+                        linked_files.append(image.filename)
+                    result.update(success=True, status='duplicate', duplicate=True, linked=linked,
+                                  image_id=image.id, path=image.filename)
+                elif content_hash in batch_hashes:
+                    # The same file twice in one batch is converted once
+                    result.update(success=True, status='duplicate', duplicate=True, linked=False,
+                                  duplicate_of=batch_hashes[content_hash])
+                else:
+                    job = enqueue_job('gallery_upload', {
+                        'staged_path': staged_path,
+                        'secure_name': secure_name,
+                        'content_hash': content_hash,
+                        'album_name': album_name,
+                        'album_display_name': album_display_name,
+                        'title': title,
+                        'description': form.description.data
+                    }, commit=False)
+                    batch_hashes[content_hash] = secure_name
+                    queued.append((result, job, secure_name))
+                    continue
+                os.remove(staged_path)
+            db.session.commit()
+        except Exception as batch_error:
+            log_exception(database_logger, batch_error, f'committing upload batch for {album_name}')
+            db.session.rollback()
+            for filename in linked_files:
+                release_gallery_filename(filename)
+            for _, staged_path, _, _ in staged:
+                if os.path.exists(staged_path):
+                    os.remove(staged_path)
+            return jsonify({'success': False, 'error': f'Save error: {str(batch_error)}'}), 500
+
+    for result, job, secure_name in queued:
+        result.update(success=True, status='queued', job_id=job.id,
+                      status_url=url_for('job_status', id=job.id))
+        send_progress_update(secure_name, 'queued', job_id=job.id)
+    if queued:
+        wake_job_worker()
+    if linked_any:
+        refresh_gallery()
+
+    summary = {status: sum(1 for result in results if result['status'] == status)
+               for status in ('queued', 'duplicate', 'error')}
+    upload_logger.info(f"Batch upload to {album_name} finished: {summary}")
+    return jsonify({'success': True, 'album': album_name, 'results': results, **summary}), 202 if queued else 200
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def stage_upload(stream, staged_path: str) -> str:
+    """
+    Copy an upload stream to the staging file, hashing it on the way.
+
+    Args:
+        stream: Readable binary stream (FileStorage.stream)
+        staged_path: Target staging file
+
+    Returns:
+        str: SHA-256 hex digest of the content
+    """
+    sha = hashlib.sha256()
+    with open(staged_path, 'wb') as staged:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+            staged.write(chunk)
+    return sha.hexdigest()
+
+# Incremental SHA-256 of chunked uploads: session id -> (hashed bytes, hash object).
+# Rebuilt from the part file when a chunk lands in another process or after a restart.
+upload_hashers = {}
+upload_hashers_lock = threading.Lock()
+
+def upload_part_path(upload: UploadSession) -> str:
+    """Staging file receiving the chunks of an upload session."""
+    return os.path.join(app.config['UPLOAD_STAGING_DIR'], f"{upload.id}.part")
+
+def upload_offset(upload: UploadSession) -> int:
+    """Bytes of an upload session received so far."""
+    try:
+        return os.path.getsize(upload_part_path(upload))
+    except OSError:
+        return 0
+
+def upload_hasher(upload: UploadSession, offset: int):
+    """Hash object covering the first offset bytes of the session's part file."""
+    with upload_hashers_lock:
+        entry = upload_hashers.pop(upload.id, None)
+    if entry is not None and entry[0] == offset:
+        return entry[1]
+
+    sha = hashlib.sha256()
+    with open(upload_part_path(upload), 'rb') as part:
+        remaining = offset
+        while remaining:
+            chunk = part.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            sha.update(chunk)
+            remaining -= len(chunk)
+    upload_logger.info(f"Rebuilt hash of upload {upload.id} from {offset} staged bytes")
+    return sha
+
+def upload_session_state(upload: UploadSession, status: int = 200):
+    """JSON state of an upload session with the Upload-Offset header."""
+    offset = upload_offset(upload)
+    response = jsonify({
+        'id': upload.id,
+        'filename': upload.filename,
+        'offset': offset,
+        'size': upload.size,
+        'upload_url': url_for('upload_session', id=upload.id),
+        'finalize_url': url_for('finalize_upload_session', id=upload.id)
+    })
+    response.status_code = status
+    response.headers['Upload-Offset'] = str(offset)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def remove_upload_session(upload: UploadSession):
+    """Delete an upload session and its part file."""
+    with upload_hashers_lock:
+        upload_hashers.pop(upload.id, None)
+    try:
+        os.remove(upload_part_path(upload))
+    except OSError:
+        pass
+    db.session.delete(upload)
+    db.session.commit()
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """
+    Start a resumable upload: validate the file name, size and album, and
+    return the session URLs. Chunks are then sent with PATCH to upload_url.
+    """
+    log_function_call(upload_logger, 'create_upload_session')
+
+    form = UploadSessionForm()
+    if not form.validate_on_submit():
+        errors = [f"{field}: {error}" for field, field_errors in form.errors.items() for error in field_errors]
+        upload_logger.error(f"Upload session validation failed: {errors}")
+        return jsonify({'success': False, 'error': 'Validation error: ' + '; '.join(errors)}), 400
+
+    original_name = form.filename.data
+    if original_name.startswith('.'):
+        return jsonify({'success': False, 'error': 'Hidden files are not supported'}), 400
+    is_valid, secure_name, error_msg = file_validator.validate_file(original_name)
+    if not is_valid:
+        upload_logger.error(f"File validation failed: {error_msg}")
+        return jsonify({'success': False, 'error': f'Invalid file: {error_msg}'}), 400
+
+    size = form.size.data
+    max_size = app.config.get('MAX_CONTENT_LENGTH')
+    if size <= 0 or (max_size and size > max_size):
+        return jsonify({'success': False, 'error': f'Invalid file size: {size}'}), 413
+
+    try:
+        album_name, album_display_name = resolve_upload_album(form)
+    except ValueError as album_error:
+        return jsonify({'success': False, 'error': str(album_error)}), 400
+
+    upload = UploadSession(secure_name, size, album_name, album_display_name,
+                           form.title.data or os.path.splitext(secure_name)[0], form.description.data)
+    os.makedirs(app.config['UPLOAD_STAGING_DIR'], exist_ok=True)
+    open(upload_part_path(upload), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+
+    upload_logger.info(f"Upload session {upload.id} created: {secure_name} ({size} bytes) -> {album_name}")
+    return upload_session_state(upload, 201)
+
+@app.route('/api/uploads/<id>', methods=['GET', 'PATCH', 'DELETE'])
+def upload_session(id):
+    """
+    GET returns the received offset (to resume after a failure), PATCH appends
+    the request body at the Upload-Offset header, DELETE aborts the upload.
+    """
+    upload = db.session.get(UploadSession, id)
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+
+    if request.method == 'GET':
+        return upload_session_state(upload)
+
+    if request.method == 'DELETE':
+        remove_upload_session(upload)
+        upload_logger.info(f"Upload session {id} aborted")
+        return '', 204
+
+    try:
+        client_offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'Missing or invalid Upload-Offset header'}), 400
+
+    part_path = upload_part_path(upload)
+    with open(part_path, 'ab') as part:
+        try:
+            # One writer per session, also across gunicorn workers
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return jsonify({'success': False, 'error': 'Another chunk is being written',
+                            'offset': upload_offset(upload)}), 409
+
+        offset = part.seek(0, os.SEEK_END)
+        if client_offset != offset:
+            return jsonify({'success': False, 'error': 'Offset mismatch', 'offset': offset}), 409
+
+        # The body is read from the socket straight into the part file
+        sha = upload_hasher(upload, offset)
+        remaining = upload.size - offset
+        try:
+            while True:
+                chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(chunk) > remaining:
+                    part.truncate(offset)
+                    return jsonify({'success': False, 'error': 'Chunk exceeds the announced size',
+                                    'offset': offset}), 413
+                part.write(chunk)
+                sha.update(chunk)
+                offset += len(chunk)
+                remaining -= len(chunk)
+        except Exception as e:
+            # Interrupted chunk: keep what arrived, the client resumes from GET offset
+            part.flush()
+            log_exception(upload_logger, e, f'receiving chunk of upload {id}')
+            return jsonify({'success': False, 'error': 'Chunk interrupted', 'offset': part.tell()}), 400
+        part.flush()
+
+    with upload_hashers_lock:
+        upload_hashers[upload.id] = (offset, sha)
+    upload.updated_at = datetime.now()
+    db.session.commit()
+    return upload_session_state(upload)
+
+@app.route('/api/uploads/<id>/finalize', methods=['POST'])
+def finalize_upload_session(id):
+    """Hand a completely received upload over to the gallery (same response as /admin/upload)."""
+    log_function_call(upload_logger, 'finalize_upload_session', id=id)
+
+    upload = db.session.get(UploadSession, id)
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+
+    offset = upload_offset(upload)
+    if offset != upload.size:
+        return jsonify({'success': False, 'error': 'Upload is incomplete', 'offset': offset}), 409
+
+    content_hash = upload_hasher(upload, offset).hexdigest()
+    # Same directory, so the staged file is renamed rather than copied
+    staged_path = os.path.join(app.config['UPLOAD_STAGING_DIR'], f"{upload.id}_{upload.filename}")
+    os.replace(upload_part_path(upload), staged_path)
+    details = (upload.filename, upload.album_name, upload.album_display_name, upload.title, upload.description)
+    remove_upload_session(upload)
+    log_file_operation(upload_logger, 'save', upload.filename, 'success',
+                       f'Staged to {staged_path} (sha256 {content_hash})')
+
+    secure_name, album_name, album_display_name, title, description = details
+    return accept_staged_upload(staged_path, secure_name, content_hash, album_name,
+                                album_display_name, title, description)
+
+def expire_upload_sessions(max_age: int | None = None) -> int:
+    """
+    Remove upload sessions that received no chunk for max_age seconds.
+
+    Args:
+        max_age: Seconds of inactivity (defaults to UPLOAD_SESSION_TTL)
+
+    Returns:
+        int: Number of removed sessions
+    """
+    max_age = max_age if max_age is not None else app.config.get('UPLOAD_SESSION_TTL', 86400)
+    cutoff = datetime.now() - timedelta(seconds=max_age)
+    expired = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in expired:
+        remove_upload_session(upload)
+    if expired:
+        upload_logger.info(f"Expired {len(expired)} abandoned upload sessions")
+    return len(expired)
+
+def link_duplicate_image(existing: GalleryImage, album_name: str, album_display_name: str,
+                         title: str | None, description: str | None,
+                         album: Album | None = None, commit: bool = True) -> tuple[GalleryImage, bool]:
+    """
+    Make an already stored image appear in the target album without converting it again.
+
+    The WebP and its derivatives are hard-linked into the album. The link row
+    has no content_hash (the hash stays unique to the original).
+
+    Args:
+        existing: Image with the same content hash
+        album_name: Normalized target album name
+        album_display_name: Display name for a new album
+        title: Title for the linked image
+        description: Description for the linked image
+        album: Already resolved target album (batch uploads)
+        commit: Commit and refresh the gallery now; with False the row is only
+                flushed and the caller commits
+
+    Returns:
+        tuple: (image in the target album, whether a new link was created)
+    """
+    log_function_call(upload_logger, 'link_duplicate_image', image_id=existing.id, album=album_name)
+
+    if os.path.basename(os.path.dirname(existing.filename)) == album_name:
+        return existing, False
+
+    basename = os.path.basename(existing.filename)
+    stem, ext = os.path.splitext(basename)
+    source_path = os.path.join('static', existing.filename)
+    # Linked earlier (a retried job or a repeated upload): the row points at the same bytes
+    for candidate in (basename, f"{stem}-{existing.content_hash[:8]}{ext}"):
+        filename = os.path.join('images', 'gallery', album_name, candidate)
+        linked = GalleryImage.query.filter_by(filename=filename).first()
+        if linked is not None and same_file(source_path, os.path.join('static', filename)):
+            return linked, False
+
+    # Another image may already use this name in the target album
+    os.makedirs(os.path.join('static', 'images', 'gallery', album_name), exist_ok=True)
+    filename = claim_gallery_filename(album_name, basename, existing.content_hash)
+    target_path = os.path.join('static', filename)
+    # The link replaces the empty file that reserved the name
+    tmp_path = f'{target_path}.{uuid.uuid4().hex}.tmp'
+    link_file(source_path, tmp_path)
+    os.replace(tmp_path, target_path)
+    # Derivatives, video posters and variants, and AVIF versions; files left under
+    # the reserved name by a removed image are replaced
+    for source, target in zip(derivative_files(existing.filename), derivative_files(filename)):
+        source, target = os.path.join('static', source), os.path.join('static', target)
+        if os.path.exists(source):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+            link_file(source, tmp_path)
+            os.replace(tmp_path, target)
+
+    if album is None:
+        album = create_album_if_not_exists(album_name, album_display_name)
+    image = GalleryImage(
+        filename=filename,
+        title=title,
+        description=description,
+        date=existing.date,
+        original_date=existing.original_date,
+        album_id=album.id,
+    )
+    image.derivative_widths = existing.derivative_widths
+    image.video_variants = existing.video_variants
+    image.placeholder = existing.placeholder
+    image.width, image.height, image.file_size = existing.width, existing.height, existing.file_size
+    image.original, image.output_spec = existing.original, existing.output_spec
+    if existing.image_metadata is not None:
+        image.image_metadata = existing.image_metadata.copy()
+    db.session.add(image)
+    if not commit:
+        db.session.flush()
+        return image, True
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        release_gallery_filename(filename)
+        raise
+    log_file_operation(upload_logger, 'link', filename, 'success', f'Duplicate of {existing.filename}')
+
+    refresh_gallery()
+    return image, True
+
+def prepare_gallery_video(staged_path: str, final_path: str) -> video_processor.VideoInfo | None:
+    """
+    Store an uploaded video in the gallery, remuxed with faststart when ffmpeg is available.
+
+    The remux only rewrites the container (the moov atom goes first, so playback
+    starts before the whole file is downloaded); the staged original is kept
+    until the job commits, so a retry can remux again.
+
+    Returns:
+        VideoInfo from ffprobe, or None when the video was stored unchanged
+        (ffmpeg not installed, unreadable container or a retried move)
+    """
+    if not os.path.exists(staged_path):
+        return None
+    if video_processor.VIDEO_SUPPORTED:
+        try:
+            video = video_processor.probe_video(staged_path)
+            video_processor.remux_faststart(staged_path, final_path)
+            return video
+        except video_processor.VideoProcessingError as e:
+            processing_logger.warning(f"Storing video without faststart remux: {os.path.basename(final_path)} ({e})")
+    # The staging directory may be on another filesystem
+    shutil.move(staged_path, final_path)
+    log_file_operation(upload_logger, 'move', os.path.basename(final_path), 'success', f'Video moved to {final_path}')
+    return None
+
+def write_video_poster(filename: str, duration: float = 0.0) -> tuple[int, ...]:
+    """
+    Write the poster frame ladder of a gallery video next to the image derivatives.
+
+    Returns:
+        tuple: Poster widths, empty when the frame could not be extracted
+    """
+    album_name = os.path.basename(os.path.dirname(filename))
+    try:
+        return video_processor.write_poster(os.path.join('static', filename),
+                                            os.path.join(DERIVATIVES_ROOT, album_name), duration)
+    except video_processor.VideoProcessingError as e:
+        processing_logger.warning(f"No poster for video {filename}: {e}")
+        return ()
+
+def poster_placeholder(filename: str, poster_widths: tuple[int, ...]) -> str | None:
+    """Placeholder of a video, read from its smallest poster frame."""
+    if not poster_widths:
+        return None
+    try:
+        return image_processor.placeholder_from_file(
+            os.path.join('static', derivative_path(filename, min(poster_widths))))
+    except image_processor.ImageProcessingError:
+        return None
+
+def claim_gallery_filename(album_name: str, name: str, content_hash: str | None) -> str:
+    """
+    Reserve a gallery path for a new upload that no row and no file uses yet.
+
+    The file is created empty with O_EXCL, so concurrent jobs never convert into
+    the same path; the conversion then writes over it. A taken name gets the
+    `-<hash[:8]>` suffix link_duplicate_image() uses (then a counter).
+
+    Returns:
+        str: Reserved path relative to static/
+    """
+    stem, ext = os.path.splitext(name)
+    suffix = content_hash[:8] if content_hash else uuid.uuid4().hex[:8]
+    attempt = 0
+    while True:
+        candidate = name if attempt == 0 else f"{stem}-{suffix}{ext}" if attempt == 1 else f"{stem}-{suffix}-{attempt}{ext}"
+        attempt += 1
+        filename = os.path.join('images', 'gallery', album_name, candidate)
+        if GalleryImage.query.filter_by(filename=filename).first() is not None:
+            continue
+        try:
+            os.close(os.open(os.path.join('static', filename), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        if attempt > 1:
+            upload_logger.info(f"Gallery name {name} is taken in {album_name}, storing as {candidate}")
+        return filename
+
+def release_gallery_filename(filename: str):
+    """Delete a reserved gallery path and whatever a failed conversion wrote there."""
+    try:
+        os.remove(os.path.join('static', filename))
+    except FileNotFoundError:
+        pass
+    remove_derivatives(filename)
+
+def process_gallery_upload(payload: dict) -> dict:
+    """
+    Convert a staged upload into the gallery and create its database record.
+
+    Runs in the job worker. Safe to retry: the staged original is removed only
+    after the database commit.
+
+    Args:
+        payload: Job payload created by upload_image()
+
+    Returns:
+        dict: Job result with the stored gallery path and image id
+    """
+    log_function_call(processing_logger, 'process_gallery_upload', file=payload['secure_name'])
+
+    staged_path = payload['staged_path']
+    secure_name = payload['secure_name']
+    album_name = payload['album_name']
+    content_hash = payload.get('content_hash')
+    album_path = os.path.join('static', 'images', 'gallery', album_name)
+
+    # An identical upload queued earlier may have finished in the meantime
+    existing = GalleryImage.query.filter_by(content_hash=content_hash).first() if content_hash else None
+    if existing is not None:
+        return link_duplicate_upload(existing, payload)
+
+    os.makedirs(album_path, exist_ok=True)
+
+    video = None
+    stem, ext = os.path.splitext(secure_name)
+    # A different file with the same name may already be in the album
+    name = secure_name if ext.lower() == '.mp4' else stem + '.webp'
+    filename = claim_gallery_filename(album_name, name, content_hash)
+    try:
+        if ext.lower() == '.mp4':
+            video = prepare_gallery_video(staged_path, os.path.join('static', filename))
+            image_date = (video and video.taken_at) or datetime.now()
+            metadata = media_metadata.video_metadata(video) if video is not None else None
+            derivative_widths = placeholder = None
+            dimensions = (video.width, video.height) if video is not None else (None, None)
+            if video is not None:
+                poster_widths = write_video_poster(filename, video.duration)
+                derivative_widths = ','.join(map(str, poster_widths)) or None
+                placeholder = poster_placeholder(filename, poster_widths)
+        else:
+            source_path = staged_path
+            if not image_processor.can_process(staged_path):
+                # process_image.sh derives the album and output name from the input path
+                source_path = os.path.join(album_path, os.path.splitext(os.path.basename(filename))[0] + ext)
+                shutil.copyfile(staged_path, source_path)
+            try:
+                processed = process_uploaded_image(
+                    source_path, os.path.join('static', filename),
+                    derivatives_dir=os.path.join(DERIVATIVES_ROOT, album_name)
+                )
+            finally:
+                if source_path != staged_path and os.path.exists(source_path):
+                    os.remove(source_path)
+            # EXIF was read in the same decode pass; the script fallback only runs for
+            # files Pillow cannot open, so there is nothing to re-read either
+            metadata = processed.metadata if processed else None
+            # Jobs are always queued with the hash computed while staging
+            original = store_original(staged_path, content_hash) if content_hash else None
+            image_date = (metadata and metadata['taken_at']) or datetime.now()
+            derivative_widths = ','.join(map(str, processed.derivatives)) if processed else None
+            # Made from the same decoded frame; the script fallback gets one from the backfill
+            placeholder = processed.placeholder if processed else None
+            dimensions = ((processed.width, processed.height) if processed
+                          else read_media_dimensions(os.path.join('static', filename)))
+    except Exception:
+        # A retry claims the name again
+        release_gallery_filename(filename)
+        raise
+
+    album = create_album_if_not_exists(album_name, payload['album_display_name'])
+    gallery_image = GalleryImage(
+        filename=filename,
+        title=payload['title'],
+        description=payload['description'],
+        date=image_date,
+        original_date=image_date,
+        album_id=album.id,
+    )
+    gallery_image.derivative_widths = derivative_widths
+    gallery_image.content_hash = content_hash
+    gallery_image.placeholder = placeholder
+    gallery_image.width, gallery_image.height = dimensions
+    gallery_image.file_size = os.path.getsize(os.path.join('static', filename))
+    if metadata:
+        gallery_image.image_metadata = ImageMetadata(metadata)
+    if video is None:
+        gallery_image.original = original
+        # Script output does not follow the spec: a rebuild redoes it once Pillow can read the original
+        gallery_image.output_spec = current_output_spec() if processed else None
+    db.session.add(gallery_image)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existing = GalleryImage.query.filter_by(content_hash=content_hash).first() if content_hash else None
+        if existing is not None:
+            # A concurrent job stored the same content first: drop this copy and link to it
+            if existing.filename != filename and GalleryImage.query.filter_by(filename=filename).first() is None:
+                release_gallery_filename(filename)
+            return link_duplicate_upload(existing, payload)
+        if GalleryImage.query.filter_by(filename=filename).first() is None:
+            raise
+        # A row for the claimed path was added meanwhile: move this upload to another free name
+        new_filename = claim_gallery_filename(album_name, name, content_hash)
+        os.replace(os.path.join('static', filename), os.path.join('static', new_filename))
+        move_derivatives(filename, new_filename)
+        filename = gallery_image.filename = new_filename
+        db.session.add(gallery_image)
+        db.session.commit()
+    database_logger.info(f"Successfully committed uploaded file to database: {filename}")
+
+    if video is None and filename.endswith('.webp') and avif_enabled():
+        # AVIF encodes several times slower than WebP: the job encodes it from the
+        # stored original while the WebP is already served
+        enqueue_job('avif_versions', {'filename': filename})
+    if os.path.exists(staged_path):
+        os.remove(staged_path)
+    if video is not None and video_processor.variant_heights_for(min(video.width, video.height)):
+        # Mobile variants take minutes to encode: the video is already playable without them
+        enqueue_job('video_variants', {'filename': filename})
+    refresh_gallery()
+
+    return {'filename': secure_name, 'path': filename, 'image_id': gallery_image.id}
+
+def process_video_variants(payload: dict) -> dict:
+    """
+    Encode the lower-bitrate mobile variants of a gallery video.
+
+    Runs as its own job after the upload job, alone in the conversion pool:
+    ffmpeg uses several cores and the variants are optional.
+
+    Args:
+        payload: {'filename': gallery path of the video}
+
+    Returns:
+        dict: Job result with the encoded variant heights
+    """
+    log_function_call(processing_logger, 'process_video_variants', file=payload['filename'])
+
+    filename = payload['filename']
+    video_path = os.path.join('static', filename)
+    if not os.path.exists(video_path):
+        # Deleted or moved to another album before the job ran
+        return {'path': filename, 'variants': []}
+    if not video_processor.VIDEO_SUPPORTED:
+        raise video_processor.VideoProcessingError('ffmpeg is not installed')
+
+    video = video_processor.probe_video(video_path)
+    album_name = os.path.basename(os.path.dirname(filename))
+    with conversion_pool.reserve(None):
+        heights = video_processor.encode_variants(video_path, os.path.join(DERIVATIVES_ROOT, album_name),
+                                                  video.width, video.height)
+
+    for image in GalleryImage.query.filter_by(filename=filename).all():
+        image.video_variants = ','.join(map(str, heights)) or None
+    db.session.commit()
+    # Variants live outside the album folders, so their mtimes did not change
+    refresh_gallery()
+
+    return {'path': filename, 'variants': list(heights)}
+
+def process_avif_versions(payload: dict) -> dict:
+    """
+    Encode the AVIF versions of a gallery image and its derivatives.
+
+    The stored original is the source when there is one (uploads); otherwise the
+    largest stored WebP is used (archive images).
+
+    Args:
+        payload: {'filename': gallery path of the WebP}
+
+    Returns:
+        dict: Job result with the AVIF derivative widths
+    """
+    log_function_call(processing_logger, 'process_avif_versions', file=payload['filename'])
+
+    filename = payload['filename']
+    main_path = os.path.join('static', filename)
+    if not os.path.exists(main_path):
+        # Deleted or moved to another album before the job ran
+        return {'path': filename, 'widths': []}
+
+    with Image.open(main_path) as img:
+        main_size = img.size
+    widths = [width for width in image_processor.DERIVATIVE_WIDTHS
+              if os.path.exists(os.path.join('static', derivative_path(filename, width)))]
+
+    image = GalleryImage.query.filter_by(filename=filename).first()
+    source = original_file(image) if image is not None else None
+    if not (source and image_processor.can_process(source)):
+        source = main_path
+        if widths and max(widths) > main_size[0]:
+            source = os.path.join('static', derivative_path(filename, max(widths)))
+
+    album_name = os.path.basename(os.path.dirname(filename))
+    written = conversion_pool.run(image_processor.write_avif_versions, source,
+                                  os.path.join(DERIVATIVES_ROOT, album_name), filename, main_size, widths)
+    return {'path': filename, 'widths': list(written)}
+
+def link_duplicate_upload(existing: GalleryImage, payload: dict) -> dict:
+    """Finish an upload job whose content is already stored, without converting it."""
+    image, _ = link_duplicate_image(existing, payload['album_name'], payload['album_display_name'],
+                                    payload['title'], payload['description'])
+    if os.path.exists(payload['staged_path']):
+        os.remove(payload['staged_path'])
+    return {'filename': payload['secure_name'], 'path': image.filename, 'image_id': image.id,
+            'duplicate': True}
+
+def discard_gallery_upload(payload: dict):
+    """Remove the staged original of an upload that failed permanently."""
+    try:
+        os.remove(payload['staged_path'])
+    except OSError:
+        pass
+
+# kind -> (handler, cleanup after the last failed attempt)
+JOB_HANDLERS = {
+    'gallery_upload': (process_gallery_upload, discard_gallery_upload),
+    # A failed encode leaves no partial files (outputs are written atomically)
+    'video_variants': (process_video_variants, lambda payload: None),
+    'avif_versions': (process_avif_versions, lambda payload: None),
+}
+
+# Wakes the job worker thread when a job is queued in this process
+job_wakeup = threading.Event()
+job_worker_thread = None
+job_worker_lock = threading.Lock()
+
+def enqueue_job(kind: str, payload: dict, commit: bool = True) -> ProcessingJob:
+    """
+    Persist a processing job and wake the worker.
+
+    Args:
+        kind: Handler name from JOB_HANDLERS
+        payload: JSON-serializable job arguments
+        commit: Commit and wake the worker now; with False the job is only
+                flushed and the caller commits and calls wake_job_worker()
+
+    Returns:
+        ProcessingJob: Queued job
+    """
+    log_function_call(app_logger, 'enqueue_job', kind=kind)
+
+    job = ProcessingJob(kind, payload, max_attempts=app.config.get('JOB_MAX_ATTEMPTS', 3))
+    db.session.add(job)
+    if not commit:
+        db.session.flush()
+        return job
+    db.session.commit()
+
+    wake_job_worker()
+    return job
+
+def wake_job_worker():
+    """Start the job worker if needed and let it check the queue now."""
+    start_job_worker()
+    job_wakeup.set()
+
+def claim_next_job() -> ProcessingJob | None:
+    """
+    Atomically move the oldest due job from queued to running.
+
+    The conditional UPDATE makes the claim safe if several processes poll the queue.
+    """
+    now = datetime.now()
+    candidate = db.session.query(ProcessingJob.id).filter(
+        ProcessingJob.status == 'queued', ProcessingJob.run_after <= now
+    ).order_by(ProcessingJob.id).first()
+    if candidate is None:
+        return None
+
+    claimed = ProcessingJob.query.filter_by(id=candidate.id, status='queued').update({
+        'status': 'running',
+        'attempts': ProcessingJob.attempts + 1,
+        'started_at': now,
+        'error': None
+    }, synchronize_session=False)
+    db.session.commit()
+    return db.session.get(ProcessingJob, candidate.id) if claimed else None
+
+def run_job(job: ProcessingJob):
+    """Run a claimed job, then mark it completed, re-queue it with backoff or fail it."""
+    log_function_call(app_logger, 'run_job', job_id=job.id, kind=job.kind, attempt=job.attempts)
+
+    handler, cleanup = JOB_HANDLERS[job.kind]
+    payload = json.loads(job.payload)
+    label = payload.get('secure_name', job.kind)
+    send_progress_update(label, 'processing', job_id=job.id)
+
+    try:
+        result = handler(payload)
+    except Exception as e:
+        log_exception(app_logger, e, f'running job {job.id} ({job.kind})')
+        db.session.rollback()
+
+        job = db.session.get(ProcessingJob, job.id)
+        job.error = str(e)
+        if job.attempts < job.max_attempts:
+            delay = app.config.get('JOB_RETRY_DELAY', 10) * 2 ** (job.attempts - 1)
+            job.status = 'queued'
+            job.run_after = datetime.now() + timedelta(seconds=delay)
+            app_logger.warning(f"Job {job.id} failed (attempt {job.attempts}/{job.max_attempts}), retrying in {delay}s")
+            status = 'retrying'
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.now()
+            cleanup(payload)
+            app_logger.error(f"Job {job.id} failed permanently after {job.attempts} attempts")
+            status = 'failed'
+        db.session.commit()
+        send_progress_update(label, status, job_id=job.id)
+        return
+
+    job.status = 'completed'
+    job.result = json.dumps(result)
+    job.finished_at = datetime.now()
+    db.session.commit()
+    app_logger.info(f"Job {job.id} completed: {result}")
+    send_progress_update(label, 'completed', job_id=job.id)
+
+def run_job_by_id(job_id: int):
+    """Run a claimed job in its own application context (job worker threads)."""
+    with app.app_context():
+        try:
+            run_job(db.session.get(ProcessingJob, job_id))
+        except Exception as e:
+            log_exception(app_logger, e, f'running job {job_id}')
+
+def run_pending_jobs() -> int:
+    """
+    Run queued jobs that are due until the queue is empty.
+
+    Returns:
+        int: Number of jobs run
+    """
+    count = 0
+    while True:
+        job = claim_next_job()
+        if job is None:
+            return count
+        run_job(job)
+        count += 1
+
+def recover_interrupted_jobs() -> int:
+    """
+    Re-queue jobs left running by a worker that died (restart, OOM kill).
+
+    Only called by the worker holding the job lock, so no other worker can be
+    running them.
+
+    Returns:
+        int: Number of recovered jobs
+    """
+    jobs = ProcessingJob.query.filter_by(status='running').all()
+    for job in jobs:
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.error = 'Interrupted too many times'
+            job.finished_at = datetime.now()
+            JOB_HANDLERS[job.kind][1](json.loads(job.payload))
+        else:
+            job.status = 'queued'
+            job.run_after = datetime.now()
+    if jobs:
+        db.session.commit()
+        app_logger.warning(f"Recovered {len(jobs)} interrupted jobs")
+    return len(jobs)
+
+def job_worker_lock_path() -> str:
+    """Lock file held by the process that runs the job queue."""
+    return os.path.join(os.path.dirname(app.config['GALLERY_MANIFEST_PATH']), 'job_worker.lock')
+
+def start_job_worker():
+    """
+    Start the background job worker thread in this process (once).
+
+    Every gunicorn worker starts one, but a blocking file lock lets only one of
+    them process the queue; the others take over if that process exits.
+
+    Returns:
+        threading.Thread | None: Worker thread, or None when disabled
+    """
+    global job_worker_thread
+
+    if not app.config.get('JOB_WORKER_ENABLED', True):
+        return None
+
+    with job_worker_lock:
+        if job_worker_thread is not None and job_worker_thread.is_alive():
+            return job_worker_thread
+
+        lock_path = job_worker_lock_path()
+        poll_interval = app.config.get('JOB_POLL_INTERVAL', 2)
+
+        def worker():
+            os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+            with open(lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                app_logger.info(f"Job worker active in process {os.getpid()}")
+                with app.app_context():
                     try:
-                        if ext in ['.jpg', '.jpeg', '.png', '.webp', '.heic']:
-                            # Image processing
-                            try:
-                                result = subprocess.run(
-                                    ['./scripts/process_image.sh', temp_path, 'gallery'], 
-                                    check=True,
-                                    capture_output=True,
-                                    text=True,
-                                    timeout=60  # 60 sekund timeout
-                                )
-                                
-                                processing_logger.info(f"Image processing completed for {secure_name}")
-                                if result.stdout:
-                                    processing_logger.info(f"Process output: {result.stdout}")
-                                
-                            except subprocess.CalledProcessError as proc_error:
-                                error_msg = f"Image processing failed: {proc_error}"
-                                if proc_error.stderr:
-                                    error_msg += f" - {proc_error.stderr}"
-                                log_exception(processing_logger, proc_error, f'processing image {secure_name}')
-                                
-                                # Remove temporary file on error
-                                try:
-                                    if os.path.exists(temp_path):
-                                        os.remove(temp_path)
-                                except:
-                                    pass
-                                send_progress_update(secure_name, 'failed')
-                                return jsonify({'success': False, 'error': error_msg})
-                                
-                            except subprocess.TimeoutExpired as timeout_error:
-                                error_msg = f"Image processing timeout: {timeout_error}"
-                                log_exception(processing_logger, timeout_error, f'processing image {secure_name}')
-                                
-                                # Remove temporary file on timeout
-                                try:
-                                    if os.path.exists(temp_path):
-                                        os.remove(temp_path)
-                                except:
-                                    pass
-                                send_progress_update(secure_name, 'failed')
-                                return jsonify({'success': False, 'error': error_msg})
-                            
-                            # Get processed file name
-                            processed_filename = os.path.splitext(secure_name)[0] + '.webp'
-                            
-                            # Get image date
-                            try:
-                                image_date = get_image_date(temp_path)
-                            except Exception as date_error:
-                                log_exception(processing_logger, date_error, f'getting image date for {secure_name}')
-                                image_date = datetime.now()
-                            
-                            # Create database record
-                            try:
-                                # Create or get album
-                                album = create_album_if_not_exists(album_name, form.new_album.data.strip() if form.new_album.data else form.album.data)
-                                
-                                gallery_image = GalleryImage(
-                                    filename=os.path.join('images', 'gallery', album_name, processed_filename),
-                                    title=form.title.data or os.path.splitext(secure_name)[0],
-                                    description=form.description.data,
-                                    date=image_date,
-                                    original_date=image_date,
-                                    album_id=album.id,
-                                )
-                                
-                                db.session.add(gallery_image)
-                                database_logger.info(f"Added gallery image to session: {processed_filename}")
-                                
-                            except Exception as db_add_error:
-                                log_exception(database_logger, db_add_error, f'creating GalleryImage for {secure_name}')
-                                send_progress_update(secure_name, 'failed')
-                                return jsonify({'success': False, 'error': f"Database error: {str(db_add_error)}"})
-                            
-                        elif ext == '.mp4':
-                            # Video file processing
+                        recover_interrupted_jobs()
+                    except Exception as e:
+                        log_exception(app_logger, e, 'recovering interrupted jobs')
+
+                # One job per conversion slot; the pool still holds back jobs
+                # whose decode memory does not fit next to the running ones
+                concurrency = conversion_pool.slots
+                running = set()
+                with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job') as executor:
+                    while True:
+                        running = {future for future in running if not future.done()}
+                        job_id = None
+                        if len(running) < concurrency:
                             try:
-                                final_path = os.path.join(album_path, secure_name)
-                                if temp_path != final_path:
-                                    os.rename(temp_path, final_path)
-                                
-                                log_file_operation(upload_logger, 'move', secure_name, 'success', f'Video moved to {final_path}')
-                                
-                                # Create database record for video
-                                # Create or get album
-                                album = create_album_if_not_exists(album_name, form.new_album.data.strip() if form.new_album.data else form.album.data)
-                                
-                                gallery_image = GalleryImage(
-                                    filename=os.path.join('images', 'gallery', album_name, secure_name),
-                                    title=form.title.data or os.path.splitext(secure_name)[0],
-                                    description=form.description.data,
-                                    date=datetime.now(),
-                                    original_date=datetime.now(),
-                                    album_id=album.id,
-                                )
-                                
-                                db.session.add(gallery_image)
-                                database_logger.info(f"Added video to session: {secure_name}")
-                                
-                            except Exception as video_error:
-                                log_exception(upload_logger, video_error, f'processing video {secure_name}')
-                                send_progress_update(secure_name, 'failed')
-                                return jsonify({'success': False, 'error': f"Video processing error: {str(video_error)}"})
-                        
-                        # Remove temporary file if it still exists
-                        try:
-                            if os.path.exists(temp_path):
-                                os.remove(temp_path)
-                        except Exception as cleanup_error:
-                            log_exception(upload_logger, cleanup_error, f'cleaning up temp file {temp_path}')
-                        
-                        log_file_operation(upload_logger, 'process', secure_name, 'success', f'Completed processing')
-                        
-                    except Exception as file_process_error:
-                        log_exception(upload_logger, file_process_error, f'processing file {secure_name}')
-                        
-                        # Cleanup on error
-                        try:
-                            if os.path.exists(temp_path):
-                                os.remove(temp_path)
-                        except:
-                            pass
-                        send_progress_update(secure_name, 'failed')
-                        return jsonify({'success': False, 'error': f'Processing error: {str(file_process_error)}'})
-                        
-                except Exception as outer_file_error:
-                    log_exception(upload_logger, outer_file_error, f'outer processing for {file.filename}')
-                    send_progress_update(secure_name, 'failed')
-                    return jsonify({'success': False, 'error': f'Unexpected error: {str(outer_file_error)}'})
-                
-                # Commit database changes for single file
-                try:
-                    db.session.commit()
-                    database_logger.info(f"Successfully committed single file to database: {secure_name}")
-                    upload_logger.info(f"Single file upload completed successfully: {secure_name}")
-                    
-                    send_progress_update(secure_name, 'completed')
-                    
-                    return jsonify({
-                        'success': True, 
-                        'filename': secure_name,
-                        'message': f'Soubor {secure_name} úspěšně nahrán'
-                    })
-                    
-                except Exception as commit_error:
-                    log_exception(database_logger, commit_error, 'committing single file upload')
-                    
-                    # Rollback transakce
-                    try:
-                        db.session.rollback()
-                        database_logger.info("Database rollback completed")
-                    except Exception as rollback_error:
-                        log_exception(database_logger, rollback_error, 'rolling back database session')
-                    
-                    send_progress_update(secure_name, 'failed')
-                    return jsonify({'success': False, 'error': f'Save error: {str(commit_error)}'})
-            else:
-                # Form validation failed
-                errors = []
-                for field, field_errors in form.errors.items():
-                    for error in field_errors:
-                        errors.append(f"{field}: {error}")
-                upload_logger.error(f"Form validation failed: {errors}")
-                return jsonify({'success': False, 'error': 'Validation error: ' + '; '.join(errors)})
-        except Exception as e:
-            log_exception(upload_logger, e, 'upload_image')
-            return jsonify({'success': False, 'error': f'Unexpected error: {str(e)}'})
-    else:
-        # GET request - show upload form
-        upload_logger.info("Received GET request to /admin/upload")
-        form = ImageUploadForm()
-        return render_template('upload.html', form=form)
+                                with app.app_context():
+                                    job = claim_next_job()
+                                    job_id = job.id if job else None
+                            except Exception as e:
+                                log_exception(app_logger, e, 'job worker loop')
+                        if job_id is not None:
+                            future = executor.submit(run_job_by_id, job_id)
+                            future.add_done_callback(lambda _: job_wakeup.set())
+                            running.add(future)
+                            continue
+                        # Woken by a new job or a finished one; jobs queued by
+                        # other processes are picked up on the next poll
+                        job_wakeup.wait(poll_interval)
+                        job_wakeup.clear()
+
+        job_worker_thread = threading.Thread(target=worker, name='job-worker', daemon=True)
+        job_worker_thread.start()
+        app_logger.info("Job worker thread started")
+        return job_worker_thread
+
+@app.route('/api/jobs/<int:id>')
+def job_status(id):
+    """Status of a background processing job (polled by the upload page)."""
+    job = db.session.get(ProcessingJob, id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+# Media files whose rows sync_gallery_with_disk() keeps (anything else is not served)
+SYNC_EXTENSIONS = ('.webp', '.mp4')
+
+# Per-album state of the last reconciliation in this process:
+# folder name -> (directory mtime_ns or None, media files on disk, database rows)
+album_fingerprints = {}
+album_fingerprints_lock = threading.Lock()
 
 def sync_gallery_with_disk():
-    """Synchronize database with files on disk"""
+    """
+    Reconcile database rows with the files on disk, incrementally.
+
+    Only albums whose directory mtime or row count changed since the last run
+    in this process are listed; for them, rows of missing files are removed
+    with one bulk DELETE. Empty albums come from one aggregate row count query.
+    The first run in a process reconciles every album.
+
+    Returns:
+        dict: Numbers of rescanned albums, removed rows and removed albums
+    """
     log_function_call(database_logger, 'sync_gallery_with_disk')
     
     try:
-        # Get all gallery images from database
-        db_images = GalleryImage.query.all()
-        database_logger.info(f"Found {len(db_images)} images in database")
-        
-        # Create a set of existing files on disk
-        existing_files = set()
-        gallery_dir = Path('static/images/gallery')
-        
-        if gallery_dir.exists():
-            for album_dir in gallery_dir.iterdir():
-                if album_dir.is_dir() and not album_dir.name.startswith('.'):
-                    album_files = 0
-                    for file in album_dir.iterdir():
-                        if file.is_file() and file.suffix.lower() in ['.webp', '.mp4']:
-                            # Convert to relative path from static
-                            rel_path = os.path.join('images', 'gallery', album_dir.name, file.name)
-                            existing_files.add(rel_path)
-                            album_files += 1
-                    
-                    if album_files == 0:
-                        # Remove empty album directories
-                        try:
-                            album_dir.rmdir()
-                            database_logger.info(f"Removed empty album directory: {album_dir.name}")
-                        except OSError:
-                            pass  # Directory might not be empty or already deleted
+        gallery_dir = os.path.join('static', 'images', 'gallery')
+        directories = {}
+        if os.path.isdir(gallery_dir):
+            with os.scandir(gallery_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir() and not entry.name.startswith('.'):
+                        directories[entry.name] = entry.stat().st_mtime_ns
         else:
             database_logger.warning("Gallery directory does not exist: static/images/gallery")
         
-        database_logger.info(f"Found {len(existing_files)} files on disk")
-        
-        # Remove database entries for missing files
-        removed_count = 0
-        for db_image in db_images:
-            if db_image.filename not in existing_files:
-                database_logger.info(f"Removing database entry for missing file: {db_image.filename}")
-                db.session.delete(db_image)
-                removed_count += 1
+        # One aggregate query: every album with its row count (0 for empty albums)
+        albums = {name: (album_id, count) for album_id, name, count in db.session.query(
+            Album.id, Album.normalized_name, func.count(GalleryImage.id)
+        ).outerjoin(GalleryImage, GalleryImage.album_id == Album.id).group_by(Album.id).all()}
         
-        if removed_count > 0:
-            db.session.commit()
-            database_logger.info(f"Removed {removed_count} database entries for missing files")
-        else:
-            database_logger.info("No database entries to remove - all files exist on disk")
+        with album_fingerprints_lock:
+            previous = dict(album_fingerprints)
+        names = set(directories) | set(albums) | set(previous)
+        changed = [name for name in sorted(names)
+                   if name not in previous or previous[name][0] != directories.get(name)
+                   or previous[name][2] != albums.get(name, (None, 0))[1]]
         
-        # Clean up empty albums in database
-        albums = Album.query.all()
-        for album in albums:
-            if not album.images:
-                database_logger.info(f"Removing empty album from database: {album.display_name}")
-                db.session.delete(album)
+        fingerprints, removed_rows = {}, 0
+        for name in changed:
+            files = set()
+            if name in directories:
+                with os.scandir(os.path.join(gallery_dir, name)) as entries:
+                    files = {os.path.join('images', 'gallery', name, entry.name) for entry in entries
+                             if entry.is_file() and entry.name.lower().endswith(SYNC_EXTENSIONS)}
+            prefix = os.path.join('images', 'gallery', name) + '/'
+            rows = {filename for filename, in db.session.query(GalleryImage.filename).filter(
+                GalleryImage.filename.startswith(prefix, autoescape=True))}
+            missing = sorted(rows - files)
+            if missing:
+                database_logger.info(f"Removing {len(missing)} database entries for missing files in {name}")
+                removed_rows += delete_gallery_rows(missing)
+            album_id, count = albums.get(name, (None, 0))
+            fingerprints[name] = (directories.get(name), len(files), count - len(missing))
         
+        # Albums left without rows and without media on disk (unchanged albums
+        # keep the file count of their last scan)
+        empty = []
+        for name, (album_id, _) in albums.items():
+            _, file_count, row_count = fingerprints.get(name) or previous[name]
+            if file_count == 0 and row_count == 0:
+                empty.append(album_id)
+        if empty:
+            database_logger.info(f"Removing {len(empty)} empty albums from database")
+            Album.query.filter(Album.id.in_(empty)).delete(synchronize_session=False)
         db.session.commit()
         
+        with album_fingerprints_lock:
+            album_fingerprints.update(fingerprints)
+            for name in names - set(directories) - set(albums):
+                album_fingerprints.pop(name, None)
+        
+        summary = {'rescanned_albums': len(changed), 'removed_rows': removed_rows, 'removed_albums': len(empty)}
+        database_logger.info(f"Gallery sync finished: {summary}")
+        if removed_rows or empty:
+            # Rewrite the shared gallery manifest so all workers see the synced state
+            refresh_gallery()
+        return summary
+        
     except Exception as e:
         log_exception(database_logger, e, 'sync_gallery_with_disk')
         raise
 
+def delete_gallery_rows(filenames: list[str]) -> int:
+    """Bulk-delete gallery rows (and their metadata rows) by filename, without loading them."""
+    removed = 0
+    # Stay below SQLite's bound parameter limit
+    for start in range(0, len(filenames), 500):
+        chunk = filenames[start:start + 500]
+        ids = db.session.query(GalleryImage.id).filter(GalleryImage.filename.in_(chunk))
+        ImageMetadata.query.filter(ImageMetadata.image_id.in_(ids.scalar_subquery())).delete(
+            synchronize_session=False)
+        removed += GalleryImage.query.filter(GalleryImage.filename.in_(chunk)).delete(
+            synchronize_session=False)
+    return removed
+
+def prune_empty_album_directories():
+    """
+    Remove album directories that contain no gallery media.
+    
+    Returns:
+        int: Number of removed directories
+    """
+    log_function_call(app_logger, 'prune_empty_album_directories')
+    
+    removed = 0
+    gallery_dir = Path('static/images/gallery')
+    if not gallery_dir.exists():
+        return removed
+    
+    for album_dir in gallery_dir.iterdir():
+        if not album_dir.is_dir() or album_dir.name.startswith('.'):
+            continue
+        
+        has_files = any(
+            file.is_file() and file.suffix.lower() in gallery_index.extensions
+            for file in album_dir.iterdir()
+        )
+        if not has_files:
+            try:
+                album_dir.rmdir()
+                removed += 1
+                app_logger.info(f"Removed empty album directory: {album_dir.name}")
+            except OSError:
+                pass  # Directory might not be empty or already deleted
+    
+    return removed
+
+def create_missing_albums():
+    """
+    Create Album rows for gallery folders that do not have one yet.
+    
+    Returns:
+        int: Number of created albums
+    """
+    log_function_call(app_logger, 'create_missing_albums')
+    
+    created = 0
+    for album in get_existing_albums():
+        if album.id is None:
+            create_album_if_not_exists(album.normalized_name, album.display_name)
+            created += 1
+    return created
+
+def run_gallery_maintenance():
+    """
+    Run all gallery write maintenance outside of request handlers:
+    empty directory pruning, album row creation, orphan row removal and
+    expiry of abandoned chunked uploads.
+    
+    Returns:
+        dict: Summary of performed changes
+    """
+    log_function_call(app_logger, 'run_gallery_maintenance')
+    
+    removed_dirs = prune_empty_album_directories()
+    gallery_index.invalidate()
+    created_albums = create_missing_albums()
+    # Removes rows for missing files and empty albums (rewriting the manifest when it did)
+    synced = sync_gallery_with_disk()
+    if not (synced['removed_rows'] or synced['removed_albums']):
+        # Store the covers of the rescanned index
+        refresh_gallery()
+    expired_uploads = expire_upload_sessions()
+    
+    summary = {'removed_directories': removed_dirs, 'created_albums': created_albums,
+               'expired_uploads': expired_uploads}
+    app_logger.info(f"Gallery maintenance finished: {summary}")
+    return summary
+
+def start_maintenance_thread(interval=None):
+    """
+    Start a daemon thread running gallery maintenance periodically.
+    
+    A non-blocking file lock makes sure only one gunicorn worker runs a
+    maintenance pass at a time.
+    
+    Args:
+        interval: Seconds between runs (defaults to GALLERY_MAINTENANCE_INTERVAL)
+        
+    Returns:
+        threading.Thread | None: Started thread, or None when disabled
+    """
+    interval = interval if interval is not None else app.config.get('GALLERY_MAINTENANCE_INTERVAL', 0)
+    if not interval:
+        app_logger.info("Gallery maintenance thread disabled")
+        return None
+    
+    lock_path = os.path.join(os.path.dirname(app.config['GALLERY_MANIFEST_PATH']), 'gallery_maintenance.lock')
+    
+    def worker():
+        while True:
+            try:
+                os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+                with open(lock_path, 'a+') as lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        app_logger.info("Gallery maintenance already running in another worker")
+                    else:
+                        # The lock file stores the last run time, so N workers
+                        # still run maintenance only once per interval
+                        lock_file.seek(0)
+                        last_run = lock_file.read().strip()
+                        if not last_run or time.time() - float(last_run) >= interval * 0.9:
+                            with app.app_context():
+                                run_gallery_maintenance()
+                            lock_file.seek(0)
+                            lock_file.truncate()
+                            lock_file.write(str(time.time()))
+            except Exception as e:
+                log_exception(app_logger, e, 'periodic gallery maintenance')
+            time.sleep(interval)
+    
+    thread = threading.Thread(target=worker, name='gallery-maintenance', daemon=True)
+    thread.start()
+    app_logger.info(f"Gallery maintenance thread started (interval {interval}s)")
+    return thread
+
+gallery_cli = AppGroup('gallery', help='Gallery maintenance commands.')
+
+@gallery_cli.command('maintain')
+def gallery_maintain_command():
+    """Prune empty album folders, create missing albums, drop orphan rows and expire abandoned uploads."""
+    summary = run_gallery_maintenance()
+    click.echo(f"Removed directories: {summary['removed_directories']}")
+    click.echo(f"Created albums: {summary['created_albums']}")
+    click.echo(f"Expired uploads: {summary['expired_uploads']}")
+
+def generate_missing_derivatives():
+    """
+    Generate srcset derivatives for gallery images that do not have them yet
+    (archive images uploaded before the derivative ladder existed).
+
+    With ffmpeg installed, videos without a poster get one and their mobile
+    variants are queued. With AVIF enabled, WebP images without an AVIF
+    version get an AVIF job. Missing blurred placeholders are filled in.
+
+    Returns:
+        dict: Numbers of processed and failed images and queued AVIF jobs
+    """
+    log_function_call(processing_logger, 'generate_missing_derivatives')
+
+    processed = failed = avif_queued = 0
+    widths_by_path = {}
+    pending_avif = set()
+    if avif_enabled():
+        for job in ProcessingJob.query.filter(ProcessingJob.kind == 'avif_versions',
+                                              ProcessingJob.status.in_(['queued', 'running'])).all():
+            pending_avif.add(json.loads(job.payload)['filename'])
+    for album in gallery_index.albums():
+        for record in gallery_index.records(album):
+            if (avif_enabled() and record.path.endswith('.webp') and record.path not in pending_avif
+                    and not os.path.exists(os.path.join('static', avif_path(record.path)))):
+                # Runs after the derivatives below are committed, so it encodes them too
+                enqueue_job('avif_versions', {'filename': record.path}, commit=False)
+                avif_queued += 1
+            if record.derivatives:
+                continue
+            if record.path.lower().endswith('.mp4'):
+                if not video_processor.VIDEO_SUPPORTED:
+                    continue
+                try:
+                    video = video_processor.probe_video(os.path.join('static', record.path))
+                except video_processor.VideoProcessingError:
+                    failed += 1
+                    continue
+                widths = write_video_poster(record.path, video.duration)
+                if not widths:
+                    failed += 1
+                    continue
+                widths_by_path[record.path] = widths
+                if not record.variants and video_processor.variant_heights_for(min(video.width, video.height)):
+                    enqueue_job('video_variants', {'filename': record.path}, commit=False)
+                processed += 1
+                continue
+            try:
+                widths_by_path[record.path] = image_processor.generate_derivatives(
+                    os.path.join('static', record.path),
+                    os.path.join(DERIVATIVES_ROOT, album.normalized_name)
+                )
+                processed += 1
+            except image_processor.ImageProcessingError:
+                failed += 1
+
+    for image in GalleryImage.query.filter(GalleryImage.filename.in_(list(widths_by_path))).all():
+        image.derivative_widths = ','.join(map(str, widths_by_path[image.filename]))
+    placeholders = backfill_placeholders()
+    # Queued variant and AVIF jobs are picked up by the application's job worker
+    # on its next poll (a worker started in this CLI process would die with it)
+    db.session.commit()
+    if widths_by_path:
+        # Derivatives live outside the album folders, so their mtimes did not change
+        refresh_gallery()
+
+    summary = {'processed': processed, 'failed': failed, 'avif_queued': avif_queued,
+               'placeholders': placeholders}
+    processing_logger.info(f"Derivative generation finished: {summary}")
+    return summary
+
+def backfill_placeholders() -> int:
+    """
+    Make blurred placeholders for images stored without one (archive images,
+    script-converted HEIC). Reads the smallest derivative (or poster) when there
+    is one. The caller commits.
+
+    Returns:
+        int: Number of placeholders made
+    """
+    count = 0
+    for image in GalleryImage.query.filter(GalleryImage.placeholder.is_(None)).all():
+        widths = parse_derivative_widths(image.derivative_widths)
+        if image.filename.lower().endswith('.mp4'):
+            image.placeholder = poster_placeholder(image.filename, widths)
+        else:
+            source = derivative_path(image.filename, min(widths)) if widths else image.filename
+            try:
+                image.placeholder = image_processor.placeholder_from_file(os.path.join('static', source))
+            except image_processor.ImageProcessingError:
+                continue
+        count += image.placeholder is not None
+    return count
+
+def read_media_dimensions(path: str) -> tuple[int | None, int | None]:
+    """
+    Frame size of a gallery file from its header only (ffprobe for videos).
+
+    Returns:
+        tuple: (width, height), or (None, None) when it cannot be read
+    """
+    if path.lower().endswith('.mp4'):
+        if not video_processor.VIDEO_SUPPORTED:
+            return None, None
+        try:
+            video = video_processor.probe_video(path)
+        except video_processor.VideoProcessingError:
+            return None, None
+        return (video.width, video.height) if video.width and video.height else (None, None)
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+def backfill_image_dimensions(workers: int = 8) -> dict:
+    """
+    Record frame and byte sizes for gallery images stored without them.
+
+    Headers are read in a thread pool: the reads are I/O bound and decode no
+    pixels. Rows whose file changed size since it was recorded are refreshed too.
+
+    Args:
+        workers: Number of parallel header reads
+
+    Returns:
+        dict: Numbers of updated and failed images
+    """
+    log_function_call(processing_logger, 'backfill_image_dimensions', workers=workers)
+
+    def read(filename):
+        path = os.path.join('static', filename)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None, None, None
+        return (size, *read_media_dimensions(path))
+
+    images = [image for image in GalleryImage.query.all()
+              if image.width is None or image.height is None or image.file_size is None
+              or not os.path.exists(os.path.join('static', image.filename))
+              or os.path.getsize(os.path.join('static', image.filename)) != image.file_size]
+    updated = failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for image, (size, width, height) in zip(images, executor.map(read, [image.filename for image in images])):
+            if size is None or width is None:
+                failed += 1
+                continue
+            image.file_size, image.width, image.height = size, width, height
+            updated += 1
+    db.session.commit()
+    if updated:
+        # The index takes the recorded sizes on its next rebuild
+        refresh_gallery()
+
+    summary = {'updated': updated, 'failed': failed}
+    processing_logger.info(f"Dimension backfill finished: {summary}")
+    return summary
+
+@gallery_cli.command('dimensions')
+@click.option('--workers', default=8, show_default=True, help='Parallel header reads.')
+def gallery_dimensions_command(workers):
+    """Record frame and byte sizes for gallery images stored without them."""
+    summary = backfill_image_dimensions(workers)
+    click.echo(f"Updated images: {summary['updated']}")
+    click.echo(f"Failed images: {summary['failed']}")
+
+def backfill_image_metadata(workers: int | None = None, batch_size: int = 50, progress=None) -> dict:
+    """
+    Read metadata of gallery files stored without it (archive images, uploads
+    processed before the metadata table existed).
+
+    Headers are read in a process pool, one batch at a time. Every batch is
+    committed, so an interrupted run resumes with the files it had not reached;
+    files that cannot be read are tried again on the next run.
+
+    Args:
+        workers: Number of reader processes (None - one per CPU, 0 - in this process)
+        batch_size: Files per committed batch
+        progress: Called with (done, total) after every batch
+
+    Returns:
+        dict: Numbers of stored and failed files and files left from earlier runs
+    """
+    log_function_call(processing_logger, 'backfill_image_metadata', workers=workers)
+
+    pending = db.session.query(GalleryImage.id, GalleryImage.filename, GalleryImage.original).outerjoin(ImageMetadata).filter(
+        ImageMetadata.id.is_(None)
+    ).order_by(GalleryImage.id).all()
+    total = len(pending)
+    stored = failed = 0
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers > 0 and total:
+        # spawn: the reader processes import only utils, not the application
+        executor = ProcessPoolExecutor(max_workers=min(workers, total),
+                                       mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for start in range(0, total, max(1, batch_size)):
+            batch = pending[start:start + max(1, batch_size)]
+            # The stored original has the full-size frame and the camera EXIF of the upload
+            paths = [original_file(row) or os.path.join('static', row.filename) for row in batch]
+            results = (executor.map(media_metadata.extract_metadata, paths) if executor
+                       else map(media_metadata.extract_metadata, paths))
+            for (image_id, _, _), metadata in zip(batch, results):
+                if metadata is None:
+                    failed += 1
+                    continue
+                db.session.add(ImageMetadata(metadata, image_id=image_id))
+                stored += 1
+            db.session.commit()
+            if progress is not None:
+                progress(start + len(batch), total)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    summary = {'stored': stored, 'failed': failed, 'total': total}
+    processing_logger.info(f"Metadata backfill finished: {summary}")
+    return summary
+
+@gallery_cli.command('metadata')
+@click.option('--workers', type=int, default=None, help='Reader processes (default: one per CPU).')
+@click.option('--batch-size', default=50, show_default=True, help='Files per committed batch.')
+def gallery_metadata_command(workers, batch_size):
+    """Read metadata of gallery files stored without it; resumes where an interrupted run stopped."""
+    summary = backfill_image_metadata(
+        workers, batch_size,
+        progress=lambda done, total: click.echo(f"Metadata: {done}/{total}")
+    )
+    click.echo(f"Stored metadata: {summary['stored']}")
+    click.echo(f"Failed files: {summary['failed']}")
+
+def render_gallery_outputs(filename: str, source: str, avif: bool) -> tuple[str, Any]:
+    """
+    Convert a stored original into a new set of outputs in a staging directory.
+
+    Runs in a rebuild thread; the decode itself runs in the conversion pool.
+    The staging directory (REBUILD_STAGING_DIR) is outside the served static tree.
+
+    Returns:
+        tuple: (staging directory, ProcessedImage)
+    """
+    staging_root = app.config['REBUILD_STAGING_DIR']
+    os.makedirs(staging_root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='rebuild.', dir=staging_root)
+    try:
+        processed = conversion_pool.run(image_processor.process_image, source,
+                                         os.path.join(staging, os.path.basename(filename)), 'gallery', staging)
+        if avif:
+            conversion_pool.run(image_processor.write_avif_versions, source, staging, filename,
+                                (processed.width, processed.height), processed.derivatives)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return staging, processed
+
+def install_gallery_outputs(filename: str, staging: str):
+    """
+    Swap rebuilt outputs in place of the served ones.
+
+    Every file is renamed over its old version (readers get either the old or
+    the new file, never a partial one); derivatives the new spec no longer
+    writes are removed. When the staging directory is on another mount (the
+    instance Docker volume), a file is first copied next to its target and
+    renamed from there.
+    """
+    album_name = os.path.basename(os.path.dirname(filename))
+    installed = set()
+    for name in os.listdir(staging):
+        target = (os.path.join('static', filename) if name == os.path.basename(filename)
+                  else os.path.join(DERIVATIVES_ROOT, album_name, name))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        source = os.path.join(staging, name)
+        try:
+            os.replace(source, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            fd, tmp_path = tempfile.mkstemp(prefix='.rebuild.', dir=os.path.dirname(target))
+            os.close(fd)
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, target)
+        installed.add(os.path.normpath(target))
+    for relative_path in derivative_files(filename):
+        path = os.path.normpath(os.path.join('static', relative_path))
+        if path not in installed and os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(staging, ignore_errors=True)
+
+def install_rebuilt_image(image_id: int, filename: str, future, spec: str) -> bool:
+    """Swap in the outputs of one finished rebuild and commit its new spec hash (the checkpoint)."""
+    try:
+        staging, processed = future.result()
+    except Exception as e:
+        log_exception(processing_logger, e, f'rebuilding {filename}')
+        return False
+    image = db.session.get(GalleryImage, image_id)
+    if image is None or image.filename != filename:
+        # Deleted or moved while converting: the next run picks it up again
+        shutil.rmtree(staging, ignore_errors=True)
+        return False
+    install_gallery_outputs(filename, staging)
+    image.derivative_widths = ','.join(map(str, processed.derivatives)) or None
+    image.placeholder = processed.placeholder
+    image.width, image.height = processed.width, processed.height
+    image.file_size = os.path.getsize(os.path.join('static', filename))
+    image.output_spec = spec
+    db.session.commit()
+    return True
+
+def rebuild_gallery_outputs(workers: int | None = None, progress=None) -> dict:
+    """
+    Re-derive gallery images whose outputs were written under another spec.
+
+    Images are converted from their stored originals in parallel (the
+    conversion pool bounds processes and memory). Each finished image is
+    swapped in and committed with the new spec hash, which is the checkpoint:
+    an interrupted rebuild resumes with the images still on the old spec.
+
+    Args:
+        workers: Images converted at once (None - conversion pool size)
+        progress: Called with (done, total) after every image
+
+    Returns:
+        dict: Numbers of rebuilt and failed images and images without an original
+    """
+    log_function_call(processing_logger, 'rebuild_gallery_outputs', workers=workers)
+
+    spec = current_output_spec()
+    avif = avif_enabled()
+    stale = GalleryImage.query.filter(
+        ~GalleryImage.filename.ilike('%.mp4'),
+        (GalleryImage.output_spec.is_(None)) | (GalleryImage.output_spec != spec)
+    ).order_by(GalleryImage.id).all()
+    tasks = [(image.id, image.filename, original_file(image)) for image in stale]
+    tasks = [task for task in tasks if task[2]]
+    without_original = len(stale) - len(tasks)
+
+    rebuilt = failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers or conversion_pool.slots)) as executor:
+        futures = {executor.submit(render_gallery_outputs, filename, source, avif): (image_id, filename)
+                   for image_id, filename, source in tasks}
+        for future in as_completed(futures):
+            image_id, filename = futures[future]
+            if install_rebuilt_image(image_id, filename, future, spec):
+                rebuilt += 1
+            else:
+                failed += 1
+            if progress is not None:
+                progress(rebuilt + failed, len(tasks))
+
+    if rebuilt:
+        # Derivatives live outside the album folders, so their mtimes did not change
+        refresh_gallery()
+
+    summary = {'rebuilt': rebuilt, 'failed': failed, 'without_original': without_original, 'spec': spec}
+    processing_logger.info(f"Gallery rebuild finished: {summary}")
+    return summary
+
+@gallery_cli.command('rebuild')
+@click.option('--workers', type=int, default=None, help='Images converted at once (default: conversion pool size).')
+def gallery_rebuild_command(workers):
+    """Re-derive gallery outputs written under an older output spec; resumes where an interrupted run stopped."""
+    summary = rebuild_gallery_outputs(
+        workers, progress=lambda done, total: click.echo(f"Rebuilt: {done}/{total}")
+    )
+    click.echo(f"Output spec: {summary['spec']}")
+    click.echo(f"Rebuilt images: {summary['rebuilt']}")
+    click.echo(f"Failed images: {summary['failed']}")
+    click.echo(f"Images without an original: {summary['without_original']}")
+
+@gallery_cli.command('derivatives')
+def gallery_derivatives_command():
+    """Generate missing srcset derivatives for existing gallery images."""
+    summary = generate_missing_derivatives()
+    click.echo(f"Processed images: {summary['processed']}")
+    click.echo(f"Failed images: {summary['failed']}")
+    click.echo(f"Queued AVIF jobs: {summary['avif_queued']}")
+    click.echo(f"Placeholders: {summary['placeholders']}")
+
+app.cli.add_command(gallery_cli)
+
+jobs_cli = AppGroup('jobs', help='Background job queue commands.')
+
+@jobs_cli.command('run')
+def jobs_run_command():
+    """Recover interrupted jobs and run all queued jobs that are due, then exit."""
+    lock_path = job_worker_lock_path()
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            click.echo("Job worker is running in the application; nothing to do")
+            return
+        recovered = recover_interrupted_jobs()
+        count = run_pending_jobs()
+    click.echo(f"Recovered jobs: {recovered}")
+    click.echo(f"Jobs run: {count}")
+
+app.cli.add_command(jobs_cli)
+
+schema_cli = AppGroup('schema', help='Database schema commands.')
+
+@schema_cli.command('upgrade')
+def schema_upgrade_command():
+    """Create missing tables, columns and indexes and apply pending versioned migrations."""
+    versions = upgrade_database_schema()
+    click.echo(f"Applied migrations: {', '.join(map(str, versions)) or 'none'}")
+
+@schema_cli.command('explain')
+def schema_explain_command():
+    """Show the query plans of the hot gallery and donor queries; fails if one does not use its index."""
+    missing = []
+    for name, (index, details, uses_index) in explain_hot_queries().items():
+        click.echo(f"{name}: {'; '.join(details)}")
+        if not uses_index:
+            missing.append(f"{name} ({index})")
+    if missing:
+        raise click.ClickException(f"Queries not using their index: {', '.join(missing)}")
+
+app.cli.add_command(schema_cli)
+
 def parse_bank_statement():
     """Parse bank statement data from Fio banka transparent account and return list of donors."""
     log_function_call(database_logger, 'parse_bank_statement')
@@ -1241,18 +3645,22 @@ def edit_image(id):
         image.display_order = form.display_order.data
         
         # If album changed, move the file
+        moved_from = None
         if old_album != new_album and old_album:
             old_path = os.path.join('static', image.filename)
             new_dir = os.path.join('static', 'images', 'gallery', album.normalized_name)
-            new_filename = os.path.join('images', 'gallery', album.normalized_name, os.path.basename(image.filename))
             
             # Create new album directory if it doesn't exist
             os.makedirs(new_dir, exist_ok=True)
             
             # Move the file
             if os.path.exists(old_path):
-                new_path = os.path.join('static', new_filename)
-                os.rename(old_path, new_path)
+                # The target album may already have a file with this name
+                new_filename = claim_gallery_filename(album.normalized_name, os.path.basename(image.filename),
+                                                      image.content_hash)
+                os.replace(old_path, os.path.join('static', new_filename))
+                move_derivatives(image.filename, new_filename)
+                moved_from = image.filename
                 image.filename = new_filename
                 
                 # Check if old album is now empty
@@ -1268,7 +3676,19 @@ def edit_image(id):
                         except OSError:
                             pass
         
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            log_exception(database_logger, e, f'moving image {id}')
+            db.session.rollback()
+            if moved_from is not None:
+                # Put the files back where the unchanged row points
+                os.makedirs(os.path.dirname(os.path.join('static', moved_from)), exist_ok=True)
+                os.replace(os.path.join('static', new_filename), os.path.join('static', moved_from))
+                move_derivatives(new_filename, moved_from)
+            flash('Fotografii se nepodařilo uložit, zkuste to prosím znovu.', 'error')
+            return redirect(url_for('edit_image', id=id))
+        refresh_gallery()
         flash('Fotografie byla úspěšně upravena!', 'success')
         return redirect(url_for('manage_gallery'))
     
@@ -1289,6 +3709,8 @@ def delete_image(id):
             os.remove(file_path)
     except OSError:
         pass
+    remove_derivatives(image.filename)
+    remove_original(image)
     
     # Delete from database
     db.session.delete(image)
@@ -1305,9 +3727,27 @@ def delete_image(id):
             except OSError:
                 pass  # Directory might not be empty or already deleted
     
+    refresh_gallery()
     flash('Fotografie byla úspěšně smazána!', 'success')
     return redirect(url_for('manage_gallery'))
 
+@app.route('/admin/gallery/<int:id>/cover', methods=['POST'])
+def pin_album_cover(id):
+    """Pin an image as its album's cover, overriding the automatic choice."""
+    image = GalleryImage.query.get_or_404(id)
+    if not image.album or image.filename.lower().endswith('.mp4'):
+        flash('Tuto položku nelze nastavit jako obálku alba.', 'error')
+        return redirect(url_for('manage_gallery'))
+
+    image.album.cover_image = image.filename
+    image.album.cover_pinned = True
+    db.session.commit()
+    database_logger.info(f"Pinned cover for album {image.album.normalized_name}: {image.filename}")
+
+    refresh_gallery()
+    flash('Obálka alba byla nastavena.', 'success')
+    return redirect(url_for('manage_gallery'))
+
 if __name__ == '__main__':
     # Kontrola systémových závislostí při spuštění
     deps_ok, missing = check_system_dependencies()
@@ -1320,12 +3760,12 @@ if __name__ == '__main__':
     # Vytvoření tabulek DB
     with app.app_context():
         try:
-            db.create_all()
+            upgrade_database_schema()
             app_logger.info("Database tables created/verified successfully")
             
             # Automatická synchronizace DB s файловой системой při spuštění
             try:
-                sync_gallery_with_disk()
+                run_gallery_maintenance()
                 app_logger.info("Database synchronized with filesystem on startup")
             except Exception as sync_error:
                 log_exception(app_logger, sync_error, 'synchronizing database with filesystem on startup')
@@ -1336,6 +3776,9 @@ if __name__ == '__main__':
             print(f"ERROR: Failed to create database tables: {str(db_error)}")
             exit(1)
     
+    start_maintenance_thread()
+    start_job_worker()
+    
     app_logger.info("Starting Třešinky Cetechovice application")
     debug_mode = os.getenv('DEBUG', 'false').lower() == 'true'
     print(f"Debug mode: {debug_mode}")
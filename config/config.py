@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 class Config:
@@ -26,6 +27,42 @@ class Config:
     UPLOAD_FOLDER = os.path.join('static', 'images', 'gallery')
     ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.mp4'}
     
+    # Gallery manifest shared by all gunicorn workers via mmap
+    GALLERY_MANIFEST_PATH = os.getenv('GALLERY_MANIFEST_PATH', os.path.join(os.path.dirname(__file__), "..", "instance", "gallery_manifest.bin"))
+    # Number of images per page in the gallery API and album pages
+    GALLERY_PAGE_SIZE = int(os.getenv('GALLERY_PAGE_SIZE', 24))
+    # Seconds between background gallery maintenance runs (0 disables the thread)
+    GALLERY_MAINTENANCE_INTERVAL = int(os.getenv('GALLERY_MAINTENANCE_INTERVAL', 3600))
+    
+    # Background processing jobs (uploads are queued and converted by a worker thread)
+    UPLOAD_STAGING_DIR = os.getenv('UPLOAD_STAGING_DIR', os.path.join(os.path.dirname(__file__), "..", "instance", "upload_staging"))
+    # Uploaded originals, kept so `flask gallery rebuild` can re-derive outputs under a new spec
+    ORIGINALS_DIR = os.getenv('ORIGINALS_DIR', os.path.join(os.path.dirname(__file__), "..", "instance", "originals"))
+    # Half-built rebuild outputs, kept outside the served static tree until they are swapped in
+    REBUILD_STAGING_DIR = os.getenv('REBUILD_STAGING_DIR', os.path.join(os.path.dirname(__file__), "..", "instance", "rebuild_staging"))
+    # On-demand resized images (/img/<width>/<path>): allowed widths and the LRU disk cache
+    IMAGE_RESIZE_WIDTHS = [int(width) for width in os.getenv('IMAGE_RESIZE_WIDTHS', '160,240,320,480,640,800,960,1200,1600').split(',')]
+    IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(os.path.dirname(__file__), "..", "instance", "image_cache"))
+    IMAGE_CACHE_MAX_MB = int(os.getenv('IMAGE_CACHE_MAX_MB', 512))
+    # Chunked upload sessions without a new chunk for this many seconds are removed by maintenance
+    UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 86400))
+    JOB_WORKER_ENABLED = os.getenv('JOB_WORKER_ENABLED', 'true').lower() == 'true'
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))  # Seconds between queue checks
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 10))  # Seconds, doubled after each failed attempt
+    
+    # Image conversion processes; jobs are admitted while their estimated decode
+    # memory (width x height x bytes per pixel) fits the budget
+    CONVERSION_WORKERS = int(os.getenv('CONVERSION_WORKERS', min(2, os.cpu_count() or 1)))
+    CONVERSION_MEMORY_BUDGET_MB = int(os.getenv('CONVERSION_MEMORY_BUDGET_MB', 192))
+    # AVIF versions of gallery images, encoded by a background job after the WebP
+    # (needs pillow-avif-plugin or Pillow >= 11.3 built with libavif)
+    AVIF_ENABLED = os.getenv('AVIF_ENABLED', 'true').lower() == 'true'
+    
+    # Internal nginx location serving static/ (e.g. /_media/, see config/nginx_media.conf);
+    # when set, gallery media is answered with X-Accel-Redirect instead of by the app
+    MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '')
+    
     # Domain settings
     DOMAIN = os.getenv('DOMAIN', 'localhost:5000')
     USE_HTTPS = os.getenv('USE_HTTPS', 'false').lower() == 'true'
@@ -79,6 +116,16 @@ class TestingConfig(Config):
     TESTING = True
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    GALLERY_MANIFEST_PATH = os.path.join(tempfile.gettempdir(), 'tresinky_test_gallery_manifest.bin')
+    GALLERY_MAINTENANCE_INTERVAL = 0
+    UPLOAD_STAGING_DIR = os.path.join(tempfile.gettempdir(), 'tresinky_test_upload_staging')
+    ORIGINALS_DIR = os.path.join(tempfile.gettempdir(), 'tresinky_test_originals')
+    REBUILD_STAGING_DIR = os.path.join(tempfile.gettempdir(), 'tresinky_test_rebuild_staging')
+    IMAGE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'tresinky_test_image_cache')
+    # Jobs are run synchronously by the tests (the in-memory database is per connection)
+    JOB_WORKER_ENABLED = False
+    CONVERSION_WORKERS = 0  # Convert in the test process
+    AVIF_ENABLED = False  # Enabled by the AVIF tests only, so job counts do not depend on Pillow
     # CSRF disabled for testing
     WTF_CSRF_ENABLED = False
 
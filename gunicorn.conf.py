@@ -9,6 +9,8 @@ backlog = 2048
 # Recommendation: (2 x CPU cores) + 1
 # For production with sufficient RAM, use 4 workers
 # Currently using 1 worker due to 512MB RAM limitation on server
+# Gallery listing is shared between workers through the mmap'ed gallery manifest
+# (GALLERY_MANIFEST_PATH), so adding workers does not duplicate it in memory
 workers = 1
 
 # Worker class
@@ -51,4 +53,18 @@ tmp_upload_dir = None
 # certfile = None
 
 # Performance tuning for low-memory server
-worker_tmp_dir = "/dev/shm"  # Use shared memory for better performance 
\ No newline at end of file
+worker_tmp_dir = "/dev/shm"  # Use shared memory for better performance 
+
+# Server hooks
+def when_ready(server):
+    """Check system dependencies and bring the database schema up to date once, before workers start serving."""
+    from app import app, check_system_dependencies, upgrade_database_schema
+    check_system_dependencies()
+    with app.app_context():
+        upgrade_database_schema()
+
+def post_fork(server, worker):
+    """Start periodic gallery maintenance and the job worker in each worker (file locks let only one of each run at a time)."""
+    from app import start_maintenance_thread, start_job_worker
+    start_maintenance_thread()
+    start_job_worker()
@@ -7,6 +7,10 @@ from pathlib import Path
 project_root = str(Path(__file__).parent.parent)
 sys.path.insert(0, project_root)
 
+# TestingConfig must be selected before the app is imported: the database is
+# bound, the job worker and the conversion process pool are set up at import time
+os.environ['FLASK_ENV'] = 'testing'
+
 # Import the app
 from app import app as flask_app
 from app import db
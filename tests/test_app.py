@@ -2,9 +2,15 @@ import unittest
 import os
 import tempfile
 import shutil
+import json
 from pathlib import Path
+from datetime import datetime
+
+import pytest
 from werkzeug.datastructures import FileStorage
 
+from utils import image_processor
+
 def test_home_page(client):
     """Test if home page loads successfully"""
     response = client.get('/')
@@ -35,6 +41,20 @@ def test_contact_page(client):
     assert response.status_code == 200
     assert b'Kontakt' in response.data
 
+def test_gallery_page_uses_cached_index(client):
+    """Test that repeated /gallery requests do not rebuild the gallery index"""
+    from app import gallery_index
+    
+    response = client.get('/gallery')
+    assert response.status_code == 200
+    assert 'Letecký snímek' in response.data.decode('utf-8')
+    version = gallery_index.version
+    
+    # Opakovaný požadavek nesmí procházet souborový systém
+    response = client.get('/gallery')
+    assert response.status_code == 200
+    assert gallery_index.version == version
+
 def test_sync_gallery_with_disk_function(app, client):
     """Test sync_gallery_with_disk function"""
     from app import sync_gallery_with_disk, GalleryImage, Album, db
@@ -115,9 +135,42 @@ def test_sync_gallery_with_disk_empty_albums(app, client):
         # Проверяем, что пустой альбом удален
         assert Album.query.count() == 0
 
-def test_gallery_route_syncs_database(app, client):
-    """Test that /gallery route calls sync_gallery_with_disk"""
-    from app import sync_gallery_with_disk, GalleryImage, Album, db
+def test_sync_gallery_with_disk_is_incremental(app, client):
+    """Test that only albums whose directory or row count changed are rescanned"""
+    from app import sync_gallery_with_disk, GalleryImage, ImageMetadata, Album, db
+    
+    with app.app_context():
+        album = Album(normalized_name='zz_sync', display_name='zz_sync')
+        db.session.add(album)
+        db.session.commit()
+        album_dir = Path('static/images/gallery/zz_sync')
+        album_dir.mkdir(parents=True, exist_ok=True)
+        (album_dir / 'kept.webp').write_text('fake image data')
+        try:
+            sync_gallery_with_disk()
+            # Nic se nezměnilo: žádné album se znovu neprochází
+            assert sync_gallery_with_disk() == {'rescanned_albums': 0, 'removed_rows': 0, 'removed_albums': 0}
+            
+            # Nový řádek mění počet řádků alba: prochází se jen toto album
+            kept = GalleryImage(filename='images/gallery/zz_sync/kept.webp', album_id=album.id)
+            gone = GalleryImage(filename='images/gallery/zz_sync/gone.webp', album_id=album.id)
+            gone.image_metadata = ImageMetadata({'camera_make': 'Canon'})
+            db.session.add_all([kept, gone])
+            db.session.commit()
+            assert sync_gallery_with_disk() == {'rescanned_albums': 1, 'removed_rows': 1, 'removed_albums': 0}
+            assert [image.filename for image in GalleryImage.query.all()] == ['images/gallery/zz_sync/kept.webp']
+            assert ImageMetadata.query.count() == 0
+            
+            # Smazaný adresář: řádky i prázdné album zmizí
+            shutil.rmtree(album_dir)
+            assert sync_gallery_with_disk() == {'rescanned_albums': 1, 'removed_rows': 1, 'removed_albums': 1}
+            assert Album.query.filter_by(normalized_name='zz_sync').first() is None
+        finally:
+            shutil.rmtree(album_dir, ignore_errors=True)
+
+def test_gallery_route_is_read_only(app, client):
+    """Test that /gallery does not write; orphan rows are removed by maintenance"""
+    from app import run_gallery_maintenance, GalleryImage, Album, db
     
     with app.app_context():
         # Создаем тестовые данные
@@ -136,16 +189,38 @@ def test_gallery_route_syncs_database(app, client):
         # Проверяем, что запись есть
         assert GalleryImage.query.count() == 1
         
-        # Вызываем маршрут /gallery
+        # Voláme route /gallery - nesmí měnit databázi
         response = client.get('/gallery')
         assert response.status_code == 200
+        assert GalleryImage.query.count() == 1
         
-        # Проверяем, что запись о несуществующем файле удалена
+        # Údržba na pozadí smaže záznam o neexistujícím souboru
+        run_gallery_maintenance()
         assert GalleryImage.query.count() == 0
+        assert Album.query.filter_by(normalized_name='test_album').first() is None
+
+def test_gallery_maintenance_prunes_and_creates_albums(app, client):
+    """Test that maintenance removes empty folders and creates missing album rows"""
+    from app import run_gallery_maintenance, get_existing_albums, Album
+    
+    with app.app_context():
+        empty_dir = Path('static/images/gallery/empty_maintenance_album')
+        empty_dir.mkdir(parents=True, exist_ok=True)
         
-        # Очищаем тестовые данные
-        db.session.delete(test_album)
-        db.session.commit()
+        try:
+            # Čtení seznamu alb nevytváří záznamy v databázi
+            albums = get_existing_albums()
+            assert albums
+            assert Album.query.count() == 0
+            
+            summary = run_gallery_maintenance()
+            
+            assert not empty_dir.exists()
+            assert summary['removed_directories'] >= 1
+            assert summary['created_albums'] == len(albums)
+            assert Album.query.filter_by(normalized_name='1950.LEITA').first() is not None
+        finally:
+            shutil.rmtree(empty_dir, ignore_errors=True)
 
 def test_admin_gallery_route_syncs_database(app, client):
     """Test that /admin/gallery route calls sync_gallery_with_disk"""
@@ -175,9 +250,49 @@ def test_admin_gallery_route_syncs_database(app, client):
         # Проверяем, что запись о несуществующем файле удалена
         assert GalleryImage.query.count() == 0
         
-        # Очищаем тестовые данные
-        db.session.delete(test_album)
-        db.session.commit()
+        # Prázdné album se smaže ve stejném průchodu (hromadným DELETE)
+        assert Album.query.filter_by(normalized_name='test_album').first() is None
+
+def test_edit_image_move_keeps_same_named_file_in_target_album(app, client):
+    """Test that moving an image into an album with a same-named file does not overwrite it"""
+    from PIL import Image
+    from app import GalleryImage, Album, db, gallery_index
+    
+    gallery_root = os.path.join('static', 'images', 'gallery')
+    try:
+        for album, color in (('zz_move_a', 'red'), ('zz_move_b', 'blue')):
+            os.makedirs(os.path.join(gallery_root, album), exist_ok=True)
+            Image.new('RGB', (40, 30), color).save(os.path.join(gallery_root, album, 'photo.webp'))
+        with app.app_context():
+            albums = [Album(normalized_name=name, display_name=name) for name in ('zz_move_a', 'zz_move_b')]
+            db.session.add_all(albums)
+            db.session.commit()
+            moved, kept = (GalleryImage(filename=f'images/gallery/{album.normalized_name}/photo.webp',
+                                        title=album.normalized_name, album_id=album.id) for album in albums)
+            db.session.add_all([moved, kept])
+            db.session.commit()
+            moved_id = moved.id
+            gallery_index.refresh()
+        
+        response = client.post(f'/admin/gallery/{moved_id}/edit', data={
+            'title': 'zz_move_a', 'description': '', 'album': 'zz_move_b', 'display_order': 0,
+        })
+        assert response.status_code == 302
+        
+        with app.app_context():
+            moved = db.session.get(GalleryImage, moved_id)
+            # Obsazený název dostane příponu, soubor cílového alba zůstane beze změny
+            assert moved.filename.startswith('images/gallery/zz_move_b/photo-')
+            with Image.open(os.path.join('static', moved.filename)) as image:
+                assert image.convert('RGB').getpixel((5, 5))[0] > 200
+            with Image.open(os.path.join(gallery_root, 'zz_move_b', 'photo.webp')) as image:
+                assert image.convert('RGB').getpixel((5, 5))[2] > 200
+            assert GalleryImage.query.filter_by(filename='images/gallery/zz_move_b/photo.webp').count() == 1
+    finally:
+        for album in ('zz_move_a', 'zz_move_b'):
+            shutil.rmtree(os.path.join(gallery_root, album), ignore_errors=True)
+        with app.app_context():
+            gallery_index.refresh()
 
 def test_contact_form_submission_success(app, client):
     """Test successful contact form submission"""
@@ -382,4 +497,1007 @@ def test_security_settings_logic():
     
     # Verify that PREFERRED_URL_SCHEME is not set (to avoid ProxyFix conflicts)
     # This should remain commented out in config.py
-    assert not hasattr(prod_config, 'PREFERRED_URL_SCHEME')
\ No newline at end of file
+    assert not hasattr(prod_config, 'PREFERRED_URL_SCHEME')
+def test_gallery_api_albums(client):
+    """Test album summaries endpoint"""
+    response = client.get('/api/gallery/albums')
+    assert response.status_code == 200
+    
+    albums = response.get_json()['albums']
+    names = [album['normalized_name'] for album in albums]
+    assert '1950.LEITA' in names
+    assert all(album['image_count'] > 0 for album in albums)
+
+def test_gallery_api_album_cursor_pagination(client):
+    """Test that cursor pagination walks through the whole album without duplicates"""
+    album_name = '2019 brezen duben'
+    first = client.get(f'/api/gallery/albums/{album_name}?limit=5').get_json()
+    total = first['album']['image_count']
+    assert len(first['images']) == 5
+    assert first['next_cursor']
+    
+    # Projdeme všechny stránky podle kurzoru
+    seen = [item['src'] for item in first['images']]
+    cursor = first['next_cursor']
+    while cursor:
+        page = client.get(f'/api/gallery/albums/{album_name}', query_string={'limit': 5, 'cursor': cursor}).get_json()
+        seen.extend(item['src'] for item in page['images'])
+        cursor = page['next_cursor']
+    
+    assert len(seen) == total
+    assert len(set(seen)) == total
+
+def test_gallery_api_album_not_found(client):
+    """Test unknown album and invalid cursor handling"""
+    assert client.get('/api/gallery/albums/does-not-exist').status_code == 404
+    assert client.get('/api/gallery/albums/2019 brezen duben?cursor=%%%').status_code == 400
+
+def test_gallery_album_page(app, client):
+    """Test server-rendered album page with pagination link"""
+    app.config['GALLERY_PAGE_SIZE'] = 5
+    try:
+        response = client.get('/gallery/2019 brezen duben')
+    finally:
+        app.config['GALLERY_PAGE_SIZE'] = 24
+    assert response.status_code == 200
+    html = response.data.decode('utf-8')
+    assert html.count('class="col-md-4 gallery-item"') == 5
+    assert 'Další fotografie' in html
+    assert client.get('/gallery/does-not-exist').status_code == 404
+
+def test_album_sort_keys_precomputed(app):
+    """Test that album sort columns are computed on create and rename"""
+    from app import Album, db
+    
+    with app.app_context():
+        album = Album(normalized_name='2020 cervenec', display_name='2020 - Červenec')
+        assert (album.sort_rank, album.year, album.month) == (1, 2020, 7)
+        
+        # Přejmenování přepočítá klíče řazení
+        album.display_name = 'Pamětní kniha Cetechovice 1927'
+        assert (album.sort_rank, album.year, album.month) == (0, 0, 0)
+        
+        album.display_name = 'Mapy a plány'
+        assert album.sort_rank == 2
+
+def test_upgrade_database_schema_adds_album_columns(app):
+    """Test that schema upgrade adds sort columns to a legacy album table"""
+    from app import Album, db, upgrade_database_schema
+    from sqlalchemy import inspect, text
+    
+    with app.app_context():
+        # Napodobíme staré schéma bez sloupce month
+        db.session.execute(text('DROP INDEX ix_album_sort'))
+        db.session.execute(text('ALTER TABLE album DROP COLUMN month'))
+        db.session.commit()
+        assert 'month' not in {c['name'] for c in inspect(db.engine).get_columns('album')}
+        
+        upgrade_database_schema()
+        upgrade_database_schema()  # Opakované spuštění nic nerozbije
+        
+        assert 'month' in {c['name'] for c in inspect(db.engine).get_columns('album')}
+        assert 'ix_album_sort' in {i['name'] for i in inspect(db.engine).get_indexes('album')}
+
+def test_schema_migrations_index_legacy_database(app):
+    """Test that versioned migrations index an old database once and the hot queries use the indexes"""
+    from app import (GalleryImage, SchemaMigration, db, upgrade_database_schema,
+                     explain_hot_queries, SCHEMA_MIGRATIONS)
+    from sqlalchemy import inspect, text
+    
+    with app.app_context():
+        # Napodobíme staré schéma: bez indexů a s opakujícím se názvem souboru
+        for index in ('ix_gallery_image_filename', 'ix_gallery_image_album_id',
+                      'ix_gallery_image_date', 'ix_donor_donation_date'):
+            db.session.execute(text(f'DROP INDEX {index}'))
+        db.session.add_all([GalleryImage(filename='images/gallery/a/1.webp'),
+                            GalleryImage(filename='images/gallery/a/1.webp')])
+        db.session.commit()
+        assert not any(uses for _, _, uses in explain_hot_queries().values())
+        
+        versions = [version for version, _, _ in SCHEMA_MIGRATIONS]
+        assert upgrade_database_schema() == versions
+        assert upgrade_database_schema() == []  # Opakované spuštění nic neaplikuje
+        
+        assert [m.version for m in SchemaMigration.query.order_by(SchemaMigration.version)] == versions
+        assert GalleryImage.query.filter_by(filename='images/gallery/a/1.webp').count() == 1
+        indexes = {i['name']: i for i in inspect(db.engine).get_indexes('gallery_image')}
+        assert indexes['ix_gallery_image_filename']['unique']
+        assert {'ix_gallery_image_album_id', 'ix_gallery_image_date'} <= set(indexes)
+        
+        plans = explain_hot_queries()
+        assert all(uses for _, _, uses in plans.values()), plans
+
+def test_album_cover_stored_and_pinned(app, client):
+    """Test that maintenance stores deterministic covers and an admin can pin one"""
+    from app import run_gallery_maintenance, gallery_index, Album, GalleryImage, db
+    
+    with app.app_context():
+        run_gallery_maintenance()
+        album = Album.query.filter_by(normalized_name='2019 brezen duben').first()
+        folder = gallery_index.album('2019 brezen duben')
+        
+        # Obálka je největší soubor alba, stejná pro všechny požadavky
+        largest = max((record for record in folder.images.records() if not record.path.endswith('.mp4')),
+                      key=lambda record: record.size)
+        assert album.cover_image == folder.cover_image == largest.path
+        assert not album.cover_pinned
+        
+        other = next(path for path in folder.images if path != largest.path)
+        image = GalleryImage(filename=other, album_id=album.id)
+        db.session.add(image)
+        db.session.commit()
+        
+        response = client.post(f'/admin/gallery/{image.id}/cover')
+        assert response.status_code == 302
+        
+        db.session.refresh(album)
+        assert album.cover_pinned
+        assert album.cover_image == other
+        
+        # Připnutá obálka zůstane i po opakovaném prohledání
+        run_gallery_maintenance()
+        assert gallery_index.album('2019 brezen duben').cover_image == other
+
+def test_content_pages_conditional_get(app, client, monkeypatch):
+    """Test that content pages answer revalidation with 304 before rendering"""
+    import app as app_module
+    
+    for url in ['/', '/o-nas', '/sad', '/les']:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.headers['ETag'].startswith('W/"')
+        assert 'no-cache' in response.headers['Cache-Control']
+        assert response.headers.get('Last-Modified')
+    
+    etag = client.get('/').headers['ETag']
+    last_modified = client.get('/').headers['Last-Modified']
+    
+    # Při shodě validátorů se šablona nevykresluje
+    def fail_render(*args, **kwargs):
+        raise AssertionError('template rendered')
+    monkeypatch.setattr(app_module, 'render_template', fail_render)
+    
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    
+    response = client.get('/o-nas', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+def test_gallery_etag_follows_gallery_generation(app, client):
+    """Test that the gallery ETag changes when the gallery is rescanned"""
+    from app import gallery_index
+    
+    etag = client.get('/gallery').headers['ETag']
+    assert client.get('/gallery', headers={'If-None-Match': etag}).status_code == 304
+    
+    with app.app_context():
+        gallery_index.refresh()
+    
+    response = client.get('/gallery', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_conditional_get_skipped_with_flashed_messages(client):
+    """Test that pages with pending flash messages are always rendered"""
+    etag = client.get('/').headers['ETag']
+    
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('success', 'Zpráva byla odeslána')]
+    
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert 'Zpráva byla odeslána' in response.get_data(as_text=True)
+
+def test_content_pages_served_precompressed_from_cache(app, client, monkeypatch):
+    """Test that static content pages are rendered once and served pre-encoded"""
+    import gzip
+    import app as app_module
+    
+    app_module.page_cache.clear()
+    calls = []
+    original_render = app_module.render_template
+    def counting_render(*args, **kwargs):
+        calls.append(args[0])
+        return original_render(*args, **kwargs)
+    monkeypatch.setattr(app_module, 'render_template', counting_render)
+    
+    plain = client.get('/sad', headers={'Accept-Encoding': 'identity'})
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    
+    compressed = client.get('/sad', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    
+    # Šablona se vykreslí jednou za proces
+    client.get('/sad', headers={'Accept-Encoding': 'gzip, deflate, br'})
+    assert calls == ['orchard.html']
+
+def test_gallery_api_emits_srcset_for_derivatives(app, client, tmp_path, monkeypatch):
+    """Test that images with derivatives get a srcset in the API and the album page"""
+    from app import gallery_index
+    from utils.image_processor import generate_derivatives
+    
+    monkeypatch.setattr(gallery_index, 'derivatives_root', tmp_path)
+    folder = gallery_index.album('1950.LEITA')
+    path = next(path for path in folder.images if not path.endswith('.mp4'))
+    widths = generate_derivatives(os.path.join('static', path), str(tmp_path / '1950.LEITA'))
+    assert widths
+    
+    with app.app_context():
+        gallery_index.refresh()
+    try:
+        data = client.get('/api/gallery/albums/1950.LEITA?limit=100').get_json()
+        image = next(image for image in data['images'] if image['src'].endswith(path))
+        assert f"-{widths[0]}w.webp {widths[0]}w" in image['srcset']
+        
+        html = client.get('/gallery/1950.LEITA').get_data(as_text=True)
+        assert 'srcset=' in html and 'sizes="(min-width: 768px) 33vw, 100vw"' in html
+    finally:
+        monkeypatch.undo()
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_upload_is_queued_and_processed_by_job(app, client):
+    """Test that an upload answers 202 with a job and the job converts the file"""
+    import io
+    from PIL import Image
+    from app import db, run_pending_jobs, ProcessingJob, GalleryImage
+    
+    buffer = io.BytesIO()
+    Image.new('RGB', (1600, 1200), 'red').save(buffer, 'JPEG')
+    buffer.seek(0)
+    
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_job_test')
+    derivatives_dir = os.path.join('static', 'images', 'derivatives', 'zz_job_test')
+    try:
+        response = client.post('/admin/upload', data={
+            'album': '',
+            'new_album': 'zz_job_test',
+            'title': 'Job test',
+            'description': '',
+            'image': (buffer, 'job_test.jpg'),
+        }, content_type='multipart/form-data')
+        assert response.status_code == 202
+        data = response.get_json()
+        assert data['success'] and data['status'] == 'queued'
+        
+        # Ve frontě, soubor ještě není v galerii
+        assert not os.path.exists(os.path.join(album_dir, 'job_test.webp'))
+        assert client.get(data['status_url']).get_json()['status'] == 'queued'
+        
+        with app.app_context():
+            assert run_pending_jobs() == 1
+            job = db.session.get(ProcessingJob, data['job_id'])
+            assert job.status == 'completed' and job.attempts == 1
+            assert GalleryImage.query.filter_by(filename='images/gallery/zz_job_test/job_test.webp').count() == 1
+        
+        assert os.path.exists(os.path.join(album_dir, 'job_test.webp'))
+        status = client.get(data['status_url']).get_json()
+        assert status['status'] == 'completed'
+        assert status['result']['path'] == 'images/gallery/zz_job_test/job_test.webp'
+        assert not os.listdir(app.config['UPLOAD_STAGING_DIR'])
+        
+        # Rozmazaný náhled z téhož dekódování se vrací v API i na stránce alba
+        placeholder = client.get('/api/gallery/albums/zz_job_test').get_json()['images'][0]['placeholder']
+        assert placeholder.startswith('data:image/webp;base64,')
+        assert f"background-image: url('{placeholder}')" in client.get('/gallery/zz_job_test').data.decode('utf-8')
+        
+        # Rozměry a velikost se ukládají při zpracování, šablona nemusí soubor otevírat
+        with app.app_context():
+            image = GalleryImage.query.filter_by(filename='images/gallery/zz_job_test/job_test.webp').one()
+            assert (image.width, image.height) == (1200, 900)
+            assert image.aspect_ratio == 1200 / 900
+            assert image.file_size == os.path.getsize(os.path.join(album_dir, 'job_test.webp'))
+            # Metadata se čtou ve stejném dekódování a ukládají do vlastní tabulky
+            assert (image.image_metadata.original_width, image.image_metadata.original_height) == (1600, 1200)
+            assert image.image_metadata.orientation == 1
+        item = client.get('/api/gallery/albums/zz_job_test').get_json()['images'][0]
+        assert (item['width'], item['height']) == (1200, 900)
+        assert 'width="1200" height="900"' in client.get('/gallery/zz_job_test').data.decode('utf-8')
+    finally:
+        shutil.rmtree(album_dir, ignore_errors=True)
+        shutil.rmtree(derivatives_dir, ignore_errors=True)
+        from app import gallery_index
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_dimension_backfill_records_header_sizes(app):
+    """Test that the backfill fills in frame and byte sizes from file headers in parallel"""
+    from PIL import Image
+    from app import db, GalleryImage, backfill_image_dimensions
+    
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_dimensions')
+    os.makedirs(album_dir, exist_ok=True)
+    Image.new('RGB', (300, 200)).save(os.path.join(album_dir, 'wide.webp'))
+    Image.new('RGB', (200, 300)).save(os.path.join(album_dir, 'tall.webp'))
+    try:
+        with app.app_context():
+            for name in ('wide.webp', 'tall.webp', 'missing.webp'):
+                db.session.add(GalleryImage(filename=f'images/gallery/zz_dimensions/{name}'))
+            db.session.commit()
+            
+            assert backfill_image_dimensions(workers=2) == {'updated': 2, 'failed': 1}
+            sizes = {os.path.basename(image.filename): (image.width, image.height, image.file_size)
+                     for image in GalleryImage.query.filter(GalleryImage.filename.like('%zz_dimensions%'))}
+            assert sizes['wide.webp'] == (300, 200, os.path.getsize(os.path.join(album_dir, 'wide.webp')))
+            assert sizes['tall.webp'][:2] == (200, 300)
+            assert sizes['missing.webp'] == (None, None, None)
+            
+            # Už zaznamenané soubory se znovu nečtou
+            assert backfill_image_dimensions(workers=2) == {'updated': 0, 'failed': 1}
+    finally:
+        shutil.rmtree(album_dir, ignore_errors=True)
+        from app import gallery_index
+        with app.app_context():
+            GalleryImage.query.filter(GalleryImage.filename.like('%zz_dimensions%')).delete(synchronize_session=False)
+            db.session.commit()
+            gallery_index.refresh()
+
+def test_metadata_backfill_resumes_in_process_pool(app):
+    """Test that the metadata backfill commits per batch and skips files already read"""
+    from PIL import Image
+    from app import db, GalleryImage, ImageMetadata, backfill_image_metadata
+    
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_metadata')
+    os.makedirs(album_dir, exist_ok=True)
+    names = [f'photo{index}.webp' for index in range(3)]
+    for name in names:
+        Image.new('RGB', (300, 200)).save(os.path.join(album_dir, name))
+    # Uložený originál má přednost před zmenšeným WebP
+    os.makedirs(app.config['ORIGINALS_DIR'], exist_ok=True)
+    original_path = os.path.join(app.config['ORIGINALS_DIR'], 'zz_metadata_photo2.jpg')
+    Image.new('RGB', (1200, 800)).save(original_path, 'JPEG')
+    try:
+        with app.app_context():
+            for name in names + ['missing.webp']:
+                db.session.add(GalleryImage(filename=f'images/gallery/zz_metadata/{name}'))
+            db.session.commit()
+            GalleryImage.query.filter_by(filename='images/gallery/zz_metadata/photo2.webp').one().original = 'zz_metadata_photo2.jpg'
+            db.session.commit()
+            # Archivní řádky mimo tento test už metadata mají
+            others = GalleryImage.query.filter(~GalleryImage.filename.like('%zz_metadata%')).all()
+            for image in others:
+                image.image_metadata = ImageMetadata({})
+            db.session.commit()
+            
+            # Přerušený běh: první dávka je uložená, zbytek se doplní příště
+            def interrupt(done, total):
+                if done < total:
+                    raise KeyboardInterrupt
+            with pytest.raises(KeyboardInterrupt):
+                backfill_image_metadata(workers=0, batch_size=2, progress=interrupt)
+            assert ImageMetadata.query.join(GalleryImage).filter(GalleryImage.filename.like('%zz_metadata%')).count() == 2
+            
+            progress = []
+            summary = backfill_image_metadata(workers=1, batch_size=2, progress=lambda *args: progress.append(args))
+            assert summary == {'stored': 1, 'failed': 1, 'total': 2}
+            assert progress == [(2, 2)]
+            image = GalleryImage.query.filter_by(filename='images/gallery/zz_metadata/photo0.webp').one()
+            assert (image.image_metadata.original_width, image.image_metadata.original_height) == (300, 200)
+            image = GalleryImage.query.filter_by(filename='images/gallery/zz_metadata/photo2.webp').one()
+            assert (image.image_metadata.original_width, image.image_metadata.original_height) == (1200, 800)
+    finally:
+        shutil.rmtree(album_dir, ignore_errors=True)
+        os.remove(original_path)
+        from app import gallery_index
+        with app.app_context():
+            for image in GalleryImage.query.filter(GalleryImage.filename.like('%zz_metadata%')).all():
+                db.session.delete(image)
+            ImageMetadata.query.delete()
+            db.session.commit()
+            gallery_index.refresh()
+
+def test_rebuild_rederives_outputs_from_stored_originals(app, client, tmp_path, monkeypatch):
+    """Test that originals are kept and a spec change rebuilds outputs once, swapping them in"""
+    import io
+    from PIL import Image
+    from app import (DERIVATIVES_ROOT, GalleryImage, current_output_spec, original_file,
+                     rebuild_gallery_outputs, run_pending_jobs)
+    
+    monkeypatch.setitem(app.config, 'ORIGINALS_DIR', str(tmp_path / 'originals'))
+    buffer = io.BytesIO()
+    Image.new('RGB', (1600, 1200), 'blue').save(buffer, 'JPEG')
+    buffer.seek(0)
+    
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_rebuild')
+    derivatives_dir = os.path.join(DERIVATIVES_ROOT, 'zz_rebuild')
+    main_path = os.path.join(album_dir, 'rebuild.webp')
+    try:
+        client.post('/admin/upload', data={
+            'album': '', 'new_album': 'zz_rebuild', 'title': '', 'description': '',
+            'image': (buffer, 'rebuild.jpg'),
+        }, content_type='multipart/form-data')
+        with app.app_context():
+            assert run_pending_jobs() == 1
+            image = GalleryImage.query.filter_by(filename='images/gallery/zz_rebuild/rebuild.webp').one()
+            # Originál zůstává v úložišti podle obsahu, staging je prázdný
+            assert image.original.endswith('.jpg')
+            with Image.open(original_file(image)) as original:
+                assert original.size == (1600, 1200)
+            assert image.output_spec == current_output_spec()
+            assert not os.listdir(app.config['UPLOAD_STAGING_DIR'])
+            
+            # Beze změny specifikace není co dělat
+            assert rebuild_gallery_outputs()['rebuilt'] == 0
+            
+            old_size, old_spec = os.path.getsize(main_path), image.output_spec
+            # Zastaralá derivace, kterou nová specifikace nezapisuje
+            with open(os.path.join(derivatives_dir, 'rebuild-1920w.webp'), 'wb') as stale:
+                stale.write(b'old')
+            monkeypatch.setattr(image_processor, 'WEBP_QUALITY', 40)
+            progress = []
+            summary = rebuild_gallery_outputs(workers=2, progress=lambda *args: progress.append(args))
+            assert summary['rebuilt'] == 1 and summary['failed'] == 0
+            assert summary['spec'] == current_output_spec() != old_spec
+            assert progress == [(1, 1)]
+            
+            image = GalleryImage.query.filter_by(filename='images/gallery/zz_rebuild/rebuild.webp').one()
+            assert image.output_spec == current_output_spec()
+            assert image.file_size == os.path.getsize(main_path) != old_size
+            assert image.derivative_widths == '320,640,1200'
+            assert not os.path.exists(os.path.join(derivatives_dir, 'rebuild-1920w.webp'))
+            assert os.path.exists(os.path.join(derivatives_dir, 'rebuild-640w.webp'))
+            assert not [name for name in os.listdir(DERIVATIVES_ROOT) if name.startswith('.rebuild.')]
+            
+            # Hotové obrázky se při dalším běhu přeskočí
+            assert rebuild_gallery_outputs()['rebuilt'] == 0
+    finally:
+        shutil.rmtree(album_dir, ignore_errors=True)
+        shutil.rmtree(derivatives_dir, ignore_errors=True)
+        from app import gallery_index
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_resized_image_endpoint(app, client, tmp_path, monkeypatch):
+    """Test that /img/<width>/<path> resizes allowed widths once and serves them from the disk cache"""
+    import io
+    from PIL import Image
+    import app as app_module
+    from utils import ResizeCache
+    
+    monkeypatch.setattr(app_module, 'resize_cache', ResizeCache(str(tmp_path / 'cache'), 10 * 1024 * 1024))
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_resize')
+    os.makedirs(album_dir, exist_ok=True)
+    Image.new('RGB', (1200, 800), 'green').save(os.path.join(album_dir, 'photo.webp'))
+    calls = []
+    original_resize = image_processor.resize_image
+    monkeypatch.setattr(image_processor, 'resize_image',
+                        lambda *args: calls.append(args[2]) or original_resize(*args))
+    try:
+        response = client.get('/img/480/images/gallery/zz_resize/photo.webp')
+        assert response.status_code == 200
+        assert response.mimetype == 'image/webp'
+        with Image.open(io.BytesIO(response.data)) as img:
+            assert img.size == (480, 320)
+        
+        # Druhý požadavek jde z cache, podmíněný dostane 304
+        etag = response.headers['ETag']
+        assert client.get('/img/480/images/gallery/zz_resize/photo.webp').data == response.data
+        assert client.get('/img/480/images/gallery/zz_resize/photo.webp',
+                          headers={'If-None-Match': etag}).status_code == 304
+        assert calls == [480]
+        
+        # Obrázek se nezvětšuje
+        with Image.open(io.BytesIO(client.get('/img/1600/images/gallery/zz_resize/photo.webp').data)) as img:
+            assert img.size == (1200, 800)
+        
+        # Jen povolené šířky, obrázky a soubory uvnitř static/images
+        assert client.get('/img/500/images/gallery/zz_resize/photo.webp').status_code == 404
+        assert client.get('/img/480/images/gallery/zz_resize/missing.webp').status_code == 404
+        assert client.get('/img/480/images/../robots.txt').status_code == 404
+        assert client.get('/img/480/css/style.css').status_code == 404
+    finally:
+        shutil.rmtree(album_dir, ignore_errors=True)
+
+def test_failed_job_is_retried_then_failed(app, client, monkeypatch):
+    """Test retry with backoff and the final failed state with cleanup"""
+    from app import db, JOB_HANDLERS, ProcessingJob, enqueue_job, run_pending_jobs
+    
+    calls, cleaned = [], []
+    def failing(payload):
+        calls.append(payload)
+        raise RuntimeError('boom')
+    monkeypatch.setitem(JOB_HANDLERS, 'test_fail', (failing, cleaned.append))
+    
+    with app.app_context():
+        job = enqueue_job('test_fail', {'secure_name': 'x.jpg'})
+        assert run_pending_jobs() == 1
+        db.session.refresh(job)
+        assert job.status == 'queued' and job.attempts == 1 and job.error == 'boom'
+        # Opakování je odložené: fronta je hned prázdná
+        assert job.run_after > datetime.now()
+        assert run_pending_jobs() == 0
+        
+        for _ in range(job.max_attempts - 1):
+            job.run_after = datetime.now()
+            db.session.commit()
+            assert run_pending_jobs() == 1
+        
+        db.session.refresh(job)
+        assert job.status == 'failed' and job.attempts == job.max_attempts
+        assert len(calls) == job.max_attempts
+        assert cleaned == [{'secure_name': 'x.jpg'}]
+    
+    assert client.get(f'/api/jobs/{job.id}').get_json()['status'] == 'failed'
+    assert client.get('/api/jobs/999999').status_code == 404
+
+def test_interrupted_jobs_recovered(app):
+    """Test that jobs left running by a dead worker are re-queued"""
+    from app import db, ProcessingJob, recover_interrupted_jobs
+    
+    with app.app_context():
+        job = ProcessingJob('gallery_upload', {'staged_path': '/nonexistent', 'secure_name': 'a.jpg'})
+        job.status = 'running'
+        job.attempts = 1
+        exhausted = ProcessingJob('gallery_upload', {'staged_path': '/nonexistent', 'secure_name': 'b.jpg'})
+        exhausted.status = 'running'
+        exhausted.attempts = exhausted.max_attempts
+        db.session.add_all([job, exhausted])
+        db.session.commit()
+        
+        assert recover_interrupted_jobs() == 2
+        assert job.status == 'queued'
+        assert exhausted.status == 'failed'
+
+def test_duplicate_upload_skips_conversion(app, client):
+    """Test that a re-upload returns the stored image or links it into another album"""
+    import io
+    from PIL import Image
+    from app import db, run_pending_jobs, GalleryImage, gallery_index
+    
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), 'blue').save(buffer, 'JPEG')
+    content = buffer.getvalue()
+    
+    def upload(album, name):
+        return client.post('/admin/upload', data={
+            'album': '',
+            'new_album': album,
+            'title': 'Dup test',
+            'description': '',
+            'image': (io.BytesIO(content), name),
+        }, content_type='multipart/form-data')
+    
+    gallery_root = os.path.join('static', 'images', 'gallery')
+    derivatives_root = os.path.join('static', 'images', 'derivatives')
+    try:
+        assert upload('zz_dup_a', 'dup.jpg').status_code == 202
+        with app.app_context():
+            assert run_pending_jobs() == 1
+            original = GalleryImage.query.filter_by(filename='images/gallery/zz_dup_a/dup.webp').one()
+            assert len(original.content_hash) == 64
+        
+        # Stejné album: vrátí se existující obrázek, úloha se nevytvoří
+        response = upload('zz_dup_a', 'dup_again.jpg')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['duplicate'] and not data['linked'] and data['image_id'] == original.id
+        assert not os.path.exists(os.path.join(gallery_root, 'zz_dup_a', 'dup_again.webp'))
+        
+        # Jiné album: soubor se propojí pevným odkazem bez konverze
+        data = upload('zz_dup_b', 'dup.jpg').get_json()
+        assert data['duplicate'] and data['linked']
+        assert data['path'] == 'images/gallery/zz_dup_b/dup.webp'
+        assert os.path.samefile(os.path.join(gallery_root, 'zz_dup_a', 'dup.webp'),
+                                os.path.join(gallery_root, 'zz_dup_b', 'dup.webp'))
+        with app.app_context():
+            assert run_pending_jobs() == 0
+            linked = db.session.get(GalleryImage, data['image_id'])
+            assert linked.content_hash is None
+            assert GalleryImage.query.count() == 2
+        assert not os.listdir(app.config['UPLOAD_STAGING_DIR'])
+    finally:
+        for album in ('zz_dup_a', 'zz_dup_b'):
+            shutil.rmtree(os.path.join(gallery_root, album), ignore_errors=True)
+            shutil.rmtree(os.path.join(derivatives_root, album), ignore_errors=True)
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_duplicate_link_skips_taken_names(app, client):
+    """Test that a linked duplicate never points at an unrelated file already in the album"""
+    import io
+    import hashlib
+    from PIL import Image
+    from app import db, run_pending_jobs, GalleryImage, gallery_index
+    
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 600), 'green').save(buffer, 'JPEG')
+    content = buffer.getvalue()
+    suffix = hashlib.sha256(content).hexdigest()[:8]
+    
+    def upload(album):
+        return client.post('/admin/upload', data={
+            'album': '',
+            'new_album': album,
+            'title': 'Link test',
+            'description': '',
+            'image': (io.BytesIO(content), 'link.jpg'),
+        }, content_type='multipart/form-data')
+    
+    gallery_root = os.path.join('static', 'images', 'gallery')
+    derivatives_root = os.path.join('static', 'images', 'derivatives')
+    try:
+        assert upload('zz_link_a').status_code == 202
+        with app.app_context():
+            assert run_pending_jobs() == 1
+        
+        # Obě jména, která by odkaz použil, už v cílovém albu leží jako cizí soubory
+        os.makedirs(os.path.join(gallery_root, 'zz_link_b'))
+        for name in ('link.webp', f'link-{suffix}.webp'):
+            with open(os.path.join(gallery_root, 'zz_link_b', name), 'wb') as stray:
+                stray.write(b'unrelated')
+        
+        data = upload('zz_link_b').get_json()
+        assert data['duplicate'] and data['linked']
+        assert data['path'] == f'images/gallery/zz_link_b/link-{suffix}-2.webp'
+        assert os.path.samefile(os.path.join(gallery_root, 'zz_link_a', 'link.webp'),
+                                os.path.join('static', data['path']))
+        for name in ('link.webp', f'link-{suffix}.webp'):
+            with open(os.path.join(gallery_root, 'zz_link_b', name), 'rb') as stray:
+                assert stray.read() == b'unrelated'
+        with app.app_context():
+            assert db.session.get(GalleryImage, data['image_id']).filename == data['path']
+    finally:
+        for album in ('zz_link_a', 'zz_link_b'):
+            shutil.rmtree(os.path.join(gallery_root, album), ignore_errors=True)
+            shutil.rmtree(os.path.join(derivatives_root, album), ignore_errors=True)
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_upload_with_taken_name_gets_its_own_file(app, client):
+    """Test that a different image uploaded under a name already in the album does not overwrite it"""
+    import io
+    from PIL import Image
+    from app import run_pending_jobs, GalleryImage, ProcessingJob, gallery_index
+    
+    def upload(color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (400, 300), color).save(buffer, 'JPEG')
+        return client.post('/admin/upload', data={
+            'album': '',
+            'new_album': 'zz_same_name',
+            'title': color,
+            'description': '',
+            'image': (io.BytesIO(buffer.getvalue()), 'IMG_0001.jpg'),
+        }, content_type='multipart/form-data')
+    
+    gallery_root = os.path.join('static', 'images', 'gallery')
+    derivatives_root = os.path.join('static', 'images', 'derivatives')
+    try:
+        assert upload('red').status_code == 202
+        assert upload('blue').status_code == 202
+        with app.app_context():
+            assert run_pending_jobs() == 2
+            assert ProcessingJob.query.filter_by(status='completed').count() == 2
+            
+            red = GalleryImage.query.filter_by(title='red').one()
+            blue = GalleryImage.query.filter_by(title='blue').one()
+            assert red.filename == 'images/gallery/zz_same_name/IMG_0001.webp'
+            # Obsazený název dostane příponu s hashem obsahu
+            assert blue.filename == f'images/gallery/zz_same_name/IMG_0001-{blue.content_hash[:8]}.webp'
+            
+            for image, expected in ((red, (255, 0, 0)), (blue, (0, 0, 255))):
+                with Image.open(os.path.join('static', image.filename)) as stored:
+                    pixel = stored.convert('RGB').getpixel((10, 10))
+                assert all(abs(a - b) < 16 for a, b in zip(pixel, expected)), (image.filename, pixel)
+    finally:
+        shutil.rmtree(os.path.join(gallery_root, 'zz_same_name'), ignore_errors=True)
+        shutil.rmtree(os.path.join(derivatives_root, 'zz_same_name'), ignore_errors=True)
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_chunked_upload_resumes_and_finalizes(app, client):
+    """Test the resumable upload protocol: create, PATCH at offset, resume, finalize"""
+    import io
+    import hashlib
+    from PIL import Image
+    from app import db, run_pending_jobs, upload_hashers, GalleryImage, UploadSession, gallery_index
+    
+    buffer = io.BytesIO()
+    Image.new('RGB', (900, 600), 'yellow').save(buffer, 'JPEG')
+    content = buffer.getvalue()
+    half = len(content) // 2
+    
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_chunk_test')
+    derivatives_dir = os.path.join('static', 'images', 'derivatives', 'zz_chunk_test')
+    try:
+        response = client.post('/api/uploads', data={
+            'album': '', 'new_album': 'zz_chunk_test', 'title': '', 'description': '',
+            'filename': 'chunk.jpg', 'size': len(content),
+        })
+        assert response.status_code == 201
+        session = response.get_json()
+        assert session['offset'] == 0 and session['size'] == len(content)
+        
+        def patch(offset, data):
+            return client.patch(session['upload_url'], data=data, headers={
+                'Upload-Offset': str(offset), 'Content-Type': 'application/offset+octet-stream'})
+        
+        response = patch(0, content[:half])
+        assert response.status_code == 200 and response.get_json()['offset'] == half
+        
+        # Opakování už přijatého kusu: server vrátí svůj offset
+        response = patch(0, content[:half])
+        assert response.status_code == 409 and response.get_json()['offset'] == half
+        
+        # Nedokončené nahrávání nelze dokončit
+        assert client.post(session['finalize_url']).status_code == 409
+        
+        # Pokračování v "jiném procesu": hash se přepočítá z part souboru
+        upload_hashers.clear()
+        response = client.get(session['upload_url'])
+        assert response.headers['Upload-Offset'] == str(half)
+        assert patch(half, content[half:]).get_json()['offset'] == len(content)
+        
+        response = client.post(session['finalize_url'])
+        assert response.status_code == 202
+        data = response.get_json()
+        assert client.get(session['upload_url']).status_code == 404
+        
+        with app.app_context():
+            assert UploadSession.query.count() == 0
+            assert run_pending_jobs() == 1
+            image = GalleryImage.query.filter_by(filename='images/gallery/zz_chunk_test/chunk.webp').one()
+            assert image.content_hash == hashlib.sha256(content).hexdigest()
+        assert client.get(data['status_url']).get_json()['status'] == 'completed'
+    finally:
+        shutil.rmtree(album_dir, ignore_errors=True)
+        shutil.rmtree(derivatives_dir, ignore_errors=True)
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_chunked_upload_rejects_oversize_and_expires(app, client):
+    """Test size limits of upload sessions and expiry of abandoned sessions"""
+    from app import db, UploadSession, expire_upload_sessions, upload_part_path
+    
+    fields = {'album': '', 'new_album': 'zz_chunk_test', 'title': '', 'description': '', 'filename': 'big.mp4'}
+    too_big = app.config['MAX_CONTENT_LENGTH'] + 1
+    assert client.post('/api/uploads', data=dict(fields, size=too_big)).status_code == 413
+    
+    session = client.post('/api/uploads', data=dict(fields, size=4)).get_json()
+    response = client.patch(session['upload_url'], data=b'12345', headers={'Upload-Offset': '0'})
+    assert response.status_code == 413
+    
+    with app.app_context():
+        upload = db.session.get(UploadSession, session['id'])
+        part_path = upload_part_path(upload)
+        assert os.path.exists(part_path)
+        upload.updated_at = datetime(2000, 1, 1)
+        db.session.commit()
+        assert expire_upload_sessions() == 1
+        assert not os.path.exists(part_path)
+
+def test_batch_upload_returns_per_file_results(app, client):
+    """Test that a batch upload validates once and reports each file"""
+    import io
+    from PIL import Image
+    from app import db, run_pending_jobs, GalleryImage, ProcessingJob, gallery_index
+    
+    def jpeg(color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), color).save(buffer, 'JPEG')
+        return buffer.getvalue()
+    
+    red, green = jpeg('red'), jpeg('green')
+    gallery_root = os.path.join('static', 'images', 'gallery')
+    derivatives_root = os.path.join('static', 'images', 'derivatives')
+    try:
+        response = client.post('/admin/upload/batch', data={
+            'album': '', 'new_album': 'zz_batch_a', 'title': '', 'description': '',
+            'images': [(io.BytesIO(red), 'red.jpg'), (io.BytesIO(green), 'green.jpg'),
+                       (io.BytesIO(red), 'red_copy.jpg'), (io.BytesIO(b'text'), 'notes.txt')],
+        }, content_type='multipart/form-data')
+        assert response.status_code == 202
+        data = response.get_json()
+        assert [result['status'] for result in data['results']] == ['queued', 'queued', 'duplicate', 'error']
+        assert (data['queued'], data['duplicate'], data['error']) == (2, 1, 1)
+        
+        with app.app_context():
+            assert ProcessingJob.query.count() == 2
+            assert run_pending_jobs() == 2
+            assert GalleryImage.query.count() == 2
+        
+        # Už známý soubor v jiném albu: odkaz bez úlohy konverze
+        response = client.post('/admin/upload/batch', data={
+            'album': '', 'new_album': 'zz_batch_b', 'title': '', 'description': '',
+            'images': [(io.BytesIO(green), 'green.jpg')],
+        }, content_type='multipart/form-data')
+        assert response.status_code == 200
+        result = response.get_json()['results'][0]
+        assert result['status'] == 'duplicate' and result['linked']
+        assert os.path.exists(os.path.join(gallery_root, 'zz_batch_b', 'green.webp'))
+        with app.app_context():
+            assert ProcessingJob.query.count() == 2
+            assert GalleryImage.query.count() == 3
+        assert not os.listdir(app.config['UPLOAD_STAGING_DIR'])
+        
+        assert client.post('/admin/upload/batch', data={'album': '', 'new_album': 'zz_batch_a'}).status_code == 400
+    finally:
+        for album in ('zz_batch_a', 'zz_batch_b'):
+            shutil.rmtree(os.path.join(gallery_root, album), ignore_errors=True)
+            shutil.rmtree(os.path.join(derivatives_root, album), ignore_errors=True)
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_failed_batch_upload_leaves_no_album(app, client, monkeypatch):
+    """Test that a batch failing after its album was created rolls the album back with the rest"""
+    import io
+    import hashlib
+    from PIL import Image
+    import app as app_module
+    from app import Album, GalleryImage, ProcessingJob, db
+    
+    def jpeg(color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), color).save(buffer, 'JPEG')
+        return buffer.getvalue()
+    
+    red, green = jpeg('red'), jpeg('green')
+    gallery_root = os.path.join('static', 'images', 'gallery')
+    derivatives_root = os.path.join('static', 'images', 'derivatives')
+    os.makedirs(os.path.join(gallery_root, 'zz_batch_src'), exist_ok=True)
+    with open(os.path.join(gallery_root, 'zz_batch_src', 'red.webp'), 'wb') as f:
+        f.write(red)
+    with app.app_context():
+        stored = GalleryImage(filename='images/gallery/zz_batch_src/red.webp')
+        stored.content_hash = hashlib.sha256(red).hexdigest()
+        db.session.add(stored)
+        db.session.commit()
+    
+    # Duplikát vytvoří album, pak selže zařazení dalšího souboru do fronty
+    def failing_enqueue(*args, **kwargs):
+        raise RuntimeError('queue unavailable')
+    monkeypatch.setattr(app_module, 'enqueue_job', failing_enqueue)
+    try:
+        response = client.post('/admin/upload/batch', data={
+            'album': '', 'new_album': 'zz_batch_fail', 'title': '', 'description': '',
+            'images': [(io.BytesIO(red), 'red.jpg'), (io.BytesIO(green), 'green.jpg')],
+        }, content_type='multipart/form-data')
+        assert response.status_code == 500
+        with app.app_context():
+            assert Album.query.filter_by(normalized_name='zz_batch_fail').first() is None
+            assert GalleryImage.query.count() == 1
+            assert ProcessingJob.query.count() == 0
+        assert not os.listdir(app.config['UPLOAD_STAGING_DIR'])
+    finally:
+        for album in ('zz_batch_src', 'zz_batch_fail'):
+            shutil.rmtree(os.path.join(gallery_root, album), ignore_errors=True)
+            shutil.rmtree(os.path.join(derivatives_root, album), ignore_errors=True)
+
+def test_video_poster_and_mobile_variants_are_served(app, client):
+    """Test that videos are listed with their poster frame and mobile variants instead of a srcset"""
+    from app import gallery_index, remove_derivatives
+    
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_video')
+    derivatives_dir = os.path.join('static', 'images', 'derivatives', 'zz_video')
+    os.makedirs(album_dir, exist_ok=True)
+    os.makedirs(derivatives_dir, exist_ok=True)
+    try:
+        with open(os.path.join(album_dir, 'clip.mp4'), 'wb') as f:
+            f.write(b'video')
+        # Plakát používá řadu odvozených obrázků, varianty příponu výšky
+        for name in ('clip-320w.webp', 'clip-640w.webp', 'clip-1200w.webp', 'clip-480p.mp4', 'clip-720p.mp4'):
+            with open(os.path.join(derivatives_dir, name), 'wb') as f:
+                f.write(b'x')
+        with app.app_context():
+            gallery_index.refresh()
+        
+        item = client.get('/api/gallery/albums/zz_video').get_json()['images'][0]
+        assert item['type'] == 'video'
+        assert item['poster'].endswith('/images/derivatives/zz_video/clip-640w.webp')
+        assert [source['height'] for source in item['sources']] == [720, 480]
+        assert 'srcset' not in item
+        
+        html = client.get('/gallery/zz_video').data.decode('utf-8')
+        assert 'poster="/static/images/derivatives/zz_video/clip-640w.webp" preload="none"' in html
+        assert '<source src="/static/images/derivatives/zz_video/clip-720p.mp4" type="video/mp4" media="(max-width: 767px)">' in html
+        
+        remove_derivatives('images/gallery/zz_video/clip.mp4')
+        assert not os.listdir(derivatives_dir)
+    finally:
+        shutil.rmtree(album_dir, ignore_errors=True)
+        shutil.rmtree(derivatives_dir, ignore_errors=True)
+        with app.app_context():
+            gallery_index.refresh()
+
+def test_static_media_range_and_accel_redirect(app, client):
+    """Test Range responses from the app and X-Accel-Redirect offload of gallery media"""
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_media')
+    os.makedirs(album_dir, exist_ok=True)
+    data = bytes(range(256)) * 64
+    try:
+        with open(os.path.join(album_dir, 'clip č.mp4'), 'wb') as f:
+            f.write(data)
+        url = '/static/images/gallery/zz_media/clip č.mp4'
+        
+        response = client.get(url, headers={'Range': 'bytes=100-299'})
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == f'bytes 100-299/{len(data)}'
+        assert response.data == data[100:300]
+        assert client.get(url).data == data
+        
+        app.config['MEDIA_ACCEL_PREFIX'] = '/_media/'
+        response = client.get(url, headers={'Range': 'bytes=100-299'})
+        assert response.status_code == 200 and response.data == b''
+        assert response.headers['X-Accel-Redirect'] == '/_media/images/gallery/zz_media/clip%20%C4%8D.mp4'
+        assert response.mimetype == 'video/mp4'
+        # Ostatní statické soubory a neexistující média obsluhuje aplikace
+        assert client.get('/static/images/gallery/zz_media/missing.mp4').status_code == 404
+        assert client.get('/static/images/gallery/../../../app.py').status_code == 404
+        assert 'X-Accel-Redirect' not in client.get('/static/css/style.css').headers
+    finally:
+        app.config['MEDIA_ACCEL_PREFIX'] = ''
+        shutil.rmtree(album_dir, ignore_errors=True)
+
+def test_gallery_webp_negotiates_avif(app, client):
+    """Test that gallery WebPs are answered with their AVIF version when the client accepts it"""
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_avif')
+    derivatives_dir = os.path.join('static', 'images', 'derivatives', 'zz_avif')
+    os.makedirs(album_dir, exist_ok=True)
+    os.makedirs(derivatives_dir, exist_ok=True)
+    try:
+        for path, content in ((os.path.join(album_dir, 'photo.webp'), b'webp'),
+                              (os.path.join(derivatives_dir, 'photo-640w.webp'), b'webp 640'),
+                              (os.path.join(derivatives_dir, 'photo.avif'), b'avif'),
+                              (os.path.join(derivatives_dir, 'photo-640w.avif'), b'avif 640')):
+            with open(path, 'wb') as f:
+                f.write(content)
+        avif_accept = {'Accept': 'image/avif,image/webp,image/apng,*/*;q=0.8'}
+        
+        response = client.get('/static/images/gallery/zz_avif/photo.webp', headers=avif_accept)
+        assert response.data == b'avif' and response.mimetype == 'image/avif'
+        assert 'Accept' in response.headers['Vary']
+        response = client.get('/static/images/derivatives/zz_avif/photo-640w.webp', headers=avif_accept)
+        assert response.data == b'avif 640'
+        
+        # */* nestačí: prohlížeč bez AVIF dostane WebP
+        response = client.get('/static/images/gallery/zz_avif/photo.webp', headers={'Accept': 'image/webp,*/*'})
+        assert response.data == b'webp' and response.mimetype == 'image/webp'
+        assert 'Accept' in response.headers['Vary']
+        
+        app.config['MEDIA_ACCEL_PREFIX'] = '/_media/'
+        response = client.get('/static/images/gallery/zz_avif/photo.webp', headers=avif_accept)
+        assert response.headers['X-Accel-Redirect'] == '/_media/images/derivatives/zz_avif/photo.avif'
+        assert response.mimetype == 'image/avif'
+    finally:
+        app.config['MEDIA_ACCEL_PREFIX'] = ''
+        shutil.rmtree(album_dir, ignore_errors=True)
+        shutil.rmtree(derivatives_dir, ignore_errors=True)
+
+@pytest.mark.skipif(not image_processor.AVIF_SUPPORTED, reason='Pillow has no AVIF encoder')
+def test_upload_queues_avif_versions(app, client):
+    """Test that an upload gets a background AVIF job encoded from the stored original"""
+    import io
+    from PIL import Image
+    from app import db, run_pending_jobs, ProcessingJob, gallery_index
+    
+    buffer = io.BytesIO()
+    Image.new('RGB', (1600, 1200), 'red').save(buffer, 'JPEG')
+    buffer.seek(0)
+    album_dir = os.path.join('static', 'images', 'gallery', 'zz_avif_job')
+    derivatives_dir = os.path.join('static', 'images', 'derivatives', 'zz_avif_job')
+    app.config['AVIF_ENABLED'] = True
+    try:
+        response = client.post('/admin/upload', data={
+            'album': '', 'new_album': 'zz_avif_job', 'title': '', 'description': '',
+            'image': (buffer, 'avif_test.jpg'),
+        }, content_type='multipart/form-data')
+        assert response.status_code == 202
+        with app.app_context():
+            assert run_pending_jobs() == 2
+            job = ProcessingJob.query.filter_by(kind='avif_versions').one()
+            assert job.status == 'completed'
+            assert json.loads(job.result)['widths'] == [320, 640, 1200]
+        assert os.path.exists(os.path.join(derivatives_dir, 'avif_test.avif'))
+        assert not os.listdir(app.config['UPLOAD_STAGING_DIR'])
+    finally:
+        app.config['AVIF_ENABLED'] = False
+        shutil.rmtree(album_dir, ignore_errors=True)
+        shutil.rmtree(derivatives_dir, ignore_errors=True)
+        with app.app_context():
+            gallery_index.refresh()
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from PIL import Image
+
+from utils.conversion_pool import ConversionPool, FRAMES_IN_FLIGHT, estimate_decode_memory
+from utils.image_processor import process_image
+
+
+def test_estimate_decode_memory_from_header(tmp_path):
+    """Test that the estimate is width x height x bytes per pixel without decoding"""
+    rgb = tmp_path / 'photo.jpg'
+    Image.new('RGB', (400, 300)).save(rgb)
+    gray = tmp_path / 'scan.png'
+    Image.new('L', (400, 300)).save(gray)
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'not an image')
+
+    # Pillow хранит RGB по 4 байта на пиксель
+    assert estimate_decode_memory(str(rgb)) == 400 * 300 * 4 * FRAMES_IN_FLIGHT
+    assert estimate_decode_memory(str(gray)) == 400 * 300 * 1 * FRAMES_IN_FLIGHT
+    assert estimate_decode_memory(str(broken)) is None
+
+
+def _track_overlap(pool, costs):
+    """Runs reservations in parallel threads and returns the peak reserved memory and concurrency."""
+    peak = {'reserved': 0, 'active': 0}
+    active = []
+    lock = threading.Lock()
+
+    def job(cost):
+        with pool.reserve(cost):
+            with lock:
+                active.append(cost)
+                peak['reserved'] = max(peak['reserved'], pool.reserved)
+                peak['active'] = max(peak['active'], len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(cost)
+
+    threads = [threading.Thread(target=job, args=(cost,)) for cost in costs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return peak
+
+
+def test_reservations_stay_within_budget():
+    """Test that concurrent jobs are admitted only while they fit the budget"""
+    pool = ConversionPool(workers=4, memory_budget=100)
+
+    peak = _track_overlap(pool, [40, 40, 40, 40])
+    assert peak['reserved'] <= 100
+    assert peak['active'] == 2
+    assert pool.reserved == 0
+
+
+def test_oversized_job_runs_alone():
+    """Test that a job larger than the budget (or unknown) still runs, but alone"""
+    pool = ConversionPool(workers=4, memory_budget=100)
+
+    peak = _track_overlap(pool, [10, 500, 10, None])
+    assert peak['reserved'] <= 100
+    assert pool.reserved == 0
+
+    # Число процессов ограничивает параллелизм даже при свободном бюджете
+    peak = _track_overlap(ConversionPool(workers=2, memory_budget=1000), [1, 1, 1, 1])
+    assert peak['active'] == 2
+
+
+def test_run_converts_in_worker_process(tmp_path):
+    """Test that a conversion returns its result from a pool process"""
+    source = tmp_path / 'photo.jpg'
+    Image.new('RGB', (1600, 1200), 'green').save(source)
+    pool = ConversionPool(workers=1, memory_budget=64 * 1024 * 1024)
+    try:
+        result = pool.run(process_image, str(source), str(tmp_path / 'photo.webp'), 'gallery')
+    finally:
+        pool.shutdown()
+
+    assert (result.width, result.height) == (1200, 900)
+    with Image.open(result.path) as img:
+        assert img.size == (1200, 900)
@@ -0,0 +1,116 @@
+import os
+import time
+
+from utils.gallery_index import GalleryIndex
+
+
+def _make_index(root):
+    return GalleryIndex(str(root), 'images/gallery', ['.webp', '.mp4'])
+
+
+def _touch_later(path):
+    """Сдвигаем mtime, чтобы изменение было заметно даже на ФС с грубым разрешением"""
+    stamp = time.time() + 5
+    os.utime(path, (stamp, stamp))
+
+
+def test_gallery_index_lists_albums_and_images(tmp_path):
+    """Test that the index lists albums with images ordered by mtime"""
+    album = tmp_path / 'album_a'
+    album.mkdir()
+    first = album / 'first.webp'
+    second = album / 'second.webp'
+    first.write_text('first')
+    second.write_text('second')
+    os.utime(first, (100, 100))
+    os.utime(second, (200, 200))
+    (album / 'notes.txt').write_text('ignored')
+
+    index = _make_index(tmp_path)
+    albums = index.albums()
+
+    assert len(albums) == 1
+    assert albums[0].normalized_name == 'album_a'
+    assert albums[0].images == [
+        os.path.join('images/gallery', 'album_a', 'first.webp'),
+        os.path.join('images/gallery', 'album_a', 'second.webp'),
+    ]
+
+
+def test_gallery_index_not_rebuilt_when_unchanged(tmp_path):
+    """Test that repeated reads reuse the cached index"""
+    album = tmp_path / 'album_a'
+    album.mkdir()
+    (album / 'photo.webp').write_text('data')
+
+    index = _make_index(tmp_path)
+    index.albums()
+    version = index.version
+
+    index.albums()
+    index.albums()
+
+    assert index.version == version
+
+
+def test_gallery_index_rebuilt_on_album_mtime_change(tmp_path):
+    """Test that adding a file to an album triggers a rebuild"""
+    album = tmp_path / 'album_a'
+    album.mkdir()
+    (album / 'photo.webp').write_text('data')
+
+    index = _make_index(tmp_path)
+    index.albums()
+    version = index.version
+
+    (album / 'another.webp').write_text('data')
+    _touch_later(album)
+
+    albums = index.albums()
+    assert index.version == version + 1
+    assert len(albums[0].images) == 2
+
+
+def test_gallery_index_invalidate(tmp_path):
+    """Test that explicit invalidation forces a rebuild"""
+    album = tmp_path / 'album_a'
+    album.mkdir()
+    (album / 'photo.webp').write_text('data')
+
+    index = _make_index(tmp_path)
+    index.albums()
+    version = index.version
+
+    index.invalidate()
+    index.albums()
+
+    assert index.version == version + 1
+
+
+def test_gallery_index_cover_is_largest_image(tmp_path):
+    """Test that the cover is the largest image, never a video, and stable across rebuilds"""
+    album = tmp_path / 'album_a'
+    album.mkdir()
+    (album / 'small.webp').write_text('x')
+    (album / 'large.webp').write_text('x' * 100)
+    (album / 'clip.mp4').write_text('x' * 1000)
+
+    index = _make_index(tmp_path)
+    cover = index.albums()[0].cover_image
+    assert cover == os.path.join('images/gallery', 'album_a', 'large.webp')
+
+    index.invalidate()
+    assert index.albums()[0].cover_image == cover
+
+
+def test_gallery_index_pinned_cover(tmp_path):
+    """Test that a cover pinned through describe() overrides the heuristic"""
+    album = tmp_path / 'album_a'
+    album.mkdir()
+    (album / 'small.webp').write_text('x')
+    (album / 'large.webp').write_text('x' * 100)
+    pinned = os.path.join('images/gallery', 'album_a', 'small.webp')
+
+    index = GalleryIndex(str(tmp_path), 'images/gallery', ['.webp'],
+                         describe=lambda names: {name: (name, (name,), pinned) for name in names})
+    assert index.albums()[0].cover_image == pinned
@@ -0,0 +1,150 @@
+import os
+
+from PIL import Image
+
+from utils.gallery_index import GalleryIndex
+from utils.gallery_manifest import open_manifest, write_manifest
+
+
+def _make_gallery(root):
+    album = root / 'gallery' / 'album_a'
+    album.mkdir(parents=True)
+    Image.new('RGB', (40, 30)).save(album / 'photo.webp')
+    return root / 'gallery'
+
+
+def test_manifest_round_trip(tmp_path):
+    """Test that a written manifest can be read back through mmap views"""
+    photo = tmp_path / 'photo.webp'
+    Image.new('RGB', (64, 48)).save(photo)
+    manifest_path = str(tmp_path / 'gallery.bin')
+
+    write_manifest(manifest_path, [{
+        'name': 'Třešinky',
+        'normalized_name': 'Tresinky',
+        'mtime': 123.5,
+        'cover_index': 0,
+        'files': [('images/gallery/Tresinky/photo.webp', str(photo), 100, 50.0)],
+    }], root_mtime=99.0, generation=7)
+
+    manifest = open_manifest(manifest_path)
+    assert manifest.generation == 7
+    assert manifest.root_mtime == 99.0
+
+    album = manifest.albums()[0]
+    assert album.name == 'Třešinky'
+    assert album.normalized_name == 'Tresinky'
+    assert album.cover_image == 'images/gallery/Tresinky/photo.webp'
+    assert list(album.images) == ['images/gallery/Tresinky/photo.webp']
+
+    record = next(album.images.records())
+    assert (record.size, record.mtime, record.width, record.height) == (100, 50.0, 64, 48)
+
+
+def test_cold_index_served_from_manifest(tmp_path, monkeypatch):
+    """Test that a second worker serves albums from the manifest without scanning"""
+    gallery_root = _make_gallery(tmp_path)
+    manifest_path = str(tmp_path / 'gallery.bin')
+
+    writer = GalleryIndex(str(gallery_root), 'images/gallery', ['.webp'], manifest_path=manifest_path)
+    writer.refresh()
+    assert os.path.exists(manifest_path)
+
+    # Новый воркер не должен обходить дерево директорий
+    reader = GalleryIndex(str(gallery_root), 'images/gallery', ['.webp'], manifest_path=manifest_path)
+    def fail_rebuild():
+        raise AssertionError('gallery tree was scanned')
+    monkeypatch.setattr(reader, '_rebuild', fail_rebuild)
+
+    albums = reader.albums()
+    assert [album.normalized_name for album in albums] == ['album_a']
+    assert reader.generation == writer.generation
+
+
+def test_index_follows_manifest_replaced_by_another_worker(tmp_path, monkeypatch):
+    """Test that a worker picks up a manifest rewritten without album directory changes"""
+    gallery_root = _make_gallery(tmp_path)
+    manifest_path = str(tmp_path / 'gallery.bin')
+
+    derivatives = tmp_path / 'derivatives' / 'album_a'
+    derivatives.mkdir(parents=True)
+
+    writer = GalleryIndex(str(gallery_root), 'images/gallery', ['.webp'], manifest_path=manifest_path,
+                          derivatives_root=str(tmp_path / 'derivatives'))
+    writer.refresh()
+    reader = GalleryIndex(str(gallery_root), 'images/gallery', ['.webp'], manifest_path=manifest_path)
+    reader.albums()
+
+    # Производные пишутся вне директории альбома: mtime альбома не меняется
+    (derivatives / 'photo-320w.webp').write_text('x')
+    writer.refresh()
+
+    def fail_rebuild():
+        raise AssertionError('gallery tree was scanned')
+    monkeypatch.setattr(reader, '_rebuild', fail_rebuild)
+
+    albums = reader.albums()
+    assert reader.generation == writer.generation
+    assert next(albums[0].images.records()).derivatives == (320,)
+
+
+def test_manifest_records_derivatives(tmp_path):
+    """Test that derivative widths found next to the gallery are stored in the manifest"""
+    gallery_root = _make_gallery(tmp_path)
+    derivatives = tmp_path / 'derivatives' / 'album_a'
+    derivatives.mkdir(parents=True)
+    (derivatives / 'photo-320w.webp').write_text('x')
+    (derivatives / 'photo-640w.webp').write_text('x')
+
+    index = GalleryIndex(str(gallery_root), 'images/gallery', ['.webp'],
+                         manifest_path=str(tmp_path / 'gallery.bin'),
+                         derivatives_root=str(tmp_path / 'derivatives'))
+    album = index.albums()[0]
+
+    record = index.records(album)[0]
+    assert record.derivatives == (320, 640)
+    assert (record.width, record.height) == (40, 30)
+    assert album.cover_record.derivatives == (320, 640)
+
+
+def test_manifest_records_video_variants(tmp_path):
+    """Test that a video's poster ladder and mobile variants are stored in one mask"""
+    gallery_root = _make_gallery(tmp_path)
+    (gallery_root / 'album_a' / 'clip.mp4').write_bytes(b'video')
+    derivatives = tmp_path / 'derivatives' / 'album_a'
+    derivatives.mkdir(parents=True)
+    for name in ('clip-320w.webp', 'clip-480p.mp4', 'clip-720p.mp4', 'photo-480p.mp4'):
+        (derivatives / name).write_text('x')
+
+    index = GalleryIndex(str(gallery_root), 'images/gallery', ['.webp', '.mp4'],
+                         manifest_path=str(tmp_path / 'gallery.bin'),
+                         derivatives_root=str(tmp_path / 'derivatives'))
+    records = {os.path.basename(record.path): record for record in index.records(index.albums()[0])}
+
+    assert records['clip.mp4'].derivatives == (320,)
+    assert records['clip.mp4'].variants == (480, 720)
+    # Варианты ищутся только у видео
+    assert records['photo.webp'].variants == ()
+
+
+def test_manifest_uses_stored_dimensions(tmp_path, monkeypatch):
+    """Test that recorded frame sizes replace header reads while the file size matches"""
+    gallery_root = _make_gallery(tmp_path)
+    clip = gallery_root / 'album_a' / 'clip.mp4'
+    clip.write_bytes(b'video')
+    photo_size = os.path.getsize(gallery_root / 'album_a' / 'photo.webp')
+    stored = {'images/gallery/album_a/clip.mp4': (5, 1920, 1080),
+              # Файл заменен после записи размеров: читается заголовок
+              'images/gallery/album_a/photo.webp': (photo_size + 1, 999, 999)}
+
+    opened = []
+    monkeypatch.setattr('utils.gallery_manifest.read_image_dimensions',
+                        lambda path: opened.append(os.path.basename(path)) or (40, 30))
+    index = GalleryIndex(str(gallery_root), 'images/gallery', ['.webp', '.mp4'],
+                         manifest_path=str(tmp_path / 'gallery.bin'),
+                         dimensions=lambda: stored)
+    records = {os.path.basename(record.path): record for record in index.records(index.albums()[0])}
+
+    assert (records['clip.mp4'].width, records['clip.mp4'].height) == (1920, 1080)
+    assert (records['photo.webp'].width, records['photo.webp'].height) == (40, 30)
+    assert opened == ['photo.webp']
@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+
+from utils.image_cache import ResizeCache
+
+
+def _render(data, calls=None, delay=0.0):
+    def render(path):
+        if calls is not None:
+            calls.append(path)
+        time.sleep(delay)
+        with open(path, 'wb') as f:
+            f.write(data)
+    return render
+
+
+def test_cache_hit_does_not_render_again(tmp_path):
+    """Test that a cached variant is returned without calling render"""
+    cache = ResizeCache(str(tmp_path), max_bytes=1000)
+    calls = []
+
+    path = cache.get('photo.webp:1:1', 320, _render(b'x' * 10, calls))
+    assert cache.get('photo.webp:1:1', 320, _render(b'y', calls)) == path
+    assert len(calls) == 1
+    with open(path, 'rb') as f:
+        assert f.read() == b'x' * 10
+    # Другой ключ (источник изменился) - новый вариант
+    assert cache.get('photo.webp:2:2', 320, _render(b'z', calls)) != path
+    assert not [name for _, _, files in os.walk(tmp_path) for name in files if name.endswith('.lock')]
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    """Test that the byte budget evicts the variant requested longest ago"""
+    cache = ResizeCache(str(tmp_path), max_bytes=250)
+    first = cache.get('a', 320, _render(b'a' * 100))
+    second = cache.get('b', 320, _render(b'b' * 100))
+    os.utime(first, (time.time() - 60, time.time() - 60))
+    os.utime(second, (time.time() - 30, time.time() - 30))
+
+    # Попадание обновляет время запроса первого варианта
+    cache.get('a', 320, _render(b''))
+    third = cache.get('c', 320, _render(b'c' * 100))
+
+    assert os.path.exists(first) and os.path.exists(third)
+    assert not os.path.exists(second)
+
+
+def test_concurrent_requests_render_once(tmp_path):
+    """Test that parallel requests for one variant wait on the lock file instead of rendering again"""
+    cache = ResizeCache(str(tmp_path), max_bytes=1000)
+    calls, results = [], []
+
+    def request():
+        results.append(cache.get('photo.webp:1:1', 640, _render(b'x', calls, delay=0.1)))
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(set(results)) == 1 and len(results) == 4
@@ -0,0 +1,151 @@
+from datetime import datetime
+
+import pytest
+from PIL import Image
+
+from utils import image_processor
+from utils.image_processor import (ExifTags, ImageProcessingError, PLACEHOLDER_WIDTH, avif_filename,
+                                   generate_derivatives, process_image, target_size, write_avif_versions)
+
+
+def test_target_size_matches_profiles():
+    """Test that landscape images fit the profile width and portrait images its height"""
+    assert target_size(4000, 3000, 'gallery') == (1200, 900)
+    assert target_size(3000, 4000, 'gallery') == (600, 800)
+    assert target_size(4000, 2250, 'hero') == (1920, 1080)
+    assert target_size(800, 600, 'thumbnail') == (400, 300)
+    # Маленькие изображения не увеличиваются
+    assert target_size(640, 480, 'gallery') == (640, 480)
+
+
+def test_process_jpeg_orientation_and_exif(tmp_path):
+    """Test that a rotated JPEG is oriented, resized and its EXIF date returned"""
+    source = tmp_path / 'photo.jpg'
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6  # Повернуто на 90° по часовой стрелке
+    exif[ExifTags.IFD.Exif] = {ExifTags.Base.DateTimeOriginal: '2019:04:06 14:24:47'}
+    Image.new('RGB', (3200, 2400), 'red').save(source, exif=exif)
+
+    result = process_image(str(source), str(tmp_path / 'photo.webp'), 'gallery')
+
+    assert (result.original_width, result.original_height) == (2400, 3200)
+    assert (result.width, result.height) == (600, 800)
+    assert result.taken_at == datetime(2019, 4, 6, 14, 24, 47)
+    with Image.open(result.path) as img:
+        assert img.format == 'WEBP'
+        assert img.size == (600, 800)
+
+
+def test_process_png_keeps_alpha_and_replaces_webp_in_place(tmp_path):
+    """Test that transparency survives and a WebP input can be overwritten"""
+    source = tmp_path / 'logo.png'
+    Image.new('RGBA', (500, 250), (0, 0, 0, 0)).save(source)
+    result = process_image(str(source), str(tmp_path / 'logo.webp'), 'thumbnail')
+    assert (result.width, result.height) == (400, 200)
+    assert result.taken_at is None
+
+    again = process_image(result.path, result.path, 'thumbnail')
+    with Image.open(again.path) as img:
+        assert img.mode == 'RGBA'
+    assert [p.name for p in tmp_path.iterdir()].count('logo.webp') == 1
+
+
+def test_process_image_writes_derivative_ladder(tmp_path):
+    """Test that one decode produces the main image and the srcset ladder without upscaling"""
+    source = tmp_path / 'photo.jpg'
+    Image.new('RGB', (1600, 1200), 'green').save(source)
+    derivatives = tmp_path / 'derivatives'
+
+    result = process_image(str(source), str(tmp_path / 'photo.webp'), 'gallery', str(derivatives))
+
+    assert result.derivatives == (320, 640, 1200)
+    assert sorted(p.name for p in derivatives.iterdir()) == [
+        'photo-1200w.webp', 'photo-320w.webp', 'photo-640w.webp']
+    with Image.open(derivatives / 'photo-320w.webp') as img:
+        assert img.size == (320, 240)
+
+
+def test_generate_derivatives_skips_own_width(tmp_path):
+    """Test that backfilled derivatives are only smaller than the gallery image"""
+    source = tmp_path / 'photo.webp'
+    Image.new('RGB', (1200, 800)).save(source)
+    assert generate_derivatives(str(source), str(tmp_path / 'derivatives')) == (320, 640)
+
+
+def test_avif_versions(tmp_path):
+    """Test AVIF naming and that the main image and its derivatives are encoded from one decode"""
+    assert avif_filename('images/gallery/album/photo.webp') == 'photo.avif'
+    assert avif_filename('images/gallery/album/photo.webp', 640) == 'photo-640w.avif'
+
+    source = tmp_path / 'photo.jpg'
+    Image.new('RGB', (1600, 1200), 'blue').save(source)
+    derivatives = tmp_path / 'derivatives'
+    if not image_processor.AVIF_SUPPORTED:
+        with pytest.raises(ImageProcessingError):
+            write_avif_versions(str(source), str(derivatives), 'photo.webp', (1200, 900), (320, 640))
+        return
+
+    assert write_avif_versions(str(source), str(derivatives), 'photo.webp', (1200, 900), (320, 640)) == (320, 640)
+    with Image.open(derivatives / 'photo.avif') as img:
+        assert img.size == (1200, 900)
+    with Image.open(derivatives / 'photo-320w.avif') as img:
+        assert img.size == (320, 240)
+
+
+def test_process_image_returns_placeholder(tmp_path):
+    """Test that a tiny WebP placeholder is made from the decoded frame"""
+    import base64
+    import io
+
+    source = tmp_path / 'photo.jpg'
+    Image.new('RGB', (1600, 1200), 'green').save(source)
+    result = process_image(str(source), str(tmp_path / 'photo.webp'), 'gallery')
+
+    prefix = 'data:image/webp;base64,'
+    assert result.placeholder.startswith(prefix)
+    assert len(result.placeholder) < 400
+    with Image.open(io.BytesIO(base64.b64decode(result.placeholder[len(prefix):]))) as img:
+        assert img.size == (PLACEHOLDER_WIDTH, 12)
+
+
+def test_process_image_returns_metadata(tmp_path):
+    """Test that camera, exposure and GPS are read in the processing decode"""
+    from PIL.TiffImagePlugin import IFDRational
+
+    source = tmp_path / 'photo.jpg'
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = 'Canon'
+    exif[ExifTags.Base.Model] = 'EOS 80D'
+    exif[ExifTags.Base.Orientation] = 6
+    exif[ExifTags.IFD.Exif] = {ExifTags.Base.DateTimeOriginal: '2020:05:01 10:00:00',
+                               ExifTags.Base.FNumber: IFDRational(28, 10),
+                               ExifTags.Base.ExposureTime: IFDRational(1, 250),
+                               ExifTags.Base.ISOSpeedRatings: 200}
+    exif[ExifTags.IFD.GPSInfo] = {1: 'N', 2: (IFDRational(50), IFDRational(7), IFDRational(30)),
+                                  3: 'E', 4: (IFDRational(15), IFDRational(30), IFDRational(0)),
+                                  6: IFDRational(250)}
+    Image.new('RGB', (800, 600), 'red').save(source, exif=exif)
+
+    metadata = process_image(str(source), str(tmp_path / 'photo.webp'), 'gallery').metadata
+
+    assert metadata['taken_at'] == datetime(2020, 5, 1, 10, 0)
+    assert (metadata['camera_make'], metadata['camera_model'], metadata['lens_model']) == ('Canon', 'EOS 80D', None)
+    assert (metadata['orientation'], metadata['original_width'], metadata['original_height']) == (6, 600, 800)
+    assert (metadata['f_number'], metadata['exposure_time'], metadata['iso']) == (2.8, 0.004, 200)
+    assert (metadata['gps_latitude'], metadata['gps_longitude'], metadata['gps_altitude']) == (50.125, 15.5, 250.0)
+    # Заголовок без EXIF (сохраненный WebP) дает только размеры
+    stored = image_processor.metadata_from_file(str(tmp_path / 'photo.webp'))
+    assert (stored['original_width'], stored['camera_make'], stored['gps_latitude']) == (600, None, None)
+
+
+def test_resize_image_follows_orientation_without_upscaling(tmp_path):
+    """Test that on-demand resizing rotates by EXIF and never enlarges"""
+    source = tmp_path / 'photo.jpg'
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = 6
+    Image.new('RGB', (1600, 1200), 'red').save(source, exif=exif)
+
+    assert image_processor.resize_image(str(source), str(tmp_path / 'small.webp'), 300) == (300, 400)
+    with Image.open(tmp_path / 'small.webp') as img:
+        assert img.size == (300, 400)
+    assert image_processor.resize_image(str(source), str(tmp_path / 'large.webp'), 2000) == (1200, 1600)
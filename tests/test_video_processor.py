@@ -0,0 +1,73 @@
+import shutil
+import subprocess
+from datetime import datetime, timezone
+
+import pytest
+
+from utils import video_processor
+from utils.video_processor import parse_creation_date, parse_probe, variant_filename, variant_heights_for
+
+requires_ffmpeg = pytest.mark.skipif(not video_processor.VIDEO_SUPPORTED, reason='ffmpeg is not installed')
+
+
+def test_variant_names_and_ladder():
+    """Test variant naming and that variants never upscale the source"""
+    assert variant_filename('images/gallery/album/clip.mp4', 720) == 'clip-720p.mp4'
+    assert variant_heights_for(1080) == (480, 720)
+    assert variant_heights_for(720) == (480,)
+    assert variant_heights_for(360) == ()
+
+
+def test_parse_creation_date():
+    """Test recording dates from QuickTime tags and container creation_time"""
+    # Смещение от камеры: время уже местное
+    assert parse_creation_date('2019-04-06T16:27:42+0200') == datetime(2019, 4, 6, 16, 27, 42)
+    # UTC переводится в местное время сервера
+    assert parse_creation_date('2019-04-06T14:27:42.000000Z') == \
+        datetime(2019, 4, 6, 14, 27, 42, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    # Нулевая дата QuickTime и мусор игнорируются
+    assert parse_creation_date('1904-01-01T00:00:00.000000Z') is None
+    assert parse_creation_date('yesterday') is None
+
+
+def test_parse_probe_prefers_quicktime_date_and_rotation():
+    """Test that a portrait phone video reports rotated dimensions and its local recording date"""
+    info = parse_probe({
+        'streams': [
+            {'codec_type': 'audio'},
+            {'codec_type': 'video', 'width': 1920, 'height': 1080,
+             'side_data_list': [{'rotation': -90}]},
+        ],
+        'format': {'duration': '12.5', 'tags': {
+            'creation_time': '2019-04-06T14:27:42.000000Z',
+            'com.apple.quicktime.creationdate': '2019-04-06T16:27:42+0200',
+        }},
+    })
+    assert (info.width, info.height) == (1080, 1920)
+    assert info.duration == 12.5
+    assert info.taken_at == datetime(2019, 4, 6, 16, 27, 42)
+    assert parse_probe({}).taken_at is None
+
+
+@requires_ffmpeg
+def test_pipeline_remuxes_and_writes_poster_and_variants(tmp_path):
+    """Test faststart remux, poster ladder and mobile variants with a real ffmpeg"""
+    source = tmp_path / 'source.mp4'
+    subprocess.run([shutil.which('ffmpeg'), '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=1280x720:rate=10',
+                    '-t', '3', '-metadata', 'creation_time=2020-05-01T10:00:00Z', '-pix_fmt', 'yuv420p',
+                    str(source)], check=True)
+    clip = tmp_path / 'clip.mp4'
+    derivatives = tmp_path / 'derivatives'
+
+    info = video_processor.probe_video(str(source))
+    video_processor.remux_faststart(str(source), str(clip))
+    assert (info.width, info.height) == (1280, 720)
+    assert info.taken_at is not None and info.taken_at.year == 2020
+    # moov перед mdat
+    data = clip.read_bytes()
+    assert data.index(b'moov') < data.index(b'mdat')
+
+    assert video_processor.write_poster(str(clip), str(derivatives), info.duration) == (320, 640, 1200)
+    assert (derivatives / 'clip-640w.webp').exists()
+    assert video_processor.encode_variants(str(clip), str(derivatives), info.width, info.height) == (480,)
+    assert video_processor.probe_video(str(derivatives / 'clip-480p.mp4')).height == 480
@@ -14,6 +14,15 @@ from .logger import (
 )
 
 from .file_validator import file_validator, FileValidator
+from .gallery_index import GalleryIndex
+from .http_cache import AssetVersion, http_datetime
+from .file_range import FileRange
+from .page_cache import PageCache
+from .image_cache import ResizeCache
+from . import image_processor
+from . import video_processor
+from . import media_metadata
+from .conversion_pool import ConversionPool, estimate_decode_memory
 
 __all__ = [
     'upload_logger',
@@ -25,5 +34,16 @@ __all__ = [
     'log_exception',
     'log_file_operation',
     'file_validator',
-    'FileValidator'
+    'FileValidator',
+    'GalleryIndex',
+    'AssetVersion',
+    'FileRange',
+    'PageCache',
+    'ResizeCache',
+    'image_processor',
+    'video_processor',
+    'media_metadata',
+    'ConversionPool',
+    'estimate_decode_memory',
+    'http_datetime'
 ] 
\ No newline at end of file
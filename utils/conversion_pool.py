@@ -0,0 +1,177 @@
+"""
+Пул процессов конвертации изображений для приложения Třešinky Cetechovice.
+Выполняет декодирование и кодирование в отдельных процессах, допуская
+одновременно только те задачи, чья оценка памяти декодирования укладывается
+в общий бюджет. На многоядерном сервере изображения конвертируются
+параллельно, а на маленьком сервере панорама не приводит к OOM.
+
+Бюджет - мягкий предел: задача, оценка которой больше всего бюджета,
+не отклоняется, а выполняется одна, поэтому пик памяти - наибольшее из
+бюджета и самой большой задачи. Для JPEG оценка завышена: process_image
+декодирует их в draft-режиме сразу уменьшенными.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from PIL import Image
+
+from .logger import processing_logger, log_function_call, log_exception
+
+# Байт на пиксель в памяти Pillow: RGB, YCbCr и CMYK хранятся по 4 байта
+BYTES_PER_PIXEL = {'1': 1, 'L': 1, 'P': 1, 'LA': 4, 'PA': 4, 'I;16': 2, 'I': 4, 'F': 4}
+DEFAULT_BYTES_PER_PIXEL = 4
+
+# Пиковое число полных кадров при обработке: декодированный кадр и его копия
+# после поворота по EXIF или смены режима
+FRAMES_IN_FLIGHT = 2
+
+# Процесс конвертации перезапускается после стольких задач, чтобы память
+# после большого изображения возвращалась системе
+TASKS_PER_CHILD = 50
+
+
+def estimate_decode_memory(path: str) -> Optional[int]:
+    """
+    Оценивает память декодирования по заголовку файла (без декодирования пикселей).
+
+    Args:
+        path: Путь к изображению
+
+    Returns:
+        Оценка в байтах (ширина x высота x байт на пиксель x кадров) или None,
+        если заголовок не удалось прочитать
+    """
+    # Заголовок HEIC открывается только после регистрации pillow-heif,
+    # которую выполняет импорт модуля обработки
+    from . import image_processor  # noqa: F401
+
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            bytes_per_pixel = BYTES_PER_PIXEL.get(img.mode, DEFAULT_BYTES_PER_PIXEL)
+    except Exception as e:
+        processing_logger.warning(f"Cannot read image header for memory estimate: {path} ({e})")
+        return None
+    return width * height * bytes_per_pixel * FRAMES_IN_FLIGHT
+
+
+class ConversionPool:
+    """Пул процессов конвертации с допуском задач по бюджету памяти."""
+
+    def __init__(self, workers: int, memory_budget: int):
+        """
+        Инициализация пула.
+
+        Args:
+            workers: Число процессов конвертации (0 - выполнять в вызывающем
+                     потоке, по одной задаче)
+            memory_budget: Бюджет памяти декодирования всех одновременных задач в байтах
+                           (мягкий предел, см. reserve())
+        """
+        self.workers = max(0, workers)
+        self.slots = max(1, self.workers)
+        self.memory_budget = memory_budget
+
+        self._condition = threading.Condition()
+        self._reserved = 0
+        self._active = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def reserved(self) -> int:
+        """Память, зарезервированная выполняющимися задачами."""
+        return self._reserved
+
+    @contextmanager
+    def reserve(self, cost: Optional[int]):
+        """
+        Резервирует память под задачу; ждет, пока она поместится в бюджет.
+
+        Задача больше всего бюджета (или с неизвестной оценкой) не отклоняется:
+        она выполняется, когда других задач нет, - одна, и ее память сверх
+        бюджета не ограничивается.
+
+        Args:
+            cost: Оценка памяти задачи в байтах или None
+        """
+        cost = self.memory_budget if cost is None else min(cost, self.memory_budget)
+        with self._condition:
+            while self._active and (self._active >= self.slots or
+                                    self._reserved + cost > self.memory_budget):
+                self._condition.wait()
+            self._reserved += cost
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._reserved -= cost
+                self._active -= 1
+                self._condition.notify_all()
+
+    def run(self, func: Callable, path: str, *args, **kwargs):
+        """
+        Выполняет func(path, *args, **kwargs) в процессе пула после допуска по памяти.
+
+        Args:
+            func: Функция уровня модуля (передается в процесс через pickle)
+            path: Путь к исходному изображению, по заголовку которого оценивается память
+
+        Returns:
+            Результат func
+        """
+        log_function_call(processing_logger, 'ConversionPool.run', func=func.__name__, path=path)
+
+        cost = estimate_decode_memory(path)
+        if cost is not None and cost > self.memory_budget:
+            processing_logger.warning(f"Conversion of {os.path.basename(path)} exceeds the memory budget "
+                                      f"({cost}/{self.memory_budget} bytes), running it alone")
+        with self.reserve(cost):
+            processing_logger.info(f"Conversion admitted: {os.path.basename(path)} "
+                                   f"(estimate {cost if cost is not None else 'unknown'} bytes, "
+                                   f"reserved {self._reserved}/{self.memory_budget})")
+            if self.workers == 0:
+                return func(path, *args, **kwargs)
+            executor = self._get_executor()
+            try:
+                return executor.submit(func, path, *args, **kwargs).result()
+            except BrokenProcessPool:
+                # Процесс был убит (например, OOM killer): следующая задача
+                # получит новый пул, а эту повторит очередь задач
+                processing_logger.error(f"Conversion process died while processing {path}")
+                with self._condition:
+                    if self._executor is executor:
+                        self._executor = None
+                executor.shutdown(wait=False)
+                raise
+
+    def shutdown(self):
+        """Останавливает процессы пула."""
+        with self._condition:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._condition:
+            if self._executor is None:
+                try:
+                    # spawn: процесс приложения многопоточный, fork мог бы
+                    # унаследовать захваченные блокировки
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        max_tasks_per_child=TASKS_PER_CHILD
+                    )
+                except Exception as e:
+                    log_exception(processing_logger, e, 'starting conversion processes')
+                    raise
+                processing_logger.info(f"Conversion pool started: {self.workers} processes, "
+                                       f"budget {self.memory_budget} bytes")
+            return self._executor
@@ -0,0 +1,41 @@
+"""
+Отдача диапазонов файлов для приложения Třešinky Cetechovice.
+Файловый объект, ограниченный диапазоном байтов: WSGI-сервер без sendfile
+читает из него не дальше конца диапазона, а gunicorn по fileno() и
+Content-Length отправляет тот же диапазон через sendfile без копирования.
+"""
+
+from typing import BinaryIO
+
+
+class FileRange:
+    """Файл, открытый на начале диапазона и читаемый не дальше его конца."""
+
+    def __init__(self, path: str, start: int, length: int):
+        """
+        Открывает файл и переходит к началу диапазона.
+
+        Args:
+            path: Путь к файлу
+            start: Смещение первого байта
+            length: Длина диапазона в байтах
+        """
+        self._file: BinaryIO = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        # Позиция дескриптора - начало диапазона (sendfile начинает с нее)
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
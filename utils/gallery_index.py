@@ -0,0 +1,371 @@
+"""
+Индекс галереи для приложения Třešinky Cetechovice.
+Хранит в памяти процесса список альбомов и изображений и перестраивает его
+только при изменении mtime корневой директории галереи или директории альбома.
+Если задан путь к манифесту, данные индекса хранятся в бинарном манифесте
+(utils/gallery_manifest.py), который разделяется всеми воркерами через mmap.
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .logger import processing_logger, log_function_call, log_exception
+from .gallery_manifest import GalleryManifest, ManifestAlbum, open_manifest, stored_dimensions, write_manifest
+from .image_processor import DERIVATIVE_WIDTHS, derivative_filename
+from .video_processor import VIDEO_VARIANT_HEIGHTS, variant_filename
+
+
+# Видео не подходят для обложки: <img> в шаблоне их не отобразит
+VIDEO_EXTENSIONS = {'.mp4'}
+
+
+class IndexedImage(NamedTuple):
+    """Запись изображения индекса без манифеста (размеры кадра - только из dimensions)."""
+    path: str
+    size: int
+    mtime: float
+    width: int
+    height: int
+    derivatives: Tuple[int, ...]
+    variants: Tuple[int, ...] = ()
+
+
+class IndexedAlbum(NamedTuple):
+    """Альбом индекса без манифеста; атрибуты те же, что у ManifestAlbum."""
+    name: str
+    normalized_name: str
+    mtime: float
+    images: List[str]
+    records: List[IndexedImage]
+    cover_record: Optional[IndexedImage]
+
+    @property
+    def cover_image(self) -> Optional[str]:
+        return self.cover_record.path if self.cover_record is not None else None
+
+
+def select_cover_index(files: List[Tuple], pinned: Optional[str] = None) -> Optional[int]:
+    """
+    Детерминированно выбирает обложку альбома.
+
+    Закрепленная администратором обложка имеет приоритет; иначе берется самое
+    большое изображение (при одинаковом качестве WebP размер файла отражает
+    детализацию кадра). При равных размерах выигрывает более старый файл.
+
+    Args:
+        files: Кортежи (url_path, disk_path, size, mtime), отсортированные по mtime
+        pinned: Путь закрепленной обложки относительно static/ или None
+
+    Returns:
+        Индекс обложки в files или None для пустого альбома
+    """
+    if not files:
+        return None
+    if pinned:
+        for index, item in enumerate(files):
+            if item[0] == pinned:
+                return index
+
+    candidates = [index for index, item in enumerate(files)
+                  if os.path.splitext(item[0])[1].lower() not in VIDEO_EXTENSIONS]
+    if not candidates:
+        return 0
+    return max(candidates, key=lambda index: files[index][2])
+
+
+class GalleryIndex:
+    """Индекс альбомов галереи с инвалидацией по mtime директорий."""
+
+    def __init__(self, root: str, url_prefix: str, extensions: Iterable[str],
+                 describe: Optional[Callable[[List[str]], Dict[str, Tuple[str, Tuple, Optional[str]]]]] = None,
+                 manifest_path: Optional[str] = None,
+                 derivatives_root: Optional[str] = None,
+                 dimensions: Optional[Callable[[], Dict[str, Tuple[int, int, int]]]] = None):
+        """
+        Инициализация индекса.
+
+        Args:
+            root: Путь к корневой директории галереи на диске
+            url_prefix: Префикс путей изображений относительно static/
+            extensions: Допустимые расширения файлов (в нижнем регистре)
+            describe: Функция, получающая список имен директорий и возвращающая
+                      {имя: (отображаемое имя, ключ сортировки, закрепленная
+                      обложка или None)}; вызывается один раз за перестроение
+            manifest_path: Путь к бинарному манифесту галереи (None - только память)
+            derivatives_root: Корень дерева производных изображений
+                              (<корень>/<альбом>/<имя>-<ширина>w.webp) или None
+            dimensions: Функция, возвращающая размеры кадра, записанные при
+                        обработке: {путь: (размер файла, ширина, высота)};
+                        вызывается один раз за перестроение
+        """
+        self.root = Path(root)
+        self.url_prefix = url_prefix
+        self.extensions = {ext.lower() for ext in extensions}
+        self.describe = describe or (lambda names: {name: (name, (name,), None) for name in names})
+        self.manifest_path = manifest_path
+        self.derivatives_root = Path(derivatives_root) if derivatives_root else None
+        self.dimensions = dimensions
+
+        self._lock = threading.Lock()
+        self._manifest: Optional[GalleryManifest] = None
+        self._albums: List = []
+        self._by_name: Dict = {}
+        self._root_mtime: Optional[float] = None
+        self._dir_mtimes: Dict[str, float] = {}
+        # Пустой индекс считается устаревшим по mtime корня (None), поэтому
+        # первый запрос сначала попробует готовый манифест
+        self._stale = False
+        self.version = 0
+
+    def invalidate(self):
+        """Помечает индекс как устаревший; он будет перестроен при следующем обращении."""
+        log_function_call(processing_logger, 'GalleryIndex.invalidate')
+        self._stale = True
+
+    def refresh(self):
+        """Немедленно пересканирует галерею и перезаписывает манифест."""
+        with self._lock:
+            self._rebuild()
+
+    @property
+    def generation(self) -> int:
+        """Номер поколения манифеста (общий для всех воркеров) или локальная версия."""
+        if self._manifest is not None:
+            return self._manifest.generation
+        return self.version
+
+    @property
+    def last_modified(self) -> Optional[float]:
+        """Наибольший mtime корня галереи и директорий альбомов на момент сканирования."""
+        mtimes = [mtime for mtime in [self._root_mtime, *self._dir_mtimes.values()] if mtime]
+        return max(mtimes) if mtimes else None
+
+    def albums(self) -> List:
+        """
+        Возвращает отсортированный список непустых альбомов.
+
+        Returns:
+            Список альбомов (ManifestAlbum или IndexedAlbum) с атрибутами name, normalized_name, images,
+            cover_image, mtime
+        """
+        with self._lock:
+            if self._stale or self._is_outdated():
+                # Холодный воркер или изменение другим воркером: сначала пробуем
+                # актуальный манифест, и только если его нет - сканируем диск
+                if self._stale or not self._load_manifest():
+                    self._rebuild()
+            return self._albums
+
+    def album(self, normalized_name: str):
+        """
+        Возвращает непустой альбом по нормализованному имени.
+
+        Args:
+            normalized_name: Имя директории альбома
+
+        Returns:
+            Альбом или None, если такого альбома нет
+        """
+        self.albums()
+        return self._by_name.get(normalized_name)
+
+    def records(self, album, start: int = 0, stop: Optional[int] = None) -> List:
+        """
+        Возвращает записи изображений альбома (путь, размеры, ширины производных).
+
+        Args:
+            album: Альбом, полученный из albums() или album()
+            start: Индекс первого изображения
+            stop: Индекс после последнего изображения (None - до конца)
+        """
+        if isinstance(album, ManifestAlbum):
+            return list(album.images.records(start, stop))
+        return album.records[start:stop]
+
+    def _derivative_names(self, folder_name: str) -> set:
+        """Имена производных файлов альбома (один listdir на альбом)."""
+        if self.derivatives_root is None:
+            return set()
+        try:
+            return set(os.listdir(self.derivatives_root / folder_name))
+        except OSError:
+            return set()
+
+    def _is_outdated(self) -> bool:
+        """
+        Проверяет mtime корня и известных директорий альбомов (без чтения списков
+        файлов) и не заменен ли манифест: другой воркер или команда обслуживания
+        перезаписывают его при изменениях, не трогающих директории альбомов
+        (производные, обложки, размеры).
+        """
+        try:
+            if self.root.stat().st_mtime != self._root_mtime:
+                return True
+        except OSError:
+            return self._root_mtime is not None
+
+        if self._manifest is not None and not self._manifest.is_current_file():
+            return True
+
+        for name, mtime in self._dir_mtimes.items():
+            try:
+                if (self.root / name).stat().st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _rebuild(self):
+        """Полностью перестраивает индекс по содержимому директории галереи."""
+        log_function_call(processing_logger, 'GalleryIndex._rebuild', root=self.root)
+
+        albums = []
+        dir_mtimes = {}
+        root_mtime = None
+
+        try:
+            if self.root.exists():
+                for folder in self.root.iterdir():
+                    if not folder.is_dir() or folder.name.startswith('.'):
+                        continue
+
+                    # mtime берем до чтения списка файлов, чтобы не пропустить
+                    # изменения, произошедшие во время сканирования
+                    folder_mtime = folder.stat().st_mtime
+                    derivative_names = self._derivative_names(folder.name)
+                    file_info = []
+                    for file in folder.iterdir():
+                        if file.is_file() and file.suffix.lower() in self.extensions:
+                            file_path = os.path.join(self.url_prefix, folder.name, file.name)
+                            derivatives = tuple(width for width in DERIVATIVE_WIDTHS
+                                                if derivative_filename(file.name, width) in derivative_names)
+                            variants = ()
+                            if file.suffix.lower() in VIDEO_EXTENSIONS:
+                                variants = tuple(height for height in VIDEO_VARIANT_HEIGHTS
+                                                 if variant_filename(file.name, height) in derivative_names)
+                            try:
+                                stat = file.stat()
+                                file_info.append((file_path, str(file), stat.st_size, stat.st_mtime,
+                                                  derivatives, variants))
+                            except OSError:
+                                file_info.append((file_path, str(file), 0, 0, derivatives, variants))
+
+                    # Пустые директории только отслеживаются; удаляет их фоновое обслуживание
+                    dir_mtimes[folder.name] = folder_mtime
+
+                    # Сортировка по времени изменения (сначала старые)
+                    file_info.sort(key=lambda item: item[3])
+                    albums.append({
+                        'normalized_name': folder.name,
+                        'files': file_info,
+                        'images': [item[0] for item in file_info],
+                        'mtime': folder_mtime,
+                    })
+
+                root_mtime = self.root.stat().st_mtime
+            else:
+                processing_logger.warning(f"Gallery directory does not exist: {self.root}")
+        except OSError as e:
+            log_exception(processing_logger, e, f'rebuilding gallery index for {self.root}')
+
+        # Отображаемые имена, ключи сортировки и закрепленные обложки получаем одним вызовом
+        descriptions = self.describe([album['normalized_name'] for album in albums])
+        for album in albums:
+            album['name'], album['sort_key'], pinned_cover = descriptions[album['normalized_name']]
+            # Обложка выбирается при перестроении и сохраняется в манифесте
+            album['cover_index'] = select_cover_index(album['files'], pinned_cover)
+        albums.sort(key=lambda album: album['sort_key'])
+        self._stale = False
+
+        dimensions = None
+        if self.dimensions is not None:
+            try:
+                dimensions = self.dimensions()
+            except Exception as e:
+                log_exception(processing_logger, e, 'reading stored image dimensions')
+
+        if self.manifest_path and self._write_manifest(albums, root_mtime, dimensions):
+            processing_logger.info(f"Gallery index rebuilt from disk into manifest "
+                                   f"(generation {self.generation})")
+            return
+
+        indexed = []
+        for album in albums:
+            if not album['files']:
+                continue
+            records = [IndexedImage(path, size, mtime, *(stored_dimensions(dimensions, path, size) or (0, 0)),
+                                    derivatives, variants)
+                       for path, _, size, mtime, derivatives, variants in album['files']]
+            indexed.append(IndexedAlbum(album['name'], album['normalized_name'], album['mtime'], album['images'],
+                                        records, records[album['cover_index']]))
+        self._manifest = None
+        self._albums = indexed
+        self._by_name = {album.normalized_name: album for album in self._albums}
+        self._dir_mtimes = dir_mtimes
+        self._root_mtime = root_mtime
+        self.version += 1
+        processing_logger.info(f"Gallery index rebuilt: {len(self._albums)} albums (version {self.version})")
+
+    def _write_manifest(self, albums: List[Dict], root_mtime: Optional[float],
+                        dimensions: Optional[Dict[str, Tuple[int, int, int]]] = None) -> bool:
+        """Записывает манифест по результатам сканирования и переключается на него."""
+        previous = self._manifest
+        if previous is None or not previous.is_current_file():
+            previous = open_manifest(self.manifest_path) or previous
+        generation = (previous.generation if previous is not None else 0) + 1
+
+        try:
+            write_manifest(self.manifest_path, albums, root_mtime,
+                           generation=generation, previous=previous, dimensions=dimensions)
+        except OSError as e:
+            log_exception(processing_logger, e, f'writing gallery manifest {self.manifest_path}')
+            return False
+
+        manifest = open_manifest(self.manifest_path)
+        if manifest is None:
+            return False
+        self._adopt(manifest)
+        return True
+
+    def _load_manifest(self) -> bool:
+        """
+        Подключает манифест с диска, если он соответствует текущим mtime директорий.
+
+        Returns:
+            True, если индекс обслуживается из актуального манифеста
+        """
+        if not self.manifest_path:
+            return False
+
+        manifest = self._manifest
+        if manifest is None or not manifest.is_current_file():
+            manifest = open_manifest(self.manifest_path)
+            if manifest is None:
+                return False
+
+        try:
+            if self.root.stat().st_mtime != manifest.root_mtime:
+                return False
+            for name, mtime in manifest.dir_mtimes().items():
+                if (self.root / name).stat().st_mtime != mtime:
+                    return False
+        except OSError:
+            return False
+
+        if manifest is not self._manifest:
+            self._adopt(manifest)
+            processing_logger.info(f"Gallery index loaded from manifest "
+                                   f"(generation {manifest.generation})")
+        return True
+
+    def _adopt(self, manifest: GalleryManifest):
+        """Переключает индекс на представления записей манифеста."""
+        self._manifest = manifest
+        self._albums = [album for album in manifest.albums() if len(album.images)]
+        self._by_name = {album.normalized_name: album for album in self._albums}
+        self._dir_mtimes = manifest.dir_mtimes()
+        self._root_mtime = manifest.root_mtime
+        self._stale = False
+        self.version += 1
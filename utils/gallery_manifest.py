@@ -0,0 +1,360 @@
+"""
+Бинарный манифест галереи для приложения Třešinky Cetechovice.
+Компактный файл с таблицей альбомов и записями изображений, который
+записывается атомарно и читается всеми воркерами gunicorn через mmap.
+
+Формат (little-endian):
+    Заголовок:  magic, версия, поколение, mtime корня, кол-во альбомов,
+                кол-во изображений, размер таблицы строк
+    Альбомы:    смещения имен в таблице строк, mtime директории,
+                первый индекс изображения, кол-во изображений, индекс обложки
+    Изображения: смещение пути, размер, mtime, ширина, высота,
+                битовая маска производных (бит i - ширина DERIVATIVE_WIDTHS[i],
+                бит VARIANT_SHIFT + i - видеовариант VIDEO_VARIANT_HEIGHTS[i])
+    Строки:     UTF-8 байты всех имен и путей
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .logger import processing_logger, log_function_call, log_exception
+from .image_processor import DERIVATIVE_WIDTHS
+from .video_processor import VIDEO_VARIANT_HEIGHTS
+
+
+MAGIC = b'TGM1'
+# Манифест другой версии не открывается (open_manifest возвращает None),
+# и индекс перестраивается сканированием диска с записью нового манифеста
+FORMAT_VERSION = 2
+NO_COVER = 0xFFFFFFFF
+
+# Видеоварианты хранятся в старших битах той же маски
+VARIANT_SHIFT = 16
+
+HEADER = struct.Struct('<4sHHQdIII')
+ALBUM = struct.Struct('<IIIIdIII')
+IMAGE = struct.Struct('<IIQdIII')
+
+
+class ManifestImage:
+    """Представление записи изображения поверх mmap (без копирования в кучу)."""
+
+    __slots__ = ('_manifest', '_offset')
+
+    def __init__(self, manifest: 'GalleryManifest', offset: int):
+        self._manifest = manifest
+        self._offset = offset
+
+    def _record(self) -> Tuple:
+        return IMAGE.unpack_from(self._manifest._buffer, self._offset)
+
+    @property
+    def path(self) -> str:
+        path_off, path_len = self._record()[:2]
+        return self._manifest._string(path_off, path_len)
+
+    @property
+    def size(self) -> int:
+        return self._record()[2]
+
+    @property
+    def mtime(self) -> float:
+        return self._record()[3]
+
+    @property
+    def width(self) -> int:
+        return self._record()[4]
+
+    @property
+    def height(self) -> int:
+        return self._record()[5]
+
+    @property
+    def derivatives(self) -> Tuple[int, ...]:
+        """Ширины существующих производных изображений."""
+        return widths_from_mask(self._record()[6])
+
+    @property
+    def variants(self) -> Tuple[int, ...]:
+        """Высоты существующих мобильных вариантов видео."""
+        return variants_from_mask(self._record()[6])
+
+
+class ManifestImages(Sequence):
+    """Последовательность путей изображений альбома (пути декодируются по требованию)."""
+
+    __slots__ = ('_manifest', '_first', '_count')
+
+    def __init__(self, manifest: 'GalleryManifest', first: int, count: int):
+        self._manifest = manifest
+        self._first = first
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._manifest.image(self._first + index).path
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[ManifestImage]:
+        """Итерирует записи изображений с размером, mtime, размерами кадра и производными."""
+        start, stop, _ = slice(start, stop).indices(self._count)
+        for i in range(self._first + start, self._first + stop):
+            yield self._manifest.image(i)
+
+
+class ManifestAlbum:
+    """Представление записи альбома поверх mmap."""
+
+    __slots__ = ('_manifest', '_offset')
+
+    def __init__(self, manifest: 'GalleryManifest', offset: int):
+        self._manifest = manifest
+        self._offset = offset
+
+    def _record(self) -> Tuple:
+        return ALBUM.unpack_from(self._manifest._buffer, self._offset)
+
+    @property
+    def name(self) -> str:
+        name_off, name_len = self._record()[:2]
+        return self._manifest._string(name_off, name_len)
+
+    @property
+    def normalized_name(self) -> str:
+        norm_off, norm_len = self._record()[2:4]
+        return self._manifest._string(norm_off, norm_len)
+
+    @property
+    def mtime(self) -> float:
+        return self._record()[4]
+
+    @property
+    def images(self) -> ManifestImages:
+        first, count = self._record()[5:7]
+        return ManifestImages(self._manifest, first, count)
+
+    @property
+    def cover_record(self) -> Optional[ManifestImage]:
+        first, count, cover = self._record()[5:8]
+        if cover == NO_COVER or cover >= count:
+            return None
+        return self._manifest.image(first + cover)
+
+    @property
+    def cover_image(self) -> Optional[str]:
+        record = self.cover_record
+        return record.path if record is not None else None
+
+
+class GalleryManifest:
+    """Манифест галереи, открытый только для чтения через mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        (magic, version, _flags, self.generation, self.root_mtime,
+         self.album_count, self.image_count, strings_size) = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported gallery manifest format: {path}")
+
+        self._albums_offset = HEADER.size
+        self._images_offset = self._albums_offset + ALBUM.size * self.album_count
+        self._strings_offset = self._images_offset + IMAGE.size * self.image_count
+        if self._strings_offset + strings_size > len(self._buffer):
+            self.close()
+            raise ValueError(f"Truncated gallery manifest: {path}")
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings_offset + offset
+        return str(self._buffer[start:start + length], 'utf-8')
+
+    def album(self, index: int) -> ManifestAlbum:
+        return ManifestAlbum(self, self._albums_offset + ALBUM.size * index)
+
+    def image(self, index: int) -> ManifestImage:
+        return ManifestImage(self, self._images_offset + IMAGE.size * index)
+
+    def albums(self) -> List[ManifestAlbum]:
+        """Возвращает все альбомы манифеста, включая пустые директории."""
+        return [self.album(i) for i in range(self.album_count)]
+
+    def dir_mtimes(self) -> Dict[str, float]:
+        """Возвращает mtime директорий альбомов, зафиксированные при записи."""
+        return {album.normalized_name: album.mtime for album in self.albums()}
+
+    def is_current_file(self) -> bool:
+        """Проверяет, что файл манифеста на диске не был заменен после открытия."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) == (self._stat.st_ino, self._stat.st_mtime_ns)
+
+    def close(self):
+        try:
+            self._buffer.release()
+            self._mmap.close()
+        except (BufferError, ValueError):
+            # На буфер еще ссылаются представления; mmap закроется сборщиком мусора
+            pass
+
+
+def derivatives_mask(widths: Iterable[int]) -> int:
+    """Кодирует ширины производных в битовую маску."""
+    return sum(1 << index for index, width in enumerate(DERIVATIVE_WIDTHS) if width in widths)
+
+
+def widths_from_mask(mask: int) -> Tuple[int, ...]:
+    """Декодирует битовую маску в ширины производных."""
+    return tuple(width for index, width in enumerate(DERIVATIVE_WIDTHS) if mask & (1 << index))
+
+
+def variants_mask(heights: Iterable[int]) -> int:
+    """Кодирует высоты видеовариантов в старшие биты маски."""
+    return sum(1 << (VARIANT_SHIFT + index)
+               for index, height in enumerate(VIDEO_VARIANT_HEIGHTS) if height in heights)
+
+
+def variants_from_mask(mask: int) -> Tuple[int, ...]:
+    """Декодирует высоты видеовариантов из маски."""
+    return tuple(height for index, height in enumerate(VIDEO_VARIANT_HEIGHTS)
+                 if mask & (1 << (VARIANT_SHIFT + index)))
+
+
+def read_image_dimensions(path: str) -> Tuple[int, int]:
+    """Читает размеры изображения только из заголовка файла."""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return 0, 0
+
+
+def stored_dimensions(dimensions: Optional[Dict[str, Tuple[int, int, int]]], url_path: str,
+                      size: int) -> Optional[Tuple[int, int]]:
+    """Размеры кадра из базы данных, если файл с тех пор не менялся (совпадает размер)."""
+    stored = dimensions.get(url_path) if dimensions else None
+    if stored is None or stored[0] != size:
+        return None
+    return stored[1], stored[2]
+
+
+def write_manifest(path: str, albums: Iterable[Dict], root_mtime: Optional[float],
+                   generation: int = 0, previous: Optional[GalleryManifest] = None,
+                   dimensions: Optional[Dict[str, Tuple[int, int, int]]] = None) -> int:
+    """
+    Атомарно записывает манифест галереи.
+
+    Args:
+        path: Путь к файлу манифеста
+        albums: Альбомы в порядке отображения; каждый словарь содержит name,
+                normalized_name, mtime, cover_index и files - список кортежей
+                (url_path, disk_path, size, mtime[, ширины производных[, высоты
+                видеовариантов]])
+        root_mtime: mtime корневой директории галереи
+        generation: Номер поколения манифеста
+        previous: Предыдущий манифест для повторного использования размеров кадра
+        dimensions: Размеры кадра, записанные при обработке: {url_path: (размер
+                    файла, ширина, высота)}; используются, пока размер файла
+                    совпадает, и избавляют от чтения заголовков новых файлов
+
+    Returns:
+        Размер записанного файла в байтах
+    """
+    log_function_call(processing_logger, 'write_manifest', path=path, generation=generation)
+
+    known = {}
+    if previous is not None:
+        for index in range(previous.image_count):
+            record = previous.image(index)
+            known[(record.path, record.size, record.mtime)] = (record.width, record.height)
+
+    strings = bytearray()
+    string_offsets = {}
+
+    def add_string(value: str) -> Tuple[int, int]:
+        if value not in string_offsets:
+            encoded = value.encode('utf-8')
+            string_offsets[value] = (len(strings), len(encoded))
+            strings.extend(encoded)
+        return string_offsets[value]
+
+    album_records = bytearray()
+    image_records = bytearray()
+    image_count = 0
+    album_count = 0
+
+    for album in albums:
+        files = album['files']
+        name_off, name_len = add_string(album['name'])
+        norm_off, norm_len = add_string(album['normalized_name'])
+        cover = album.get('cover_index')
+        album_records += ALBUM.pack(name_off, name_len, norm_off, norm_len, album['mtime'],
+                                    image_count, len(files), NO_COVER if cover is None else cover)
+        album_count += 1
+
+        for item in files:
+            url_path, disk_path, size, mtime = item[:4]
+            mask = derivatives_mask(item[4]) if len(item) > 4 else 0
+            if len(item) > 5:
+                mask |= variants_mask(item[5])
+            width, height = (known.get((url_path, size, mtime)) or stored_dimensions(dimensions, url_path, size)
+                             or read_image_dimensions(disk_path))
+            path_off, path_len = add_string(url_path)
+            image_records += IMAGE.pack(path_off, path_len, size, mtime, width, height, mask)
+            image_count += 1
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, generation, root_mtime or 0.0,
+                         album_count, image_count, len(strings))
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.gallery_manifest.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(album_records)
+            f.write(image_records)
+            f.write(strings)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        log_exception(processing_logger, e, f'writing gallery manifest {path}')
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    size = len(header) + len(album_records) + len(image_records) + len(strings)
+    processing_logger.info(f"Gallery manifest written: {path} ({album_count} albums, "
+                           f"{image_count} images, {size} bytes, generation {generation})")
+    return size
+
+
+def open_manifest(path: str) -> Optional[GalleryManifest]:
+    """Открывает манифест, если он существует и корректен, иначе возвращает None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return GalleryManifest(path)
+    except (OSError, ValueError, struct.error) as e:
+        log_exception(processing_logger, e, f'opening gallery manifest {path}')
+        return None
@@ -0,0 +1,86 @@
+"""
+Валидаторы HTTP-кеша для приложения Třešinky Cetechovice.
+Вычисляет версию шаблонов и статических ресурсов, из которой строятся
+ETag и Last-Modified страниц для условных GET-запросов.
+"""
+
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .logger import app_logger, log_function_call, log_exception
+
+
+class AssetVersion:
+    """Хеш содержимого шаблонов и ресурсов; вычисляется один раз за процесс."""
+
+    def __init__(self, paths: Iterable[str]):
+        """
+        Инициализация версии ресурсов.
+
+        Args:
+            paths: Файлы и директории, от содержимого которых зависит HTML страниц
+        """
+        self.paths = [Path(path) for path in paths]
+        self._lock = threading.Lock()
+        self._digest: Optional[str] = None
+        self._last_modified: Optional[float] = None
+
+    @property
+    def digest(self) -> str:
+        """Короткий хеш содержимого всех отслеживаемых файлов."""
+        self._ensure()
+        return self._digest
+
+    @property
+    def last_modified(self) -> float:
+        """Наибольший mtime среди отслеживаемых файлов."""
+        self._ensure()
+        return self._last_modified
+
+    def reset(self):
+        """Сбрасывает версию; она будет пересчитана при следующем обращении."""
+        self._digest = None
+
+    def _ensure(self):
+        if self._digest is not None:
+            return
+        with self._lock:
+            if self._digest is None:
+                self._compute()
+
+    def _compute(self):
+        log_function_call(app_logger, 'AssetVersion._compute')
+
+        sha = hashlib.sha1()
+        last_modified = 0.0
+        for path in self.paths:
+            if path.is_dir():
+                files = sorted(file for file in path.rglob('*') if file.is_file())
+            elif path.is_file():
+                files = [path]
+            else:
+                continue
+
+            for file in files:
+                try:
+                    # Хешируем содержимое, а не mtime: одинаковая сборка дает
+                    # одинаковые ETag даже после повторного деплоя
+                    sha.update(str(file).encode('utf-8'))
+                    sha.update(file.read_bytes())
+                    last_modified = max(last_modified, file.stat().st_mtime)
+                except OSError as e:
+                    log_exception(app_logger, e, f'hashing asset {file}')
+
+        self._last_modified = last_modified
+        self._digest = sha.hexdigest()[:12]
+        app_logger.info(f"Asset version computed: {self._digest}")
+
+
+def http_datetime(timestamp: Optional[float]) -> Optional[datetime]:
+    """Переводит timestamp в datetime UTC с точностью до секунды (как в HTTP-дате)."""
+    if not timestamp:
+        return None
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
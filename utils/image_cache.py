@@ -0,0 +1,150 @@
+"""
+Дисковый кеш изображений, уменьшаемых по запросу, для приложения Třešinky Cetechovice.
+Хранит варианты /img/<ширина>/<путь> в одной директории с общим бюджетом
+байтов и вытесняет давно не запрашивавшиеся (LRU по mtime, который
+обновляется при каждом попадании). Одновременные запросы одного варианта -
+из потоков или разных воркеров gunicorn - ждут на lock-файле, и вариант
+создается один раз.
+"""
+
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Callable, Optional
+
+from .logger import processing_logger, log_function_call, log_exception
+
+# Суффиксы служебных файлов, которые не считаются в бюджете
+LOCK_SUFFIX = '.lock'
+TMP_PREFIX = '.tmp.'
+
+
+class ResizeCache:
+    """Кеш вариантов изображений на диске с бюджетом байтов и LRU-вытеснением."""
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        Инициализация кеша.
+
+        Args:
+            root: Директория кеша (создается при первой записи)
+            max_bytes: Бюджет суммарного размера вариантов в байтах
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Оценка занятого места процессом; None - еще не считали (другие
+        # воркеры тоже пишут, поэтому перед вытеснением размер пересчитывается)
+        self._size: Optional[int] = None
+
+    def path_for(self, key: str, width: int, suffix: str = '.webp') -> str:
+        """Путь варианта: <корень>/<2 символа хэша>/<хэш>-<ширина>w<суффикс>."""
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], f'{digest}-{width}w{suffix}')
+
+    def get(self, key: str, width: int, render: Callable[[str], None], suffix: str = '.webp') -> str:
+        """
+        Возвращает путь варианта, создавая его при промахе.
+
+        Args:
+            key: Ключ исходника (должен меняться вместе с исходным файлом)
+            width: Ширина варианта
+            render: Функция, записывающая вариант в переданный временный путь
+            suffix: Расширение файла варианта
+
+        Returns:
+            Путь к файлу варианта
+        """
+        path = self.path_for(key, width, suffix)
+        if self._touch(path):
+            return path
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        lock_path = path + LOCK_SUFFIX
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Вариант мог появиться, пока мы ждали блокировку
+                if self._touch(path):
+                    return path
+                log_function_call(processing_logger, 'ResizeCache.render', key=key, width=width)
+                fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, suffix=suffix, dir=directory)
+                os.close(fd)
+                try:
+                    render(tmp_path)
+                    os.replace(tmp_path, path)
+                except Exception:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                    raise
+                # Ожидающие откроют уже удаленный lock-файл и найдут готовый вариант
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self._added(os.path.getsize(path))
+        return path
+
+    def evict(self) -> int:
+        """
+        Удаляет самые давно запрошенные варианты, пока кеш не уложится в бюджет.
+
+        Returns:
+            Число удаленных файлов
+        """
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(LOCK_SUFFIX) or name.startswith(TMP_PREFIX):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log_exception(processing_logger, e, f'evicting cached image {path}')
+                continue
+            total -= size
+            removed += 1
+
+        with self._lock:
+            self._size = total
+        if removed:
+            processing_logger.info(f"Image cache evicted {removed} files ({total}/{self.max_bytes} bytes kept)")
+        return removed
+
+    def _touch(self, path: str) -> bool:
+        """Отмечает попадание (mtime - время последнего запроса); False, если варианта нет."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _added(self, size: int):
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            over_budget = self._size is None or self._size > self.max_bytes
+        if over_budget:
+            self.evict()
@@ -0,0 +1,532 @@
+"""
+Обработка изображений для приложения Třešinky Cetechovice.
+Декодирует изображение один раз в процессе (Pillow), поворачивает по EXIF,
+уменьшает под профиль размера и кодирует в WebP. Заменяет цепочку
+scripts/process_image.sh (identify + convert + heif-convert).
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from PIL import ExifTags, Image, ImageOps
+
+from .logger import processing_logger, log_function_call, log_exception, log_file_operation
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:  # pillow-heif - необязательная зависимость
+    HEIF_SUPPORTED = False
+
+try:
+    import pillow_avif  # noqa: F401  (регистрирует кодек AVIF в Pillow)
+except ImportError:  # pillow-avif-plugin - необязательная зависимость (Pillow >= 11.3 умеет AVIF сам)
+    pass
+Image.init()
+AVIF_SUPPORTED = 'AVIF' in Image.SAVE
+
+
+# Профили размеров (ширина, высота) - те же, что в scripts/process_image.sh
+PROFILES: Dict[str, Tuple[int, int]] = {
+    'gallery': (1200, 800),
+    'hero': (1920, 1080),
+    'thumbnail': (400, 300),
+}
+
+WEBP_QUALITY = 85
+# Качество AVIF, визуально сравнимое с WebP 85 при меньшем размере файла
+AVIF_QUALITY = 60
+AVIF_SPEED = 6
+
+# Размытый плейсхолдер: крошечный WebP в data URI (~200 байт), растянутый в CSS
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+
+# Лестница ширин производных изображений для srcset (по возрастанию)
+DERIVATIVE_WIDTHS: Tuple[int, ...] = (320, 640, 1200, 1920)
+
+HEIF_EXTENSIONS = {'.heic', '.heif'}
+
+# Теги EXIF, по которым определяется дата съемки (в порядке приоритета)
+DATE_TAGS = ('DateTimeOriginal', 'DateTimeDigitized', 'DateTime')
+
+# Текстовые теги EXIF, сохраняемые в метаданных: тег -> поле
+TEXT_TAGS = {'Make': 'camera_make', 'Model': 'camera_model', 'LensModel': 'lens_model'}
+# Числовые теги EXIF: тег -> (поле, тип)
+NUMBER_TAGS = {'ExposureTime': ('exposure_time', float), 'FNumber': ('f_number', float),
+               'ISOSpeedRatings': ('iso', int), 'FocalLength': ('focal_length', float)}
+
+
+class ImageProcessingError(Exception):
+    """Ошибка декодирования или кодирования изображения."""
+
+
+class ProcessedImage(NamedTuple):
+    """Результат обработки изображения."""
+    path: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    taken_at: Optional[datetime]
+    exif: Dict[str, object]
+    derivatives: Tuple[int, ...] = ()
+    placeholder: Optional[str] = None
+    metadata: Optional[Dict[str, object]] = None
+
+
+def derivative_filename(filename: str, width: int) -> str:
+    """Имя производного файла: <имя без расширения>-<ширина>w.webp."""
+    return f"{os.path.splitext(os.path.basename(filename))[0]}-{width}w.webp"
+
+
+def avif_filename(filename: str, width: Optional[int] = None) -> str:
+    """Имя AVIF-версии: <имя>.avif для основного файла, <имя>-<ширина>w.avif для производной."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return f"{stem}-{width}w.avif" if width else f"{stem}.avif"
+
+
+def derivative_widths_for(width: int, widths: Iterable[int] = DERIVATIVE_WIDTHS) -> Tuple[int, ...]:
+    """Ширины лестницы, которые можно получить из кадра шириной width без увеличения."""
+    return tuple(w for w in widths if w <= width)
+
+
+def output_spec_hash(profile: str = 'gallery', avif: bool = False) -> str:
+    """
+    Хэш параметров результата обработки (размер, качество, лестница, форматы).
+
+    Изменение любой константы меняет хэш, и `flask gallery rebuild` заново
+    выводит результаты, записанные с прежним хэшем.
+
+    Args:
+        profile: Имя профиля размера
+        avif: Записываются ли AVIF-версии
+
+    Returns:
+        16 шестнадцатеричных символов SHA-256
+    """
+    spec = {'profile': PROFILES[profile], 'webp_quality': WEBP_QUALITY,
+            'derivatives': DERIVATIVE_WIDTHS, 'placeholder': (PLACEHOLDER_WIDTH, PLACEHOLDER_QUALITY)}
+    if avif:
+        spec['avif'] = (AVIF_QUALITY, AVIF_SPEED)
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def can_process(path: str) -> bool:
+    """Проверяет, может ли Pillow декодировать файл с таким расширением."""
+    ext = os.path.splitext(path)[1].lower()
+    return HEIF_SUPPORTED or ext not in HEIF_EXTENSIONS
+
+
+def target_size(width: int, height: int, profile: str) -> Tuple[int, int]:
+    """
+    Вычисляет размер результата для профиля с сохранением пропорций.
+
+    Как и в process_image.sh, альбомные кадры приводятся к ширине профиля,
+    а портретные - к высоте. Изображения меньше профиля не увеличиваются.
+
+    Args:
+        width: Ширина кадра после поворота по EXIF
+        height: Высота кадра после поворота по EXIF
+        profile: Имя профиля (gallery, hero, thumbnail)
+
+    Returns:
+        (ширина, высота) результата
+    """
+    max_width, max_height = PROFILES[profile]
+    if width > height:
+        new_width = min(width, max_width)
+        new_height = max(1, new_width * height // width)
+    else:
+        new_height = min(height, max_height)
+        new_width = max(1, new_height * width // height)
+    return new_width, new_height
+
+
+def read_exif(img: Image.Image) -> Dict[str, object]:
+    """Читает EXIF (включая Exif IFD) с именами тегов вместо числовых кодов."""
+    exif = img.getexif()
+    tags = {}
+    for ifd in (exif, exif.get_ifd(ExifTags.IFD.Exif)):
+        for tag_id, value in ifd.items():
+            if isinstance(value, bytes):
+                continue
+            tags[ExifTags.TAGS.get(tag_id, str(tag_id))] = value
+    return tags
+
+
+def exif_date(tags: Dict[str, object]) -> Optional[datetime]:
+    """Возвращает дату съемки из EXIF или None."""
+    for tag in DATE_TAGS:
+        value = tags.get(tag)
+        if not value:
+            continue
+        try:
+            return datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S')
+        except ValueError:
+            continue
+    return None
+
+
+def read_metadata(img: Image.Image, tags: Optional[Dict[str, object]] = None) -> Dict[str, object]:
+    """
+    Собирает метаданные изображения из уже открытого файла (без декодирования пикселей).
+
+    Args:
+        img: Открытое изображение
+        tags: Результат read_exif(img), если он уже прочитан
+
+    Returns:
+        Словарь: дата съемки, камера, объектив, ориентация, экспозиция,
+        координаты GPS и размеры оригинала после поворота; отсутствующие
+        значения - None
+    """
+    exif = img.getexif()
+    tags = read_exif(img) if tags is None else tags
+    orientation = exif.get(ExifTags.Base.Orientation, 1)
+    width, height = img.size
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+
+    metadata: Dict[str, object] = {'taken_at': exif_date(tags), 'orientation': orientation,
+                                   'original_width': width, 'original_height': height}
+    for tag, field in TEXT_TAGS.items():
+        value = str(tags.get(tag) or '').strip('\x00 ')
+        metadata[field] = value[:100] or None
+    for tag, (field, kind) in NUMBER_TAGS.items():
+        value = tags.get(tag)
+        if isinstance(value, tuple):
+            value = value[0] if value else None
+        try:
+            metadata[field] = kind(value) if value is not None else None
+        except (TypeError, ValueError, ZeroDivisionError):
+            metadata[field] = None
+    metadata.update(_gps_position(exif.get_ifd(ExifTags.IFD.GPSInfo)))
+    return metadata
+
+
+def metadata_from_file(path: str) -> Dict[str, object]:
+    """
+    Читает метаданные из заголовка файла (для файлов, обработанных до появления
+    таблицы метаданных).
+
+    Raises:
+        ImageProcessingError: Если файл не удалось открыть
+    """
+    try:
+        with Image.open(path) as img:
+            return read_metadata(img)
+    except Exception as e:
+        raise ImageProcessingError(f"Failed to read metadata of {os.path.basename(path)}: {e}") from e
+
+
+def process_image(input_path: str, output_path: str, profile: str = 'gallery',
+                  derivatives_dir: Optional[str] = None) -> ProcessedImage:
+    """
+    Обрабатывает изображение за один проход декодирования.
+
+    Для больших JPEG используется draft-режим: декодер сразу уменьшает кадр
+    в 2/4/8 раз, не распаковывая полное разрешение. Если задан derivatives_dir,
+    из того же декодированного кадра записывается лестница производных
+    DERIVATIVE_WIDTHS (без увеличения).
+
+    Args:
+        input_path: Путь к исходному файлу
+        output_path: Путь к результату в формате WebP
+        profile: Имя профиля размера
+        derivatives_dir: Директория для производных изображений (None - не создавать)
+
+    Returns:
+        ProcessedImage с размерами результата и оригинала, данными EXIF,
+        метаданными (read_metadata) и ширинами записанных производных
+
+    Raises:
+        ImageProcessingError: Если файл не удалось декодировать или записать
+    """
+    log_function_call(processing_logger, 'process_image', input_path=input_path, profile=profile)
+
+    if profile not in PROFILES:
+        raise ImageProcessingError(f"Invalid profile: {profile}")
+    if not can_process(input_path):
+        raise ImageProcessingError(f"HEIC support is not installed: {input_path}")
+
+    try:
+        with Image.open(input_path) as img:
+            tags = read_exif(img)
+            metadata = read_metadata(img, tags)
+            original_width, original_height = img.size
+
+            # Ориентации 5-8 меняют местами ширину и высоту
+            orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+            transposed = orientation in (5, 6, 7, 8)
+            if transposed:
+                original_width, original_height = original_height, original_width
+
+            width, height = target_size(original_width, original_height, profile)
+            ladder = derivative_widths_for(original_width) if derivatives_dir else ()
+
+            # Декодируем не меньше, чем нужно самому большому результату
+            decode_width = max((width,) + ladder)
+            decode_height = max(height, decode_width * original_height // original_width)
+            img.draft('RGB', (decode_height, decode_width) if transposed else (decode_width, decode_height))
+
+            frame = _prepare_frame(img)
+            placeholder = make_placeholder(frame)
+
+            if ladder:
+                ladder = write_derivatives(frame, derivatives_dir, output_path, ladder)
+            if frame.size != (width, height):
+                frame = frame.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+            _save_webp(frame, output_path)
+    except ImageProcessingError:
+        raise
+    except Exception as e:
+        log_exception(processing_logger, e, f'processing image {input_path}')
+        raise ImageProcessingError(f"Failed to process {os.path.basename(input_path)}: {e}") from e
+
+    log_file_operation(processing_logger, 'process', output_path, 'success',
+                       f'{original_width}x{original_height} -> {width}x{height} ({profile})')
+    return ProcessedImage(output_path, width, height, original_width, original_height,
+                          metadata['taken_at'], tags, ladder, placeholder, metadata)
+
+
+def make_placeholder(frame: Image.Image) -> str:
+    """
+    Кодирует уже декодированный кадр в крошечный WebP для размытого плейсхолдера.
+
+    Returns:
+        data URI (data:image/webp;base64,...)
+    """
+    height = max(1, round(PLACEHOLDER_WIDTH * frame.height / frame.width))
+    small = frame.resize((PLACEHOLDER_WIDTH, height), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    if small.mode != 'RGB':
+        small = small.convert('RGB')
+    buffer = io.BytesIO()
+    small.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY, method=6)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def placeholder_from_file(path: str) -> str:
+    """
+    Плейсхолдер для уже обработанного изображения (дозаполнение архива).
+
+    Raises:
+        ImageProcessingError: Если файл не удалось декодировать
+    """
+    try:
+        with Image.open(path) as img:
+            img.draft('RGB', (PLACEHOLDER_WIDTH * 8, PLACEHOLDER_WIDTH * 8))
+            return make_placeholder(_prepare_frame(img))
+    except Exception as e:
+        log_exception(processing_logger, e, f'making placeholder for {path}')
+        raise ImageProcessingError(f"Failed to make placeholder for {os.path.basename(path)}: {e}") from e
+
+
+def write_derivatives(frame: Image.Image, derivatives_dir: str, filename: str,
+                      widths: Iterable[int]) -> Tuple[int, ...]:
+    """
+    Записывает производные изображения из уже декодированного кадра.
+
+    Кадры уменьшаются последовательно от большей ширины к меньшей, поэтому
+    каждый шаг обрабатывает уже уменьшенное изображение.
+
+    Args:
+        frame: Декодированный и повернутый по EXIF кадр
+        derivatives_dir: Директория для производных
+        filename: Имя основного файла (определяет имена производных)
+        widths: Ширины производных (не больше ширины кадра)
+
+    Returns:
+        Записанные ширины по возрастанию
+    """
+    written = []
+    current = frame
+    for width in sorted(widths, reverse=True):
+        height = max(1, round(width * frame.height / frame.width))
+        if current.size != (width, height):
+            current = current.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        _save_webp(current, os.path.join(derivatives_dir, derivative_filename(filename, width)))
+        written.append(width)
+    processing_logger.info(f"Derivatives written for {os.path.basename(filename)}: {sorted(written)}")
+    return tuple(sorted(written))
+
+
+def generate_derivatives(input_path: str, derivatives_dir: str,
+                         widths: Iterable[int] = DERIVATIVE_WIDTHS) -> Tuple[int, ...]:
+    """
+    Создает производные для уже обработанного изображения галереи.
+
+    Args:
+        input_path: Путь к изображению галереи
+        derivatives_dir: Директория для производных
+        widths: Ширины лестницы
+
+    Returns:
+        Записанные ширины (только меньше ширины изображения: само изображение
+        служит самым широким вариантом srcset)
+
+    Raises:
+        ImageProcessingError: Если файл не удалось декодировать или записать
+    """
+    log_function_call(processing_logger, 'generate_derivatives', input_path=input_path)
+    try:
+        with Image.open(input_path) as img:
+            frame = _prepare_frame(img)
+            ladder = tuple(width for width in derivative_widths_for(frame.width, widths)
+                           if width < frame.width)
+            return write_derivatives(frame, derivatives_dir, input_path, ladder) if ladder else ()
+    except Exception as e:
+        log_exception(processing_logger, e, f'generating derivatives for {input_path}')
+        raise ImageProcessingError(f"Failed to generate derivatives for {os.path.basename(input_path)}: {e}") from e
+
+
+def resize_image(input_path: str, output_path: str, width: int) -> Tuple[int, int]:
+    """
+    Записывает WebP заданной ширины (без увеличения) для эндпоинта /img.
+
+    Для JPEG используется draft-режим, как в process_image.
+
+    Args:
+        input_path: Оригинал или самое большое сохраненное изображение
+        output_path: Путь к результату
+        width: Требуемая ширина
+
+    Returns:
+        Размеры записанного изображения
+
+    Raises:
+        ImageProcessingError: Если файл не удалось декодировать или записать
+    """
+    log_function_call(processing_logger, 'resize_image', input_path=input_path, width=width)
+    try:
+        with Image.open(input_path) as img:
+            orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+            transposed = orientation in (5, 6, 7, 8)
+            source_width, source_height = (img.height, img.width) if transposed else img.size
+            width = min(width, source_width)
+            height = max(1, round(source_height * width / source_width))
+            img.draft('RGB', (height, width) if transposed else (width, height))
+            frame = _prepare_frame(img)
+            if frame.size != (width, height):
+                frame = frame.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            _save_webp(frame, output_path)
+            return width, height
+    except Exception as e:
+        log_exception(processing_logger, e, f'resizing {input_path} to {width}px')
+        raise ImageProcessingError(f"Failed to resize {os.path.basename(input_path)}: {e}") from e
+
+
+def write_avif_versions(input_path: str, derivatives_dir: str, filename: str,
+                        main_size: Tuple[int, int], widths: Iterable[int]) -> Tuple[int, ...]:
+    """
+    Кодирует AVIF-версии основного изображения галереи и его производных
+    за одно декодирование (рядом с производными WebP).
+
+    Args:
+        input_path: Источник - загруженный оригинал или самый большой WebP
+        derivatives_dir: Директория производных альбома
+        filename: Имя основного файла галереи (определяет имена AVIF)
+        main_size: (ширина, высота) основного WebP
+        widths: Ширины существующих производных WebP
+
+    Returns:
+        Ширины записанных AVIF-производных по возрастанию
+
+    Raises:
+        ImageProcessingError: AVIF не поддерживается или файл не удалось обработать
+    """
+    log_function_call(processing_logger, 'write_avif_versions', input_path=input_path)
+    if not AVIF_SUPPORTED:
+        raise ImageProcessingError('AVIF support is not installed')
+
+    widths = tuple(sorted(widths))
+    try:
+        with Image.open(input_path) as img:
+            orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+            transposed = orientation in (5, 6, 7, 8)
+            source_width, source_height = img.size[::-1] if transposed else img.size
+
+            decode_width = max((main_size[0],) + widths)
+            decode_height = max(1, decode_width * source_height // source_width)
+            img.draft('RGB', (decode_height, decode_width) if transposed else (decode_width, decode_height))
+            frame = _prepare_frame(img)
+
+            # (ширина, высота, имя) от большего к меньшему: каждый шаг уменьшает предыдущий кадр
+            targets = [(main_size[0], main_size[1], avif_filename(filename))]
+            targets += [(width, max(1, round(width * frame.height / frame.width)), avif_filename(filename, width))
+                        for width in widths]
+            current = frame
+            for width, height, name in sorted(targets, reverse=True):
+                if current.size != (width, height):
+                    current = current.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+                _save_image(current, os.path.join(derivatives_dir, name), 'AVIF',
+                            quality=AVIF_QUALITY, speed=AVIF_SPEED)
+    except Exception as e:
+        log_exception(processing_logger, e, f'writing AVIF versions of {filename}')
+        raise ImageProcessingError(f"Failed to write AVIF for {os.path.basename(filename)}: {e}") from e
+
+    processing_logger.info(f"AVIF versions written for {os.path.basename(filename)}: {list(widths)}")
+    return widths
+
+
+def _gps_position(gps: Dict[int, object]) -> Dict[str, Optional[float]]:
+    """Координаты из GPS IFD в десятичных градусах (юг и запад - отрицательные)."""
+    def degrees(value, ref, negative):
+        try:
+            result = float(value[0]) + float(value[1]) / 60 + float(value[2]) / 3600
+        except (TypeError, ValueError, IndexError, ZeroDivisionError):
+            return None
+        return -result if str(ref).strip('\x00 ').upper() == negative else result
+
+    position = {'gps_latitude': None, 'gps_longitude': None, 'gps_altitude': None}
+    if gps.get(2) is not None:
+        position['gps_latitude'] = degrees(gps[2], gps.get(1), 'S')
+    if gps.get(4) is not None:
+        position['gps_longitude'] = degrees(gps[4], gps.get(3), 'W')
+    if gps.get(6) is not None:
+        try:
+            # GPSAltitudeRef 1 - ниже уровня моря
+            altitude = float(gps[6])
+            position['gps_altitude'] = -altitude if gps.get(5) in (1, b'\x01') else altitude
+        except (TypeError, ValueError, ZeroDivisionError):
+            pass
+    return position
+
+
+def _prepare_frame(img: Image.Image) -> Image.Image:
+    """Поворачивает кадр по EXIF и приводит его к RGB/RGBA."""
+    frame = ImageOps.exif_transpose(img)
+    if frame.mode not in ('RGB', 'RGBA'):
+        has_alpha = frame.mode in ('LA', 'PA') or 'transparency' in frame.info
+        frame = frame.convert('RGBA' if has_alpha else 'RGB')
+    return frame
+
+
+def _save_webp(frame: Image.Image, output_path: str):
+    """Атомарно записывает WebP (результат может заменять исходный файл)."""
+    _save_image(frame, output_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+
+
+def _save_image(frame: Image.Image, output_path: str, fmt: str, **options):
+    """Атомарно записывает кадр в формате fmt через временный файл в той же директории."""
+    directory = os.path.dirname(output_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.processing.', suffix=os.path.splitext(output_path)[1], dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            frame.save(f, fmt, **options)
+        os.replace(tmp_path, output_path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,42 @@
+"""
+Метаданные файлов галереи для приложения Třešinky Cetechovice.
+Новые загрузки получают метаданные из того же прохода декодирования
+(image_processor.process_image, video_processor.probe_video); здесь -
+чтение метаданных уже сохраненных файлов для заполнения архива в пуле
+процессов (функции уровня модуля, передаются в процесс через pickle).
+"""
+
+import os
+from typing import Dict, Optional
+
+from .logger import processing_logger
+from . import image_processor
+from . import video_processor
+
+
+def video_metadata(info: video_processor.VideoInfo) -> Dict[str, object]:
+    """Метаданные видео из результата ffprobe (камера и GPS видео не читаются)."""
+    return {'taken_at': info.taken_at, 'original_width': info.width or None,
+            'original_height': info.height or None, 'duration': info.duration or None}
+
+
+def extract_metadata(path: str) -> Optional[Dict[str, object]]:
+    """
+    Читает метаданные сохраненного файла галереи без декодирования пикселей.
+
+    Args:
+        path: Путь к изображению или видео
+
+    Returns:
+        Словарь метаданных или None, если файл не удалось прочитать
+        (видео без ffprobe, поврежденный файл)
+    """
+    try:
+        if path.lower().endswith('.mp4'):
+            if not video_processor.VIDEO_SUPPORTED:
+                return None
+            return video_metadata(video_processor.probe_video(path))
+        return image_processor.metadata_from_file(path)
+    except (image_processor.ImageProcessingError, video_processor.VideoProcessingError) as e:
+        processing_logger.warning(f"Cannot read metadata: {os.path.basename(path)} ({e})")
+        return None
@@ -0,0 +1,89 @@
+"""
+Кеш готовых страниц для приложения Třešinky Cetechovice.
+Хранит в памяти процесса отрендеренный HTML статических страниц вместе с
+заранее сжатыми вариантами gzip и brotli и отдает их без повторного
+рендеринга и сжатия.
+"""
+
+import gzip
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from .logger import app_logger, log_function_call
+
+try:
+    import brotli
+except ImportError:  # brotli - необязательная зависимость
+    brotli = None
+
+
+class CachedPage:
+    """Отрендеренная страница и ее предварительно сжатые варианты."""
+
+    __slots__ = ('version', 'variants')
+
+    def __init__(self, version: str, body: bytes):
+        self.version = version
+        # Ключ - значение Content-Encoding (None для несжатого тела)
+        self.variants: Dict[Optional[str], bytes] = {None: body}
+        self.variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=11)
+
+    @property
+    def encodings(self) -> list:
+        """Доступные кодировки в порядке предпочтения сервера."""
+        return [encoding for encoding in ('br', 'gzip') if encoding in self.variants]
+
+    def select(self, encoding: Optional[str]) -> Tuple[Optional[str], bytes]:
+        """
+        Возвращает вариант тела для выбранной кодировки.
+
+        Args:
+            encoding: Кодировка, выбранная по Accept-Encoding, или None
+
+        Returns:
+            (Content-Encoding или None, байты тела)
+        """
+        if encoding in self.variants:
+            return encoding, self.variants[encoding]
+        return None, self.variants[None]
+
+
+class PageCache:
+    """Кеш страниц процесса; запись заменяется при смене версии ресурсов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages: Dict[str, CachedPage] = {}
+
+    def get(self, key: str, version: str, render: Callable[[], str]) -> CachedPage:
+        """
+        Возвращает страницу из кеша, при необходимости рендерит и сжимает ее.
+
+        Args:
+            key: Ключ страницы (имя endpoint)
+            version: Версия шаблонов и ресурсов, с которой страница отрендерена
+            render: Функция рендеринга, вызываемая только при промахе
+
+        Returns:
+            Закешированная страница
+        """
+        page = self._pages.get(key)
+        if page is not None and page.version == version:
+            return page
+
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None or page.version != version:
+                log_function_call(app_logger, 'PageCache.get', key=key, version=version)
+                page = CachedPage(version, render().encode('utf-8'))
+                self._pages[key] = page
+                app_logger.info(f"Page cached: {key} ({len(page.variants[None])} bytes, "
+                                f"encodings: {', '.join(page.encodings) or 'none'})")
+        return page
+
+    def clear(self):
+        """Очищает кеш страниц."""
+        with self._lock:
+            self._pages.clear()
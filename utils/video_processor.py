@@ -0,0 +1,268 @@
+"""
+Обработка видео для приложения Třešinky Cetechovice.
+Переупаковывает MP4 с faststart (moov в начале файла, воспроизведение
+начинается до полной загрузки), извлекает кадр-постер в WebP и кодирует
+варианты с меньшим битрейтом для мобильных устройств. ffmpeg/ffprobe -
+необязательные локальные инструменты: без них видео сохраняется как есть.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from .logger import processing_logger, log_function_call, log_exception, log_file_operation
+from .image_processor import derivative_widths_for, write_derivatives
+
+FFMPEG = shutil.which('ffmpeg')
+FFPROBE = shutil.which('ffprobe')
+VIDEO_SUPPORTED = bool(FFMPEG and FFPROBE)
+
+# Лестница мобильных вариантов: (короткая сторона кадра, битрейт видео), по убыванию
+VIDEO_VARIANTS: Tuple[Tuple[int, str], ...] = ((720, '2000k'), (480, '900k'))
+VIDEO_VARIANT_HEIGHTS: Tuple[int, ...] = tuple(sorted(height for height, _ in VIDEO_VARIANTS))
+AUDIO_BITRATE = '96k'
+
+# Секунда, с которой берется постер (первый кадр часто черный)
+POSTER_OFFSET = 1.0
+
+# Таймауты ffmpeg в секундах
+REMUX_TIMEOUT = 300
+ENCODE_TIMEOUT = 3600
+
+# Теги даты записи в порядке приоритета: у iPhone дата локальная со смещением,
+# creation_time контейнера - в UTC
+DATE_TAGS = ('com.apple.quicktime.creationdate', 'creation_time')
+
+
+class VideoProcessingError(Exception):
+    """Ошибка ffmpeg/ffprobe при обработке видео."""
+
+
+class VideoInfo(NamedTuple):
+    """Параметры видео из ffprobe."""
+    width: int
+    height: int
+    duration: float
+    taken_at: Optional[datetime]
+
+
+def variant_filename(filename: str, height: int) -> str:
+    """Имя мобильного варианта: <имя без расширения>-<высота>p.mp4."""
+    return f"{os.path.splitext(os.path.basename(filename))[0]}-{height}p.mp4"
+
+
+def variant_heights_for(height: int, variants: Iterable[Tuple[int, str]] = VIDEO_VARIANTS) -> Tuple[int, ...]:
+    """Высоты вариантов, которые меньше исходного кадра (без увеличения)."""
+    return tuple(sorted(variant for variant, _ in variants if variant < height))
+
+
+def parse_creation_date(value: str) -> Optional[datetime]:
+    """
+    Разбирает дату записи из тегов контейнера в локальное время без часового пояса.
+
+    Args:
+        value: ISO 8601, например 2019-04-06T14:27:42.000000Z или 2019-04-06T16:27:42+0200
+
+    Returns:
+        Дата записи или None
+    """
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            date = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+        except ValueError:
+            return None
+    if date.year < 1971:
+        # Камеры без часов пишут нулевую дату QuickTime (1904) или эпоху
+        return None
+    if date.tzinfo is not None:
+        if date.utcoffset():
+            # Смещение записано камерой: это уже местное время съемки
+            return date.replace(tzinfo=None)
+        return date.astimezone().replace(tzinfo=None)
+    return date
+
+
+def parse_probe(data: dict) -> VideoInfo:
+    """Извлекает размеры, длительность и дату записи из JSON ffprobe."""
+    stream = next((stream for stream in data.get('streams', []) if stream.get('codec_type') == 'video'), {})
+    width, height = int(stream.get('width') or 0), int(stream.get('height') or 0)
+
+    # Повернутое видео (портрет с телефона) хранит кадр в альбомной ориентации
+    rotation = stream.get('tags', {}).get('rotate')
+    for side_data in stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+
+    fmt = data.get('format', {})
+    taken_at = None
+    for tags in (fmt.get('tags', {}), stream.get('tags', {})):
+        for tag in DATE_TAGS:
+            if tags.get(tag):
+                taken_at = parse_creation_date(tags[tag])
+                if taken_at:
+                    break
+        if taken_at:
+            break
+
+    return VideoInfo(width, height, float(fmt.get('duration') or 0), taken_at)
+
+
+def probe_video(path: str) -> VideoInfo:
+    """
+    Читает параметры видео через ffprobe.
+
+    Raises:
+        VideoProcessingError: ffprobe не установлен или файл не читается
+    """
+    log_function_call(processing_logger, 'probe_video', path=path)
+    if not FFPROBE:
+        raise VideoProcessingError('ffprobe is not installed')
+    result = _run([FFPROBE, '-v', 'error', '-print_format', 'json',
+                   '-show_format', '-show_streams', path], REMUX_TIMEOUT)
+    return parse_probe(json.loads(result.stdout or '{}'))
+
+
+def remux_faststart(input_path: str, output_path: str):
+    """
+    Переупаковывает MP4 без перекодирования, перенося moov в начало файла.
+
+    Raises:
+        VideoProcessingError: Ошибка ffmpeg
+    """
+    log_function_call(processing_logger, 'remux_faststart', input_path=input_path)
+    with _atomic_output(output_path) as tmp_path:
+        _run([FFMPEG, '-y', '-v', 'error', '-i', input_path, '-map', '0', '-c', 'copy',
+              '-movflags', '+faststart', '-f', 'mp4', tmp_path], REMUX_TIMEOUT)
+    log_file_operation(processing_logger, 'remux', output_path, 'success', 'faststart')
+
+
+def write_poster(video_path: str, derivatives_dir: str, duration: float = 0.0) -> Tuple[int, ...]:
+    """
+    Извлекает кадр-постер и записывает его лестницей WebP-производных
+    (<имя>-<ширина>w.webp), как у изображений галереи.
+
+    Args:
+        video_path: Путь к видео
+        derivatives_dir: Директория производных альбома
+        duration: Длительность видео (короткие видео берут кадр из начала)
+
+    Returns:
+        Записанные ширины постера
+    """
+    log_function_call(processing_logger, 'write_poster', video_path=video_path)
+    offset = POSTER_OFFSET if duration > POSTER_OFFSET * 2 else 0.0
+    fd, frame_path = tempfile.mkstemp(prefix='.poster.', suffix='.png')
+    os.close(fd)
+    try:
+        _run([FFMPEG, '-y', '-v', 'error', '-ss', str(offset), '-i', video_path,
+              '-frames:v', '1', '-f', 'image2', frame_path], REMUX_TIMEOUT)
+        with Image.open(frame_path) as frame:
+            frame = frame.convert('RGB')
+            ladder = derivative_widths_for(frame.width)
+            return write_derivatives(frame, derivatives_dir, video_path, ladder) if ladder else ()
+    except VideoProcessingError:
+        raise
+    except Exception as e:
+        log_exception(processing_logger, e, f'writing poster for {video_path}')
+        raise VideoProcessingError(f"Failed to write poster for {os.path.basename(video_path)}: {e}") from e
+    finally:
+        try:
+            os.remove(frame_path)
+        except OSError:
+            pass
+
+
+def encode_variant(input_path: str, output_path: str, height: int, bitrate: str,
+                   portrait: bool = False):
+    """
+    Кодирует вариант меньшего размера и битрейта (H.264/AAC, faststart).
+
+    Args:
+        input_path: Путь к исходному видео
+        output_path: Путь к варианту
+        height: Короткая сторона кадра варианта (720 - 1280x720 или 720x1280)
+        bitrate: Битрейт видео для ffmpeg
+        portrait: Кадр портретный (короткая сторона - ширина)
+
+    Raises:
+        VideoProcessingError: Ошибка ffmpeg
+    """
+    log_function_call(processing_logger, 'encode_variant', input_path=input_path, height=height)
+    scale = f'scale={height}:-2' if portrait else f'scale=-2:{height}'
+    with _atomic_output(output_path) as tmp_path:
+        _run([FFMPEG, '-y', '-v', 'error', '-i', input_path,
+              '-vf', scale, '-c:v', 'libx264', '-preset', 'veryfast',
+              '-b:v', bitrate, '-maxrate', bitrate, '-bufsize', bitrate,
+              '-c:a', 'aac', '-b:a', AUDIO_BITRATE, '-movflags', '+faststart',
+              '-threads', '2', '-f', 'mp4', tmp_path], ENCODE_TIMEOUT)
+    log_file_operation(processing_logger, 'encode', output_path, 'success', f'{height}p {bitrate}')
+
+
+def encode_variants(input_path: str, derivatives_dir: str, width: int, height: int) -> Tuple[int, ...]:
+    """
+    Кодирует все мобильные варианты меньше исходного кадра.
+
+    Args:
+        input_path: Путь к исходному видео
+        derivatives_dir: Директория производных альбома
+        width: Ширина кадра после поворота
+        height: Высота кадра после поворота
+
+    Returns:
+        Высоты (короткие стороны) записанных вариантов по возрастанию
+    """
+    heights = variant_heights_for(min(width, height))
+    for variant, bitrate in VIDEO_VARIANTS:
+        if variant in heights:
+            encode_variant(input_path, os.path.join(derivatives_dir, variant_filename(input_path, variant)),
+                           variant, bitrate, portrait=height > width)
+    return heights
+
+
+class _atomic_output:
+    """Временный файл рядом с результатом, который заменяет его только при успехе."""
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.tmp_path = None
+
+    def __enter__(self) -> str:
+        directory = os.path.dirname(self.output_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(prefix='.processing.', suffix='.mp4', dir=directory)
+        os.close(fd)
+        return self.tmp_path
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            os.replace(self.tmp_path, self.output_path)
+        else:
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+        return False
+
+
+def _run(command: list, timeout: int) -> subprocess.CompletedProcess:
+    """Запускает ffmpeg/ffprobe и переводит ошибки в VideoProcessingError."""
+    try:
+        return subprocess.run(command, check=True, capture_output=True, text=True, timeout=timeout)
+    except subprocess.CalledProcessError as e:
+        processing_logger.error(f"{os.path.basename(command[0])} failed: {e.stderr.strip()}")
+        raise VideoProcessingError(e.stderr.strip() or str(e)) from e
+    except (OSError, subprocess.TimeoutExpired) as e:
+        log_exception(processing_logger, e, f'running {os.path.basename(command[0])}')
+        raise VideoProcessingError(str(e)) from e